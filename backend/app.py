@@ -1,15 +1,37 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 import uvicorn
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
 import os
 import json
 
+from config import config
+from services.co_view_model import create_co_view_model
+from services.json_encoding import ProductJSONCache, encode
 from services.llm_service import LLMService
+from services import metrics
 from services.product_service import ProductService
+from services.search_service import FACETS, SearchService
+from services.segment_materializer import SegmentMaterializer
+from services.session_store import create_session_store
 
-app = FastAPI(title="AI Product Recommendation API")
+class FastJSONResponse(Response):
+    """
+    JSON response encoded with orjson (when installed) that splices in pre-encoded product JSON
+
+    Endpoints returning product lists build one of these directly, which
+    also skips FastAPI's response_model validation of every product.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return encode(content)
+
+app = FastAPI(title="AI Product Recommendation API", default_response_class=FastJSONResponse)
 
 # Enable CORS
 app.add_middleware(
@@ -20,23 +42,200 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Time every request for /metrics
+if config['METRICS_ENABLED']:
+    app.add_middleware(metrics.PrometheusMiddleware, routes=lambda: app.routes)
+
 # Initialize services
 product_service = ProductService()
-llm_service = LLMService()
+search_service = SearchService(product_service)
+product_json = ProductJSONCache(config['PRODUCT_JSON_CACHE_SIZE'])
+co_view_model = create_co_view_model(config)
+llm_service = LLMService(product_service, search_service, co_view_model)
+segments = SegmentMaterializer(llm_service, product_service, config) if config['SEGMENTS_ENABLED'] else None
+
+# Per-user preferences and browsing history
+session_store = create_session_store(config)
+
+async def session_call(method, *args):
+    """Call a session store method, on the store's own thread if it does blocking I/O"""
+    if session_store.executor is None:
+        return method(*args)
+    return await asyncio.get_running_loop().run_in_executor(session_store.executor, method, *args)
+
+def register_service_metrics():
+    """
+    Expose the services' own counters on /metrics, read at scrape time so the hot path pays nothing
+    """
+    def cache_requests():
+        samples = []
+        caches = [
+            ("recommendations", llm_service.cache),
+            ("explanations", llm_service.explanations),
+            ("product_json", product_json)
+        ]
+        for name, cache in caches:
+            if cache is not None:
+                samples += [((name, "hit"), cache.hits), ((name, "miss"), cache.misses)]
+        if segments is not None:
+            samples += [(("segments", "hit"), segments.served), (("segments", "miss"), segments.missed)]
+        if llm_service.single_flight is not None:
+            stats = llm_service.single_flight.stats()
+            samples += [(("single_flight", "hit"), stats["collapsed"]), (("single_flight", "miss"), stats["calls"])]
+        return samples
+    
+    def backend_samples(read):
+        return [((name,), read(backend)) for name, backend in llm_service.router.backends.items()]
+    
+    registry = metrics.REGISTRY
+    registry.callback(
+        "cache_requests_total", "Cache lookups by cache and result (hit or miss)", "counter",
+        ("cache", "result"), cache_requests
+    )
+    registry.callback(
+        "llm_parse_events_total", "Response parser events (invalid JSON, unknown IDs, truncation, ...)", "counter",
+        ("event",), lambda: [((field,), value) for field, value in llm_service.parse_stats.to_dict().items()]
+    )
+    registry.callback(
+        "llm_calls_in_flight", "LLM calls holding a backend concurrency slot", "gauge",
+        ("backend",), lambda: backend_samples(lambda b: getattr(getattr(b, "gate", None), "active", 0))
+    )
+    registry.callback(
+        "llm_calls_queued", "LLM calls waiting for a backend concurrency slot", "gauge",
+        ("backend",), lambda: backend_samples(lambda b: getattr(getattr(b, "gate", None), "queued", 0))
+    )
+    registry.callback(
+        "llm_retries_total", "LLM call attempts retried", "counter",
+        ("backend",), lambda: backend_samples(lambda b: getattr(b, "retries", 0))
+    )
+    registry.callback(
+        "llm_failures_total", "LLM calls that failed after retries", "counter",
+        ("backend",), lambda: backend_samples(lambda b: getattr(b, "failures", 0))
+    )
+    registry.callback(
+        "catalog_products", "Products in the current catalog snapshot", "gauge",
+        (), lambda: [((), len(product_service.get_all_products()))]
+    )
+
+register_service_metrics()
+
+def get_user_id(request: Request) -> str:
+    """
+    Identify the user from the X-User-Id header or user_id query parameter.
+
+    Requests without either share the "default" profile, which keeps the
+    single-user frontend working unchanged.
+    """
+    return request.headers.get("X-User-Id") or request.query_params.get("user_id") or "default"
+
+async def watch_catalog_file():
+    """Reload the catalog whenever its data file changes on disk"""
+    while True:
+        await asyncio.sleep(config['CATALOG_WATCH_INTERVAL'])
+        try:
+            if await asyncio.to_thread(product_service.reload_if_changed):
+                print(f"Reloaded product catalog, version {product_service.version}")
+        except Exception as e:
+            print(f"Error reloading product catalog: {str(e)}")
 
-# Load products data
-all_products = product_service.get_all_products()
+async def refresh_co_views():
+    """Periodically merge other workers' view events and recompute "also viewed" neighbours"""
+    while True:
+        await asyncio.sleep(config['CO_VIEW_REFRESH_INTERVAL'])
+        try:
+            await asyncio.to_thread(co_view_model.refresh)
+        except Exception as e:
+            print(f"Error refreshing co-view model: {str(e)}")
 
-# In-memory storage for user data 
-user_data = {
-    "preferences": {},
-    "browsing_history": []
-}
+async def materialize_segments():
+    """Periodically precompute recommendations for the most requested preference segments"""
+    while True:
+        await asyncio.sleep(config['SEGMENT_REFRESH_INTERVAL'])
+        try:
+            result = await segments.run_once()
+            if result["materialized"] or result["failed"]:
+                print(f"Materialized {result['materialized']} segments ({result['failed']} failed)")
+        except Exception as e:
+            print(f"Error materializing segments: {str(e)}")
+
+@app.on_event("startup")
+async def start_catalog_watcher():
+    """Start polling the catalog file for changes and the co-view and segment background jobs"""
+    # Recommendations skip embedding and keyword candidates until these indexes are ready
+    llm_service.warm_indexes()
+    if config['CATALOG_WATCH_INTERVAL'] > 0:
+        app.state.catalog_watcher = asyncio.ensure_future(watch_catalog_file())
+    if config['CO_VIEW_REFRESH_INTERVAL'] > 0:
+        app.state.co_view_refresher = asyncio.ensure_future(refresh_co_views())
+    if segments is not None and config['SEGMENT_REFRESH_INTERVAL'] > 0:
+        app.state.segment_materializer = asyncio.ensure_future(materialize_segments())
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """Release pooled LLM connections and stop the background tasks on shutdown"""
+    for name in ("catalog_watcher", "co_view_refresher", "segment_materializer"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    await llm_service.aclose()
+
+def require_admin(request: Request):
+    """
+    Check the X-Admin-Token header against ADMIN_TOKEN.
+
+    Admin endpoints are open when no token is configured, for local development.
+    """
+    if config['ADMIN_TOKEN'] and request.headers.get("X-Admin-Token") != config['ADMIN_TOKEN']:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+async def run_until_disconnected(request: Request, coro):
+    """
+    Await coro, cancelling it if the client disconnects first.
+
+    Keeps abandoned requests from holding an LLM concurrency slot until the
+    completion finishes.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=config['DISCONNECT_POLL_INTERVAL'])
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
 
 # Pydantic models for request/response validation
 class ProductResponse(BaseModel):
     products: List[Dict[str, Any]]
     count: int
+    total: int
+    next_cursor: Optional[str] = None
+
+class SearchResult(BaseModel):
+    product: Dict[str, Any]
+    score: Optional[float] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+    count: int
+    total: int
+    offset: int
+    limit: int
+    facets: Dict[str, List[Dict[str, Any]]]
+
+class AlsoViewedItem(BaseModel):
+    product: Dict[str, Any]
+    score: float
+
+class AlsoViewedResponse(BaseModel):
+    product_id: str
+    products: List[AlsoViewedItem]
+    count: int
 
 class ProductDetailResponse(BaseModel):
     status: str
@@ -78,6 +277,21 @@ class RecommendationsResponse(BaseModel):
     status: str
     recommendations: List[Dict[str, Any]]
     count: int
+    source: str = "llm"
+
+class CatalogChangesRequest(BaseModel):
+    upserts: List[Dict[str, Any]] = []
+    patches: List[Dict[str, Any]] = []
+    deletes: List[str] = []
+
+class BatchProfile(BaseModel):
+    id: Optional[str] = None
+    preferences: Dict[str, Any]
+    browsing_history: List[str] = []
+
+class BatchRecommendationsRequest(BaseModel):
+    profiles: List[BatchProfile]
+    concurrency: Optional[int] = None
 
 @app.get("/", response_model=StatusResponse)
 async def index():
@@ -87,38 +301,187 @@ async def index():
         "message": "Product Recommendation API is running"
     }
 
+def split_param(value: Optional[str]) -> List[str]:
+    """Split a comma-separated query parameter into its non-empty values"""
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+def products_etag(version: str, request: Request) -> str:
+    """ETag for a product listing: the catalog version plus the normalized query"""
+    query = sorted(request.query_params.multi_items())
+    digest = hashlib.sha1(json.dumps([version, query]).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the If-None-Match header names this ETag"""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def iter_products_json(page, fields, chunk_size=100):
+    """Render a product page as JSON bytes, a chunk of products at a time"""
+    yield b'{"products":['
+    separator = b""
+    chunk = []
+    for product in page.products():
+        chunk.append(product_json.product(product, fields).data)
+        if len(chunk) == chunk_size:
+            yield separator + b",".join(chunk)
+            separator, chunk = b",", []
+    if chunk:
+        yield separator + b",".join(chunk)
+    yield b'],"count":%d,"total":%d,"next_cursor":%s}' % (len(page.rows), page.total, encode(page.next_cursor))
+
 @app.get("/api/products", response_model=ProductResponse)
-async def get_products(category: Optional[str] = None):
-    """Get all products or filter by category"""
-    if category:
-        filtered_products = [p for p in all_products if p['category'].lower() == category.lower()]
-        return {
-            "products": filtered_products,
-            "count": len(filtered_products)
-        }
-    
-    return {
-        "products": all_products,
-        "count": len(all_products)
-    }
+async def get_products(
+    request: Request,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    tags: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    in_stock: bool = False,
+    sort: str = "id",
+    limit: int = Query(config['PRODUCTS_PAGE_SIZE'], ge=1, le=config['PRODUCTS_MAX_PAGE_SIZE']),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Get a page of products, optionally filtered and sorted
+
+    category, brand and tags take comma-separated alternatives. sort is one of
+    id, price, rating or name, prefixed with "-" for descending order. Pass
+    next_cursor from a response as cursor to get the following page, and a
+    comma-separated fields list to return only those fields.
+    """
+    query = product_service.product_query()
+    etag = products_etag(query.index.version, request)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        page = query.page(
+            sort=sort.lstrip("-"),
+            descending=sort.startswith("-"),
+            limit=limit,
+            cursor=cursor,
+            categories=split_param(category),
+            brands=split_param(brand),
+            tags=split_param(tags),
+            min_price=min_price,
+            max_price=max_price,
+            min_rating=min_rating,
+            in_stock=in_stock
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    body = iter_products_json(page, split_param(fields))
+    if len(page.rows) > config['PRODUCTS_STREAM_THRESHOLD']:
+        return StreamingResponse(body, media_type="application/json", headers=headers)
+    return Response(b"".join(body), media_type="application/json", headers=headers)
+
+@app.get("/api/search", response_model=SearchResponse)
+async def search_products(
+    q: str = "",
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    tags: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    in_stock: bool = False,
+    limit: int = Query(20, ge=1, le=config['PRODUCTS_MAX_PAGE_SIZE']),
+    offset: int = Query(0, ge=0),
+    facets: Optional[str] = None,
+    facet_limit: int = Query(10, ge=1, le=100),
+    fields: Optional[str] = None
+):
+    """
+    Full-text product search with facet filters and facet counts
+
+    Results are ranked by BM25 relevance to q (catalog order without q).
+    Filters take the same parameters as /api/products. facets is a
+    comma-separated subset of category, brand, tags and price; each facet is
+    counted with every filter except its own applied.
+    """
+    wanted_facets = split_param(facets) if facets is not None else list(FACETS)
+    unknown = [facet for facet in wanted_facets if facet not in FACETS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown facets: {', '.join(unknown)}")
+
+    # The first search after a catalog change may build the index, so keep it off the event loop
+    found = await asyncio.to_thread(
+        search_service.search,
+        q,
+        limit=limit,
+        offset=offset,
+        facets=wanted_facets,
+        facet_limit=facet_limit,
+        categories=split_param(category),
+        brands=split_param(brand),
+        tags=split_param(tags),
+        min_price=min_price,
+        max_price=max_price,
+        min_rating=min_rating,
+        in_stock=in_stock
+    )
+    catalog = found["catalog"]
+    keep = split_param(fields)
+    results = [
+        {"product": product_json.product(catalog[row], keep), "score": score}
+        for row, score in found["results"]
+    ]
+    return FastJSONResponse({
+        "query": q,
+        "results": results,
+        "count": len(results),
+        "total": found["total"],
+        "offset": offset,
+        "limit": limit,
+        "facets": found["facets"]
+    })
 
 @app.get("/api/products/{product_id}", response_model=ProductDetailResponse)
 async def get_product(product_id: str):
     """Get details for a specific product"""
-    product = next((p for p in all_products if p['id'] == product_id), None)
+    product = product_service.get_product_by_id(product_id)
     
     if product:
-        return {
+        return FastJSONResponse({
             "status": "success",
-            "product": product
-        }
+            "product": product_json.product(product)
+        })
     else:
         raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found")
 
+@app.get("/api/products/{product_id}/also-viewed", response_model=AlsoViewedResponse)
+async def get_also_viewed(product_id: str, limit: int = Query(10, ge=1, le=100)):
+    """
+    Products other shoppers viewed together with this one
+
+    Ranked by co-view similarity as of the last co-view model refresh
+    (every CO_VIEW_REFRESH_INTERVAL seconds); products no longer in the
+    catalog are skipped.
+    """
+    if not product_service.get_product_by_id(product_id):
+        raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found")
+    items = []
+    for other_id, score in co_view_model.also_viewed(product_id, co_view_model.neighbours):
+        other = product_service.get_product_by_id(other_id)
+        if other is not None:
+            items.append({"product": product_json.product(other), "score": score})
+            if len(items) == limit:
+                break
+    return FastJSONResponse({"product_id": product_id, "products": items, "count": len(items)})
+
 @app.get("/api/categories", response_model=CategoriesResponse)
 async def get_categories():
     """Get all unique product categories"""
-    categories = sorted(list(set(p['category'] for p in all_products)))
+    categories = product_service.get_categories()
     return {
         "categories": categories,
         "count": len(categories)
@@ -127,64 +490,117 @@ async def get_categories():
 @app.get("/api/brands", response_model=BrandsResponse)
 async def get_brands():
     """Get all unique product brands"""
-    brands = sorted(list(set(p['brand'] for p in all_products)))
+    brands = product_service.get_brands()
     return {
         "brands": brands,
         "count": len(brands)
     }
 
+@app.get("/api/catalog/version")
+async def get_catalog_version():
+    """Get the current catalog version and size"""
+    return {
+        "version": product_service.version,
+        "count": len(product_service.get_all_products())
+    }
+
+async def apply_catalog_changes(upserts=(), patches=(), deletes=()):
+    """Apply incremental catalog changes and persist them to the data file"""
+    try:
+        # Validating, re-indexing and saving a large catalog takes a while; keep it off the event loop
+        result = await asyncio.to_thread(
+            product_service.apply_changes, upserts=upserts, patches=patches, deletes=deletes
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if config['CATALOG_PERSIST_UPDATES']:
+        await asyncio.to_thread(product_service.save)
+    return {"status": "success", **result}
+
+@app.post("/api/admin/catalog/reload", dependencies=[Depends(require_admin)])
+async def reload_catalog():
+    """Re-read the catalog data file and swap it in"""
+    changed = await asyncio.to_thread(product_service.reload)
+    return {
+        "status": "success",
+        "changed": changed,
+        "version": product_service.version,
+        "count": len(product_service.get_all_products())
+    }
+
+@app.post("/api/admin/catalog/changes", dependencies=[Depends(require_admin)])
+async def change_catalog(changes: CatalogChangesRequest):
+    """Apply a batch of product upserts, partial updates and deletions as one catalog version"""
+    return await apply_catalog_changes(changes.upserts, changes.patches, changes.deletes)
+
+@app.put("/api/admin/products/{product_id}", dependencies=[Depends(require_admin)])
+async def upsert_product(product_id: str, product: Dict[str, Any]):
+    """Create or replace a product"""
+    return await apply_catalog_changes(upserts=[{**product, "id": product_id}])
+
+@app.patch("/api/admin/products/{product_id}", dependencies=[Depends(require_admin)])
+async def patch_product(product_id: str, fields: Dict[str, Any]):
+    """Update some fields of a product, e.g. price or inventory"""
+    if not product_service.get_product_by_id(product_id):
+        raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found")
+    return await apply_catalog_changes(patches=[{**fields, "id": product_id}])
+
+@app.delete("/api/admin/products/{product_id}", dependencies=[Depends(require_admin)])
+async def delete_product(product_id: str):
+    """Remove a product from the catalog"""
+    if not product_service.get_product_by_id(product_id):
+        raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found")
+    return await apply_catalog_changes(deletes=[product_id])
+
 @app.get("/api/preferences")
-async def get_preferences():
+async def get_preferences(user_id: str = Depends(get_user_id)):
     """Get user preferences"""
-    global user_data
-    return {"preferences": user_data["preferences"]}
+    return {"preferences": await session_call(session_store.get_preferences, user_id)}
 
 @app.post("/api/preferences", response_model=PreferencesResponse)
-async def update_preferences(preferences: Dict[str, Any]):
+async def update_preferences(preferences: Dict[str, Any], user_id: str = Depends(get_user_id)):
     """Update user preferences"""
-    global user_data
-    
     # Update preferences
-    user_data["preferences"] = preferences
+    await session_call(session_store.set_preferences, user_id, preferences)
     
     return {
         "status": "success",
         "message": "Preferences updated successfully",
-        "preferences": user_data["preferences"]
+        "preferences": preferences
     }
 
 @app.get("/api/browsing-history", response_model=BrowsingHistoryResponse)
-async def get_browsing_history():
+async def get_browsing_history(user_id: str = Depends(get_user_id)):
     """Get browsing history with product details"""
-    global user_data
+    browsing_history = await session_call(session_store.get_browsing_history, user_id)
     
     # Return detailed product info for browsed items
-    browsed_products = []
-    for product_id in user_data["browsing_history"]:
-        product = next((p for p in all_products if p['id'] == product_id), None)
-        if product:
-            browsed_products.append(product)
+    browsed_products = product_service.get_products_by_ids(browsing_history)
     
-    return {
-        "browsing_history": user_data["browsing_history"],
-        "products": browsed_products,
+    return FastJSONResponse({
+        "browsing_history": browsing_history,
+        "products": product_json.products(browsed_products),
         "count": len(browsed_products)
-    }
+    })
 
 @app.post("/api/browsing-history", response_model=StatusResponse)
-async def add_to_browsing_history(history_item: BrowsingHistoryItem):
+async def add_to_browsing_history(history_item: BrowsingHistoryItem, user_id: str = Depends(get_user_id)):
     """Add a product to browsing history"""
-    global user_data
     product_id = history_item.product_id
     
     # Check if product exists
-    product = next((p for p in all_products if p['id'] == product_id), None)
+    product = product_service.get_product_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found")
     
     # Add to browsing history if not already there
-    if product_id not in user_data["browsing_history"]:
-        user_data["browsing_history"].append(product_id)
+    # Appended in one store call, so the co-view pairs with the history this view actually extends
+    previous_history = await session_call(session_store.add_view, user_id, product_id)
+    if previous_history is not None:
+        # Off the loop and not awaited: the model's lock and the shared log's lock can be held by a compaction
+        asyncio.get_running_loop().run_in_executor(
+            co_view_model.executor, llm_service.record_view, product_id, previous_history, user_id
+        )
     
     return {
         "status": "success",
@@ -192,12 +608,10 @@ async def add_to_browsing_history(history_item: BrowsingHistoryItem):
     }
 
 @app.delete("/api/browsing-history", response_model=StatusResponse)
-async def clear_browsing_history():
+async def clear_browsing_history(user_id: str = Depends(get_user_id)):
     """Clear browsing history"""
-    global user_data
-    
     # Clear browsing history
-    user_data["browsing_history"] = []
+    await session_call(session_store.clear_browsing_history, user_id)
     
     return {
         "status": "success",
@@ -205,39 +619,201 @@ async def clear_browsing_history():
     }
 
 @app.get("/api/recommendations", response_model=RecommendationsResponse)
-async def get_recommendations():
+async def get_recommendations(request: Request, user_id: str = Depends(get_user_id)):
     """Generate and return personalized product recommendations"""
-    global user_data
+    preferences = await session_call(session_store.get_preferences, user_id)
     
     # Check if we have preferences
-    if not user_data["preferences"]:
+    if not preferences:
         raise HTTPException(
             status_code=400, 
             detail="No user preferences found. Please set preferences first."
         )
     
+    browsing_history = await session_call(session_store.get_browsing_history, user_id)
     try:
-        # Call the LLM service to generate recommendations
-        recommendations = llm_service.generate_recommendations(
-            user_preferences=user_data["preferences"],
-            browsing_history=user_data["browsing_history"],
-            all_products=all_products
-        )
+        # Serve precomputed recommendations for the user's preference segment when there are some
+        recommendations = None
+        if segments is not None:
+            segment = segments.observe(preferences)
+            if segment is not None:
+                recommendations = await segments.serve(preferences, browsing_history, segment)
+            if recommendations is not None:
+                recommendations["source"] = "materialized"
         
-        return {
+        # Otherwise call the LLM service, falling back to local recommendations if it is slow or failing
+        if recommendations is None:
+            recommendations = await run_until_disconnected(request, llm_service.generate_recommendations_hedged(
+                user_preferences=preferences,
+                browsing_history=browsing_history,
+                all_products=product_service.get_all_products()
+            ))
+        
+        metrics.RECOMMENDATIONS.labels(recommendations["source"]).inc()
+        return FastJSONResponse({
             "status": "success",
-            "recommendations": recommendations["recommendations"],
-            "count": recommendations["count"]
-        }
+            "recommendations": product_json.recommendations(recommendations["recommendations"]),
+            "count": len(recommendations["recommendations"]),
+            "source": recommendations["source"]
+        })
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
+def format_sse(event, data):
+    """Encode one Server-Sent Event"""
+    return b"event: %s\ndata: %s\n\n" % (event.encode("utf-8"), encode(data))
+
+@app.get("/api/recommendations/stream")
+async def stream_recommendations(user_id: str = Depends(get_user_id)):
+    """Stream personalized recommendations as Server-Sent Events, one per recommendation"""
+    preferences = await session_call(session_store.get_preferences, user_id)
+    
+    # Check if we have preferences
+    if not preferences:
+        raise HTTPException(
+            status_code=400, 
+            detail="No user preferences found. Please set preferences first."
+        )
+    
+    browsing_history = await session_call(session_store.get_browsing_history, user_id)
+    all_products = product_service.get_all_products()
+    
+    async def event_stream():
+        count = 0
+        source = "llm"
+        try:
+            async for source, recommendation in llm_service.stream_recommendations(
+                user_preferences=preferences,
+                browsing_history=browsing_history,
+                all_products=all_products
+            ):
+                count += 1
+                yield format_sse("recommendation", product_json.recommendations([recommendation])[0])
+            metrics.RECOMMENDATIONS.labels(source).inc()
+            yield format_sse("done", {"status": "success", "count": count, "source": source})
+        except Exception as e:
+            if count or not llm_service.fallback_enabled:
+                yield format_sse("error", {"detail": f"Error generating recommendations: {str(e)}"})
+                return
+            # Nothing was sent yet, so serve the local recommendations instead
+            fallback = await asyncio.to_thread(
+                llm_service.local_recommendations, preferences, browsing_history, all_products
+            )
+            for recommendation in product_json.recommendations(fallback["recommendations"]):
+                yield format_sse("recommendation", recommendation)
+            metrics.RECOMMENDATIONS.labels("fallback").inc()
+            yield format_sse("done", {"status": "success", "count": fallback["count"], "source": "fallback"})
+    
+    # Streaming responses are cancelled by Starlette when the client disconnects
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/recommendations/batch")
+async def batch_recommendations(batch: BatchRecommendationsRequest):
+    """
+    Generate recommendations for many profiles, streamed back as NDJSON.
+
+    One line per profile in completion order, then a summary line.
+    """
+    if len(batch.profiles) > config['BATCH_MAX_PROFILES']:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many profiles: {len(batch.profiles)} (max {config['BATCH_MAX_PROFILES']})"
+        )
+    if batch.concurrency is not None and batch.concurrency < 1:
+        raise HTTPException(status_code=400, detail="concurrency must be at least 1")
+    
+    profiles = [
+        {
+            "id": profile.id if profile.id is not None else str(i),
+            "preferences": profile.preferences,
+            "browsing_history": profile.browsing_history
+        }
+        for i, profile in enumerate(batch.profiles)
+    ]
+    
+    async def ndjson_stream():
+        unique_profiles = 0
+        errors = 0
+        async for profile_ids, result, error in llm_service.generate_batch_recommendations(
+            profiles, product_service.get_all_products(), concurrency=batch.concurrency
+        ):
+            unique_profiles += 1
+            for profile_id in profile_ids:
+                if error is None:
+                    line = {
+                        "id": profile_id,
+                        "status": "success",
+                        "recommendations": product_json.recommendations(result["recommendations"]),
+                        "count": len(result["recommendations"])
+                    }
+                else:
+                    errors += 1
+                    line = {"id": profile_id, "status": "error", "detail": error}
+                yield encode(line) + b"\n"
+        yield encode({"summary": {
+            "profiles": len(profiles),
+            "unique_profiles": unique_profiles,
+            "errors": errors
+        }}) + b"\n"
+    
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    if not config['METRICS_ENABLED']:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/recommendations/cache-stats")
+async def get_recommendation_cache_stats():
+    """Get recommendation cache hit/miss and request coalescing counters"""
+    stats = {"enabled": False} if llm_service.cache is None else {"enabled": True, **(await llm_service.cache.stats())}
+    if llm_service.single_flight is not None:
+        stats["single_flight"] = llm_service.single_flight.stats()
+    if llm_service.explanations is not None:
+        stats["explanations"] = await llm_service.explanations.stats()
+    return stats
+
+@app.get("/api/recommendations/segment-stats")
+async def get_segment_stats():
+    """Get materialized segment serving counters"""
+    return {"enabled": False} if segments is None else {"enabled": True, **(await segments.stats())}
+
+@app.get("/api/recommendations/pipeline-stats")
+async def get_pipeline_stats():
+    """Get per-stage timings and skip counts of the recommendation pipeline"""
+    return llm_service.pipeline.stats.to_dict()
+
+@app.post("/api/admin/segments/materialize", dependencies=[Depends(require_admin)])
+async def run_segment_materialization():
+    """Materialize the top preference segments now instead of waiting for the next scheduled run"""
+    if segments is None:
+        raise HTTPException(status_code=400, detail="Segment materialization is disabled")
+    return {"status": "success", **(await segments.run_once())}
+
+@app.get("/api/recommendations/parse-stats")
+async def get_recommendation_parse_stats():
+    """Get counters describing how LLM responses were parsed"""
+    return llm_service.parse_stats.to_dict()
+
+@app.get("/api/llm-stats")
+async def get_llm_stats():
+    """Get LLM routing and per-backend retry, circuit breaker and queue counters"""
+    return llm_service.router.stats()
+
 @app.get("/api/test-llm", response_model=StatusResponse)
 async def test_llm_connection():
     """Test connection to the LLM API"""
     try:
-        is_connected = llm_service.test_api_connection()
+        is_connected = await llm_service.test_api_connection()
         if is_connected:
             return {
                 "status": "success",
@@ -7,8 +7,101 @@ load_dotenv()
 # Configuration settings
 config = {
     'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
+    'OPENAI_API_BASE': os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1'),
     'MODEL_NAME': os.getenv('MODEL_NAME', 'gpt-3.5-turbo'),
     'MAX_TOKENS': int(os.getenv('MAX_TOKENS', 1000)),
     'TEMPERATURE': float(os.getenv('TEMPERATURE', 0.7)),
-    'DATA_PATH': os.getenv('DATA_PATH', 'data/products.json')
+    'LLM_TIMEOUT': float(os.getenv('LLM_TIMEOUT', 30)),
+    'LLM_MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', 256)),
+    'LLM_MAX_CONNECTIONS': int(os.getenv('LLM_MAX_CONNECTIONS', 100)),
+    'LLM_QUEUE_MAX': int(os.getenv('LLM_QUEUE_MAX', 1024)),
+    'LLM_RATE_LIMIT_RPM': int(os.getenv('LLM_RATE_LIMIT_RPM', 0)),
+    'LLM_RATE_LIMIT_TPM': int(os.getenv('LLM_RATE_LIMIT_TPM', 0)),
+    'LLM_MAX_RETRIES': int(os.getenv('LLM_MAX_RETRIES', 3)),
+    'LLM_RETRY_BASE_DELAY': float(os.getenv('LLM_RETRY_BASE_DELAY', 0.5)),
+    'LLM_RETRY_MAX_DELAY': float(os.getenv('LLM_RETRY_MAX_DELAY', 10)),
+    'LLM_BREAKER_FAILURES': int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+    'LLM_BREAKER_RESET': float(os.getenv('LLM_BREAKER_RESET', 30)),
+    'OPENAI_COST_PER_1K_TOKENS': float(os.getenv('OPENAI_COST_PER_1K_TOKENS', 0.002)),
+    'LOCAL_LLM_API_BASE': os.getenv('LOCAL_LLM_API_BASE', ''),
+    'LOCAL_LLM_MODEL': os.getenv('LOCAL_LLM_MODEL', 'local'),
+    'LOCAL_LLM_TIMEOUT': float(os.getenv('LOCAL_LLM_TIMEOUT', 20)),
+    'LOCAL_LLM_MAX_CONCURRENCY': int(os.getenv('LOCAL_LLM_MAX_CONCURRENCY', 4)),
+    'LOCAL_LLM_COST_PER_1K_TOKENS': float(os.getenv('LOCAL_LLM_COST_PER_1K_TOKENS', 0)),
+    'LLM_ROUTE_INTERACTIVE': os.getenv('LLM_ROUTE_INTERACTIVE', 'openai'),
+    'LLM_ROUTE_BATCH': os.getenv('LLM_ROUTE_BATCH', 'openai'),
+    'LLM_ROUTING_STRATEGY': os.getenv('LLM_ROUTING_STRATEGY', 'ordered'),
+    'BATCH_CONCURRENCY': int(os.getenv('BATCH_CONCURRENCY', 16)),
+    'BATCH_MAX_PROFILES': int(os.getenv('BATCH_MAX_PROFILES', 10000)),
+    'DISCONNECT_POLL_INTERVAL': float(os.getenv('DISCONNECT_POLL_INTERVAL', 0.25)),
+    'DATA_PATH': os.getenv('DATA_PATH', 'data/products.json'),
+    'PRODUCTS_PAGE_SIZE': int(os.getenv('PRODUCTS_PAGE_SIZE', 50)),
+    'PRODUCTS_MAX_PAGE_SIZE': int(os.getenv('PRODUCTS_MAX_PAGE_SIZE', 1000)),
+    'PRODUCTS_STREAM_THRESHOLD': int(os.getenv('PRODUCTS_STREAM_THRESHOLD', 200)),
+    'METRICS_ENABLED': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+    'PRODUCT_JSON_CACHE_SIZE': int(os.getenv('PRODUCT_JSON_CACHE_SIZE', 50000)),
+    'CATALOG_FORMAT': os.getenv('CATALOG_FORMAT', 'json'),
+    'CATALOG_COLUMNAR_PATH': os.getenv('CATALOG_COLUMNAR_PATH', 'data/catalog'),
+    'CATALOG_WATCH_INTERVAL': float(os.getenv('CATALOG_WATCH_INTERVAL', 5)),
+    'CATALOG_PERSIST_UPDATES': os.getenv('CATALOG_PERSIST_UPDATES', 'true').lower() == 'true',
+    'CATALOG_CHANGE_LOG_SIZE': int(os.getenv('CATALOG_CHANGE_LOG_SIZE', 256)),
+    'ADMIN_TOKEN': os.getenv('ADMIN_TOKEN', ''),
+    'SCORE_WEIGHT_CATEGORY': float(os.getenv('SCORE_WEIGHT_CATEGORY', 3)),
+    'SCORE_WEIGHT_BRAND': float(os.getenv('SCORE_WEIGHT_BRAND', 2)),
+    'SCORE_WEIGHT_PRICE': float(os.getenv('SCORE_WEIGHT_PRICE', 2)),
+    'SCORE_WEIGHT_TAG': float(os.getenv('SCORE_WEIGHT_TAG', 1)),
+    'RETRIEVAL_ENABLED': os.getenv('RETRIEVAL_ENABLED', 'true').lower() == 'true',
+    'RETRIEVAL_TOP_K': int(os.getenv('RETRIEVAL_TOP_K', 200)),
+    'RETRIEVAL_WEIGHT': float(os.getenv('RETRIEVAL_WEIGHT', 2)),
+    'EMBEDDING_DIM': int(os.getenv('EMBEDDING_DIM', 256)),
+    'EMBEDDING_INDEX_PATH': os.getenv('EMBEDDING_INDEX_PATH', 'data/embeddings'),
+    'SEARCH_INDEX_PATH': os.getenv('SEARCH_INDEX_PATH', 'data/search'),
+    'SEARCH_CANDIDATES_ENABLED': os.getenv('SEARCH_CANDIDATES_ENABLED', 'true').lower() == 'true',
+    'SEARCH_CANDIDATE_TOP_K': int(os.getenv('SEARCH_CANDIDATE_TOP_K', 100)),
+    'SEARCH_CANDIDATE_WEIGHT': float(os.getenv('SEARCH_CANDIDATE_WEIGHT', 1.5)),
+    'CANDIDATE_LIMIT': int(os.getenv('CANDIDATE_LIMIT', 20)),
+    'PIPELINE_LLM_MODE': os.getenv('PIPELINE_LLM_MODE', 'always').lower(),
+    'PIPELINE_LLM_MARGIN': float(os.getenv('PIPELINE_LLM_MARGIN', 0)),
+    'PIPELINE_LLM_BUDGET': float(os.getenv('PIPELINE_LLM_BUDGET', 0)),
+    'PIPELINE_LOCAL_BUDGET_MS': float(os.getenv('PIPELINE_LOCAL_BUDGET_MS', 0)),
+    'PIPELINE_IN_STOCK_ONLY': os.getenv('PIPELINE_IN_STOCK_ONLY', 'false').lower() == 'true',
+    'PIPELINE_MAX_PER_BRAND': int(os.getenv('PIPELINE_MAX_PER_BRAND', 0)),
+    'EXPLANATION_MAX_TOKENS': int(os.getenv('EXPLANATION_MAX_TOKENS', 60)),
+    'EXPLANATION_CACHE_BACKEND': os.getenv('EXPLANATION_CACHE_BACKEND', 'memory'),
+    'EXPLANATION_CACHE_TTL': float(os.getenv('EXPLANATION_CACHE_TTL', 86400)),
+    'EXPLANATION_CACHE_MAX_ENTRIES': int(os.getenv('EXPLANATION_CACHE_MAX_ENTRIES', 100000)),
+    'EXPLANATION_CACHE_PATH': os.getenv('EXPLANATION_CACHE_PATH', 'data/explanation_cache.sqlite3'),
+    'PROMPT_TOKEN_BUDGET': int(os.getenv('PROMPT_TOKEN_BUDGET', 3000)),
+    'PROMPT_SNIPPET_CACHE_SIZE': int(os.getenv('PROMPT_SNIPPET_CACHE_SIZE', 20000)),
+    'PROMPT_FORMAT': os.getenv('PROMPT_FORMAT', 'verbose'),
+    'SESSION_BACKEND': os.getenv('SESSION_BACKEND', 'memory'),
+    'SESSION_PATH': os.getenv('SESSION_PATH', 'data/sessions.sqlite3'),
+    'SESSION_MAX_USERS': int(os.getenv('SESSION_MAX_USERS', 100000)),
+    'SESSION_MAX_HISTORY': int(os.getenv('SESSION_MAX_HISTORY', 50)),
+    'FALLBACK_ENABLED': os.getenv('FALLBACK_ENABLED', 'true').lower() == 'true',
+    'FALLBACK_COUNT': int(os.getenv('FALLBACK_COUNT', 5)),
+    'HEDGE_DEADLINE': float(os.getenv('HEDGE_DEADLINE', 8)),
+    'HEDGE_UPGRADE_VIA_CACHE': os.getenv('HEDGE_UPGRADE_VIA_CACHE', 'true').lower() == 'true',
+    'CO_BROWSE_WINDOW': int(os.getenv('CO_BROWSE_WINDOW', 10)),
+    'CO_VIEW_LOG_PATH': os.getenv('CO_VIEW_LOG_PATH', 'data/view_events.jsonl'),
+    'CO_VIEW_LOG_MAX_BYTES': int(os.getenv('CO_VIEW_LOG_MAX_BYTES', 64 * 1024 * 1024)),
+    'CO_VIEW_MAX_PAIRS': int(os.getenv('CO_VIEW_MAX_PAIRS', 1000000)),
+    'CO_VIEW_DECAY': float(os.getenv('CO_VIEW_DECAY', 0.5)),
+    'CO_VIEW_NEIGHBOURS': int(os.getenv('CO_VIEW_NEIGHBOURS', 20)),
+    'CO_VIEW_REFRESH_INTERVAL': float(os.getenv('CO_VIEW_REFRESH_INTERVAL', 15)),
+    'CO_VIEW_WEIGHT': float(os.getenv('CO_VIEW_WEIGHT', 2)),
+    'SINGLE_FLIGHT_ENABLED': os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true',
+    'SEGMENTS_ENABLED': os.getenv('SEGMENTS_ENABLED', 'false').lower() == 'true',
+    'SEGMENT_STORE_PATH': os.getenv('SEGMENT_STORE_PATH', 'data/segments.sqlite3'),
+    'SEGMENT_TOP_N': int(os.getenv('SEGMENT_TOP_N', 300)),
+    'SEGMENT_MIN_HITS': int(os.getenv('SEGMENT_MIN_HITS', 3)),
+    'SEGMENT_MIN_RESULTS': int(os.getenv('SEGMENT_MIN_RESULTS', 3)),
+    'SEGMENT_PRICE_BANDS': os.getenv('SEGMENT_PRICE_BANDS', '0,25,50,100,200,500,1000'),
+    'SEGMENT_REFRESH_INTERVAL': float(os.getenv('SEGMENT_REFRESH_INTERVAL', 300)),
+    'SEGMENT_TTL': float(os.getenv('SEGMENT_TTL', 86400)),
+    'CACHE_BACKEND': os.getenv('CACHE_BACKEND', 'memory'),
+    'CACHE_TTL': float(os.getenv('CACHE_TTL', 3600)),
+    'CACHE_MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+    'CACHE_PATH': os.getenv('CACHE_PATH', 'data/recommendation_cache.sqlite3'),
+    'CACHE_HISTORY_ORDER_SENSITIVE': os.getenv('CACHE_HISTORY_ORDER_SENSITIVE', 'false').lower() == 'true'
 }
\ No newline at end of file
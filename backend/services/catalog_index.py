@@ -0,0 +1,232 @@
+import bisect
+
+
+class CatalogIndex:
+    """
+    In-memory index over the product catalog
+
+    Built once when the catalog is loaded so that lookups by id, category,
+    subcategory, brand, tag and price range do not scan the full product list.
+    Category, subcategory, brand and tag keys are matched case-insensitively.
+
+    An index is an immutable snapshot of one catalog version: apply_changes()
+    returns a new index and leaves this one untouched for readers holding it.
+    """
+
+    # Indexed fields and the attribute holding their buckets
+    BUCKET_FIELDS = (
+        ('category', 'by_category'),
+        ('subcategory', 'by_subcategory'),
+        ('brand', 'by_brand')
+    )
+
+    def __init__(self, products, version=None):
+        """
+        Build all indexes for the given product list
+
+        Parameters:
+        - products (list): Full product catalog
+        - version (str, optional): Catalog version this snapshot represents
+        """
+        self.products = products
+        self.version = version
+        self.by_id = {}
+        self.position = {}
+        self.by_category = {}
+        self.by_subcategory = {}
+        self.by_brand = {}
+        self.by_tag = {}
+
+        for row, product in enumerate(products):
+            self.by_id[product['id']] = product
+            self.position[product['id']] = row
+            self._add(self.by_category, product.get('category'), product)
+            self._add(self.by_subcategory, product.get('subcategory'), product)
+            self._add(self.by_brand, product.get('brand'), product)
+            # A tag listed twice must not put the product in its bucket twice
+            for tag in dict.fromkeys(self._key(tag) for tag in product.get('tags', [])):
+                self._add(self.by_tag, tag, product)
+
+        self._refresh_listings()
+
+        # Products ordered by price with a parallel key array for bisect range queries
+        self.price_sorted = sorted(products, key=lambda p: p['price'])
+        self.price_keys = [p['price'] for p in self.price_sorted]
+
+    def _refresh_listings(self):
+        # Distinct display values, sorted once for the listing endpoints
+        self.categories = sorted({p['category'] for p in self.products if p.get('category')})
+        self.brands = sorted({p['brand'] for p in self.products if p.get('brand')})
+
+    def apply_changes(self, upserts=(), deletes=(), version=None):
+        """
+        Return a new index with products replaced, added and deleted
+
+        Replaced products keep their catalog position and new products are
+        appended. Only the index buckets touched by the change are copied;
+        everything else is shared with this index.
+
+        Parameters:
+        - upserts (list): Complete product dicts, replacing any product with the same ID
+        - deletes (iterable): IDs of products to remove (unknown IDs are ignored)
+        - version (str, optional): Catalog version of the new snapshot
+
+        Returns:
+        - CatalogIndex: The updated snapshot
+        """
+        upserts = {product['id']: product for product in upserts}
+        deletes = {pid for pid in deletes if pid in self.by_id and pid not in upserts}
+        replaced = {pid: product for pid, product in upserts.items() if pid in self.by_id}
+        added = [product for pid, product in upserts.items() if pid not in self.by_id]
+
+        new = object.__new__(CatalogIndex)
+        new.version = version
+        if replaced or deletes:
+            new.products = [replaced.get(p['id'], p) for p in self.products if p['id'] not in deletes]
+        else:
+            new.products = list(self.products)
+        new.products.extend(added)
+        new.by_id = dict(self.by_id)
+        if deletes:
+            new.position = {p['id']: row for row, p in enumerate(new.products)}
+        else:
+            new.position = dict(self.position)
+            for row, product in enumerate(added, len(self.products)):
+                new.position[product['id']] = row
+        for _, attribute in self.BUCKET_FIELDS + (('tags', 'by_tag'),):
+            setattr(new, attribute, dict(getattr(self, attribute)))
+        new.price_sorted = list(self.price_sorted)
+        new.price_keys = list(self.price_keys)
+
+        copied = set()
+        listings_changed = any(
+            product.get('category') not in self.categories or product.get('brand') not in self.brands
+            for product in upserts.values()
+        )
+        for pid in list(replaced) + list(deletes):
+            old = self.by_id[pid]
+            listings_changed |= new._unlink(old, copied)
+            del new.by_id[pid]
+        for product in list(replaced.values()) + added:
+            listings_changed |= new._link(product, copied)
+            new.by_id[product['id']] = product
+
+        if listings_changed:
+            new._refresh_listings()
+        else:
+            new.categories = self.categories
+            new.brands = self.brands
+        return new
+
+    def _bucket_keys(self, product):
+        """
+        (attribute, key) pairs of the buckets a product belongs to
+        """
+        keys = [(attribute, self._key(product.get(field))) for field, attribute in self.BUCKET_FIELDS
+                if product.get(field) is not None]
+        keys.extend(('by_tag', key) for key in dict.fromkeys(self._key(tag) for tag in product.get('tags', [])))
+        return keys
+
+    def _writable_bucket(self, attribute, key, copied):
+        """
+        Bucket list safe to modify, copying it the first time this snapshot touches it
+        """
+        index = getattr(self, attribute)
+        if (attribute, key) not in copied:
+            index[key] = list(index.get(key, []))
+            copied.add((attribute, key))
+        return index[key]
+
+    def _unlink(self, product, copied):
+        """
+        Remove a product from its buckets and the price order; returns True if a bucket emptied
+        """
+        emptied = False
+        for attribute, key in self._bucket_keys(product):
+            bucket = self._writable_bucket(attribute, key, copied)
+            bucket[:] = [p for p in bucket if p is not product]
+            if not bucket:
+                del getattr(self, attribute)[key]
+                copied.discard((attribute, key))
+                emptied = True
+        lo = bisect.bisect_left(self.price_keys, product['price'])
+        hi = bisect.bisect_right(self.price_keys, product['price'])
+        for i in range(lo, hi):
+            if self.price_sorted[i] is product:
+                del self.price_sorted[i]
+                del self.price_keys[i]
+                break
+        return emptied
+
+    def _link(self, product, copied):
+        """
+        Add a product to its buckets (in catalog order) and the price order; returns True if a bucket was created
+        """
+        created = False
+        position = self.position
+        for attribute, key in self._bucket_keys(product):
+            created |= key not in getattr(self, attribute)
+            bucket = self._writable_bucket(attribute, key, copied)
+            rows = [position[p['id']] for p in bucket]
+            bucket.insert(bisect.bisect_right(rows, position[product['id']]), product)
+        i = bisect.bisect_right(self.price_keys, product['price'])
+        self.price_sorted.insert(i, product)
+        self.price_keys.insert(i, product['price'])
+        return created
+
+    @staticmethod
+    def _key(value):
+        return value.lower() if isinstance(value, str) else value
+
+    def _add(self, index, value, product):
+        if value is None:
+            return
+        index.setdefault(self._key(value), []).append(product)
+
+    def get(self, product_id):
+        """
+        Get a product by ID, or None if it does not exist
+        """
+        return self.by_id.get(product_id)
+
+    def get_many(self, product_ids):
+        """
+        Get the products for a list of IDs, skipping unknown IDs and keeping order
+        """
+        by_id = self.by_id
+        return [by_id[pid] for pid in product_ids if pid in by_id]
+
+    def with_category(self, category):
+        """
+        Get products in a category, in catalog order
+        """
+        return self.by_category.get(self._key(category), [])
+
+    def with_subcategory(self, subcategory):
+        """
+        Get products in a subcategory, in catalog order
+        """
+        return self.by_subcategory.get(self._key(subcategory), [])
+
+    def with_brand(self, brand):
+        """
+        Get products of a brand, in catalog order
+        """
+        return self.by_brand.get(self._key(brand), [])
+
+    def with_tag(self, tag):
+        """
+        Get products carrying a tag, in catalog order
+        """
+        return self.by_tag.get(self._key(tag), [])
+
+    def in_price_range(self, min_price=0, max_price=float('inf')):
+        """
+        Get products with min_price <= price <= max_price, ordered by price
+        """
+        lo = bisect.bisect_left(self.price_keys, min_price)
+        hi = bisect.bisect_right(self.price_keys, max_price)
+        return self.price_sorted[lo:hi]
+
+    def __len__(self):
+        return len(self.products)
@@ -0,0 +1,445 @@
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+# Pair and view counts that decay below this are dropped at compaction
+MIN_COUNT = 0.5
+
+
+class ViewEventLog:
+    """
+    Log of browsing-history events, one JSON object per line, plus a snapshot of the counts before it
+
+    Every worker appends to the same file and tails it to pick up the
+    events written by the others. Once the log grows past max_bytes, one
+    worker compacts it: it writes the model's counts to a snapshot file
+    (path + ".snapshot.npz") and truncates the log. Other workers notice the
+    new snapshot on their next read and reload from it. Appends and reads
+    hold a shared lock on path + ".lock" and compaction an exclusive one,
+    so a reader always sees a snapshot together with the log that follows it.
+    """
+
+    def __init__(self, path, max_bytes=0):
+        """
+        Parameters:
+        - path (str): Log file, created on first write
+        - max_bytes (int): Log size that triggers compaction (0 disables it)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.snapshot_path = f"{path}.snapshot.npz"
+        self._offset = 0
+        # False until the first read, so it differs from every stamp including None (no snapshot)
+        self._snapshot_stamp = False
+        self._lock_fd = None
+
+    @contextmanager
+    def _locked(self, mode):
+        if self._lock_fd is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._lock_fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def exclusive(self):
+        """
+        Lock out every appender and reader, for compaction
+        """
+        return self._locked(fcntl.LOCK_EX)
+
+    def append(self, event):
+        """
+        Append one event (a single write, so concurrent writers do not interleave lines)
+        """
+        line = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._locked(fcntl.LOCK_SH):
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def _stat_snapshot(self):
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read_events(self):
+        # Caller holds the lock
+        try:
+            with open(self.path, 'rb') as file:
+                file.seek(self._offset)
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        events = []
+        for line in data[:end].splitlines():
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                print(f"Skipping malformed view event: {line[:80]!r}")
+        return events
+
+    def read_new(self):
+        """
+        Events appended since the previous call, restarting from the snapshot after a compaction
+
+        A partially written last line is left for the next call.
+
+        Returns:
+        - tuple: (snapshot, events). snapshot is None when the events continue
+          the previous call's; otherwise it is the snapshot's counts (a dict,
+          empty if there is no snapshot) and events is the whole log after it.
+        """
+        with self._locked(fcntl.LOCK_SH):
+            stamp = self._stat_snapshot()
+            snapshot = None
+            if stamp != self._snapshot_stamp:
+                snapshot = self._load_snapshot() if stamp is not None else {}
+                self._snapshot_stamp = stamp
+                self._offset = 0
+            return snapshot, self._read_events()
+
+    def read_tail(self):
+        """
+        Events appended since the previous read; the caller holds exclusive()
+        """
+        return self._read_events()
+
+    def _load_snapshot(self):
+        try:
+            with np.load(self.snapshot_path, allow_pickle=False) as data:
+                return {name: data[name] for name in data.files}
+        except Exception as e:
+            print(f"Error loading view snapshot: {str(e)}")
+            return {}
+
+    def needs_compaction(self):
+        if self.max_bytes <= 0:
+            return False
+        try:
+            return os.path.getsize(self.path) > self.max_bytes
+        except OSError:
+            return False
+
+    def compact(self, snapshot):
+        """
+        Replace the snapshot and truncate the log; the caller holds exclusive() and has read the whole log
+
+        Parameters:
+        - snapshot (dict): Arrays to save (see CoViewModel._snapshot)
+        """
+        temp_path = f"{self.path}.snapshot.{os.getpid()}.npz"
+        np.savez(temp_path, **snapshot)
+        os.replace(temp_path, self.snapshot_path)
+        with open(self.path, 'wb'):
+            pass
+        self._offset = 0
+        self._snapshot_stamp = self._stat_snapshot()
+
+
+class CoViewModel:
+    """
+    Item-item collaborative filtering from browsing-history events
+
+    Each view increments the product's view count and its co-view count with
+    the products the same user viewed just before it. Pair counts are
+    updated incrementally; refresh() turns them into a precomputed list of
+    the top neighbours per product, ranked by cosine similarity
+    (co-views / sqrt(views of each)), so "also viewed" lookups are a
+    dictionary access.
+
+    With an event log, views are also appended to it and refresh() replays
+    the events other workers wrote, so every worker converges on the same
+    counts. When the log is compacted, counts are multiplied by `decay` (so
+    old co-views fade) and only the `max_pairs` largest pair counts are
+    kept. Without a log the same pruning runs once the model holds twice
+    `max_pairs` pairs.
+
+    record_view() and refresh() take the model's lock, and with a log also
+    the log's file lock, which compaction in any worker holds exclusively.
+    Callers on the event loop run record_view() on `executor`, a single
+    thread that keeps views in order, and refresh() in a worker thread.
+    """
+
+    def __init__(self, window=10, neighbours=20, event_log=None, max_pairs=1000000, decay=1.0):
+        """
+        Parameters:
+        - window (int): Number of previous views of the same user paired with each new view
+        - neighbours (int): Neighbours kept per product
+        - event_log (ViewEventLog, optional): Shared event log
+        - max_pairs (int): Pair counts kept when pruning (0 keeps all)
+        - decay (float): Factor applied to every count when pruning (1 keeps counts as they are)
+        """
+        self.window = window
+        self.neighbours = neighbours
+        self.event_log = event_log
+        self.max_pairs = max_pairs
+        self.decay = decay
+        self.compactions = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="co-view")
+        # Identifies this process's events in the shared log
+        self.writer_id = uuid.uuid4().hex[:12]
+        self.view_counts = {}
+        self.max_views = 0
+        # Product IDs are interned to codes; a pair key packs two codes, smaller first
+        self._codes = {}
+        self._ids = []
+        self._pairs = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._neighbours = {}
+        self.refreshed_at = None
+        self.events = 0
+
+    def _code(self, product_id):
+        code = self._codes.get(product_id)
+        if code is None:
+            code = self._codes[product_id] = len(self._ids)
+            self._ids.append(product_id)
+        return code
+
+    def _apply(self, product_id, previous):
+        # Caller holds self._lock
+        views = self.view_counts.get(product_id, 0) + 1
+        self.view_counts[product_id] = views
+        self.max_views = max(self.max_views, views)
+        code = self._code(product_id)
+        for other_id in previous[-self.window:]:
+            if other_id == product_id:
+                continue
+            other = self._code(other_id)
+            pair = (code << 32) | other if code < other else (other << 32) | code
+            self._pairs[pair] = self._pairs.get(pair, 0) + 1
+        self._dirty = True
+        self.events += 1
+
+    def record_view(self, product_id, previous_history, user_id=None):
+        """
+        Record that a user viewed product_id after the products in previous_history
+
+        Counts are updated immediately; neighbour lists on the next refresh().
+        """
+        previous = list(previous_history[-self.window:])
+        with self._lock:
+            self._apply(product_id, previous)
+            if self.event_log is not None:
+                # Logged under the lock, so a reload from a new snapshot never sees it half-recorded
+                try:
+                    self.event_log.append(
+                        {"t": time.time(), "w": self.writer_id, "u": user_id, "p": product_id, "prev": previous}
+                    )
+                except OSError as e:
+                    print(f"Error writing view event: {str(e)}")
+
+    def refresh(self):
+        """
+        Apply other workers' logged events and recompute the neighbour lists if anything changed
+
+        Returns:
+        - bool: True if the neighbour lists were recomputed
+        """
+        with self._lock:
+            if self.event_log is not None:
+                snapshot, events = self.event_log.read_new()
+                if snapshot is not None:
+                    # First read or another worker compacted the log: start over from its snapshot,
+                    # replaying our own logged events too since our counts are discarded
+                    self._restore(snapshot)
+                    self._replay(events, own=True)
+                else:
+                    self._replay(events)
+                if self.event_log.needs_compaction():
+                    self._compact()
+            elif self.max_pairs and len(self._pairs) > 2 * self.max_pairs:
+                self._prune()
+            if not self._dirty:
+                return False
+            self._dirty = False
+            keys = np.fromiter(self._pairs.keys(), dtype=np.int64, count=len(self._pairs))
+            counts = np.fromiter(self._pairs.values(), dtype=np.float64, count=len(self._pairs))
+            ids = list(self._ids)
+            views = np.array([self.view_counts.get(pid, 0) for pid in ids], dtype=np.float64)
+        self._neighbours = self._top_neighbours(keys, counts, ids, views)
+        self.refreshed_at = time.time()
+        return True
+
+    def _replay(self, events, own=False):
+        # Caller holds self._lock
+        for event in events:
+            if event.get("p") and (own or event.get("w") != self.writer_id):
+                self._apply(event["p"], event.get("prev") or [])
+
+    def _restore(self, snapshot):
+        """
+        Replace the counts with a snapshot's; caller holds self._lock
+        """
+        ids = [str(pid) for pid in snapshot.get('ids', [])]
+        self._ids = ids
+        self._codes = {pid: code for code, pid in enumerate(ids)}
+        views = snapshot.get('views', np.zeros(0)).tolist()
+        self.view_counts = {pid: count for pid, count in zip(ids, views) if count > 0}
+        self.max_views = max(self.view_counts.values(), default=0)
+        self._pairs = dict(zip(snapshot.get('pair_keys', np.zeros(0, dtype=np.int64)).tolist(),
+                               snapshot.get('pair_counts', np.zeros(0)).tolist()))
+        self._dirty = True
+
+    def _prune(self):
+        """
+        Decay every count and keep the max_pairs largest pair counts; caller holds self._lock
+        """
+        keys = np.fromiter(self._pairs.keys(), dtype=np.int64, count=len(self._pairs))
+        counts = np.fromiter(self._pairs.values(), dtype=np.float64, count=len(self._pairs)) * self.decay
+        keep = counts >= MIN_COUNT
+        if self.max_pairs and keep.sum() > self.max_pairs:
+            keep &= counts >= np.partition(counts, len(counts) - self.max_pairs)[len(counts) - self.max_pairs]
+        keys, counts = keys[keep], counts[keep]
+        if self.decay != 1:
+            self.view_counts = {
+                pid: count * self.decay for pid, count in self.view_counts.items() if count * self.decay >= MIN_COUNT
+            }
+            self.max_views = max(self.view_counts.values(), default=0)
+        # Re-intern the products still referenced so dropped ones free their codes
+        used = np.zeros(len(self._ids), dtype=bool)
+        used[keys >> 32] = True
+        used[keys & 0xFFFFFFFF] = True
+        used[[self._codes[pid] for pid in self.view_counts]] = True
+        remap = np.cumsum(used) - 1
+        self._ids = [pid for pid, keep_id in zip(self._ids, used.tolist()) if keep_id]
+        self._codes = {pid: code for code, pid in enumerate(self._ids)}
+        keys = (remap[keys >> 32] << 32) | remap[keys & 0xFFFFFFFF]
+        self._pairs = dict(zip(keys.tolist(), counts.tolist()))
+        self._dirty = True
+
+    def _snapshot(self):
+        # Caller holds self._lock
+        return {
+            "ids": np.array(self._ids, dtype=str),
+            "views": np.array([self.view_counts.get(pid, 0) for pid in self._ids], dtype=np.float64),
+            "pair_keys": np.fromiter(self._pairs.keys(), dtype=np.int64, count=len(self._pairs)),
+            "pair_counts": np.fromiter(self._pairs.values(), dtype=np.float64, count=len(self._pairs))
+        }
+
+    def _compact(self):
+        """
+        Fold the whole log into a new snapshot and truncate it; caller holds self._lock
+
+        Appenders in other workers wait on the log lock meanwhile, so no
+        event is written between reading the tail and truncating.
+        """
+        try:
+            with self.event_log.exclusive():
+                self._replay(self.event_log.read_tail())
+                self._prune()
+                self.event_log.compact(self._snapshot())
+            self.compactions += 1
+        except OSError as e:
+            print(f"Error compacting view event log: {str(e)}")
+
+    def _top_neighbours(self, keys, counts, ids, views):
+        """
+        Top neighbours per product from symmetric pair counts, as a sparse (CSR-style) ranking
+        """
+        if not len(keys):
+            return {}
+        first = keys >> 32
+        second = keys & 0xFFFFFFFF
+        views = np.maximum(views, 1)
+        # Equal scores rank by product ID
+        id_rank = np.empty(len(ids), dtype=np.int64)
+        id_rank[np.argsort(np.array(ids, dtype=str), kind='stable')] = np.arange(len(ids))
+
+        rows = np.concatenate([first, second])
+        columns = np.concatenate([second, first])
+        scores = np.tile(counts, 2) / np.sqrt(views[rows] * views[columns])
+        order = np.lexsort((id_rank[columns], -scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        starts = np.searchsorted(rows, rows, side='left')
+        keep = (np.arange(len(rows)) - starts) < self.neighbours
+        rows, columns, scores = rows[keep], columns[keep], scores[keep]
+
+        neighbours = {}
+        bounds = np.flatnonzero(np.diff(rows)) + 1
+        for group_rows, group_columns, group_scores in zip(
+            np.split(rows, bounds), np.split(columns, bounds), np.split(scores, bounds)
+        ):
+            neighbours[ids[group_rows[0]]] = [
+                (ids[column], score) for column, score in zip(group_columns.tolist(), group_scores.tolist())
+            ]
+        return neighbours
+
+    def also_viewed(self, product_id, k=10):
+        """
+        Products most often viewed together with product_id, as of the last refresh()
+
+        Returns:
+        - list: (product_id, similarity) tuples, most similar first
+        """
+        return self._neighbours.get(product_id, [])[:k]
+
+    def co_viewed(self, product_ids):
+        """
+        Neighbours of any of product_ids with summed similarities normalized to [0, 1]
+        """
+        totals = {}
+        for product_id in product_ids:
+            for other_id, score in self._neighbours.get(product_id, ()):
+                totals[other_id] = totals.get(other_id, 0.0) + score
+        if not totals:
+            return {}
+        top = max(totals.values())
+        return {other_id: score / top for other_id, score in totals.items()}
+
+    def popularity(self, product_id):
+        """
+        View count normalized to [0, 1] on a log scale
+        """
+        if not self.max_views:
+            return 0.0
+        return math.log1p(self.view_counts.get(product_id, 0)) / math.log1p(self.max_views)
+
+    def stats(self):
+        """
+        Event, product, pair and neighbour-list counts
+        """
+        return {
+            "events": self.events,
+            "products": len(self.view_counts),
+            "pairs": len(self._pairs),
+            "products_with_neighbours": len(self._neighbours),
+            "compactions": self.compactions,
+            "refreshed_at": self.refreshed_at
+        }
+
+
+def create_co_view_model(settings):
+    """
+    Build the co-view model from settings, replaying the event log if there is one
+    """
+    path = settings['CO_VIEW_LOG_PATH']
+    model = CoViewModel(
+        window=settings['CO_BROWSE_WINDOW'],
+        neighbours=settings['CO_VIEW_NEIGHBOURS'],
+        event_log=ViewEventLog(path, settings['CO_VIEW_LOG_MAX_BYTES']) if path else None,
+        max_pairs=settings['CO_VIEW_MAX_PAIRS'],
+        decay=settings['CO_VIEW_DECAY']
+    )
+    model.refresh()
+    return model
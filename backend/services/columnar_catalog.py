@@ -0,0 +1,678 @@
+import copy
+import functools
+import hashlib
+import json
+import mmap
+import operator
+import os
+import shutil
+import sys
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# File in the catalog root naming the current version directory
+CURRENT_FILE = 'CURRENT'
+
+# Decoded products kept per catalog; other rows are decoded on every access
+PRODUCT_CACHE_SIZE = 4096
+
+# Standard product fields in output key order, with how each is stored:
+# text: UTF-8 blob + offsets, string: code into an interned table,
+# number: float64 (NaN when absent), integer: int64, json: JSON text blob,
+# tags: CSR offsets + codes into the interned tag table
+FIELDS = (
+    ('id', 'text'),
+    ('name', 'text'),
+    ('category', 'string'),
+    ('subcategory', 'string'),
+    ('price', 'number'),
+    ('brand', 'string'),
+    ('description', 'text'),
+    ('features', 'json'),
+    ('rating', 'number'),
+    ('inventory', 'integer'),
+    ('tags', 'tags'),
+)
+FIELD_BITS = {field: bit for bit, (field, _) in enumerate(FIELDS)}
+KINDS = dict(FIELDS)
+
+# Presence bits marking number fields that were ints in the source
+INT_BITS = {'price': 1 << len(FIELDS), 'rating': 1 << (len(FIELDS) + 1)}
+
+# Fields that can change without rewriting text or tables
+NUMERIC_FIELDS = ('price', 'rating', 'inventory')
+
+# Fields without a column (or values of an unexpected type) go to a per-product JSON object
+BLOB_FIELDS = ('id', 'name', 'description', 'features', 'extras')
+ARRAYS = (
+    'present', 'price', 'rating', 'inventory', 'category', 'subcategory', 'brand',
+    'tag_offsets', 'tag_codes', 'id_hash', 'id_hash_rows', 'price_order'
+) + tuple(f'{field}_offsets' for field in BLOB_FIELDS)
+TABLES = ('category', 'subcategory', 'brand', 'tags')
+
+
+def _id_hash(product_id):
+    digest = hashlib.blake2b(product_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _fits(kind, value):
+    """
+    Whether a value can be stored in a column of the given kind without changing it
+    """
+    if kind in ('text', 'string'):
+        return isinstance(value, str)
+    if kind == 'number':
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return isinstance(value, float) or abs(value) <= 2 ** 53
+    if kind == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool) and abs(value) < 2 ** 63
+    if kind == 'json':
+        return isinstance(value, list)
+    return isinstance(value, list) and all(isinstance(tag, str) for tag in value)
+
+
+def _dump_json(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def _sorted_unique(values):
+    # Sort and drop repeats; faster than np.unique on large integer arrays
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+
+def _without_numeric(product):
+    return {key: value for key, value in product.items() if key not in NUMERIC_FIELDS}
+
+
+def _encode_products(products):
+    """
+    Encode product dicts into column arrays, blobs and interned tables
+
+    Returns:
+    - tuple: (arrays, blobs, tables)
+    """
+    count = len(products)
+    present = np.zeros(count, dtype=np.uint16)
+    numbers = {
+        'price': np.zeros(count, dtype=np.float64),
+        'rating': np.full(count, np.nan, dtype=np.float64),
+        'inventory': np.zeros(count, dtype=np.int64),
+    }
+    codes = {field: np.full(count, -1, dtype=np.int32) for field in ('category', 'subcategory', 'brand')}
+    tables = {field: {} for field in TABLES}
+    texts = {field: [] for field in BLOB_FIELDS}
+    tag_counts = np.zeros(count, dtype=np.int64)
+    tag_codes = []
+    seen = set()
+
+    for row, product in enumerate(products):
+        product_id = product.get('id')
+        if not isinstance(product_id, str):
+            raise ValueError(f"Product ID {product_id!r} is not a string")
+        if product_id in seen:
+            raise ValueError(f"Duplicate product ID {product_id}")
+        seen.add(product_id)
+
+        mask = 0
+        values = {}
+        extras = {}
+        for key, value in product.items():
+            kind = KINDS.get(key)
+            if kind is None or not _fits(kind, value):
+                extras[key] = value
+                continue
+            mask |= 1 << FIELD_BITS[key]
+            values[key] = value
+            if kind == 'string':
+                codes[key][row] = tables[key].setdefault(value, len(tables[key]))
+            elif kind in ('number', 'integer'):
+                numbers[key][row] = value
+                if isinstance(value, int) and key in INT_BITS:
+                    mask |= INT_BITS[key]
+            elif kind == 'tags':
+                tag_counts[row] = len(value)
+                tag_codes.extend(tables['tags'].setdefault(tag, len(tables['tags'])) for tag in value)
+        present[row] = mask
+        for field in ('id', 'name', 'description'):
+            texts[field].append(values.get(field, ''))
+        texts['features'].append(_dump_json(values['features']) if 'features' in values else '')
+        texts['extras'].append(_dump_json(extras) if extras else '')
+
+    arrays = {'present': present, 'tag_codes': np.array(tag_codes, dtype=np.int32)}
+    arrays.update(numbers)
+    arrays.update(codes)
+    arrays['tag_offsets'] = np.concatenate([[0], np.cumsum(tag_counts)]).astype(np.int64)
+
+    blobs = {}
+    for field in BLOB_FIELDS:
+        encoded = [text.encode('utf-8') for text in texts[field]]
+        lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=count)
+        arrays[f'{field}_offsets'] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        blobs[field] = b''.join(encoded)
+
+    hashes = np.fromiter((_id_hash(pid) for pid in texts['id']), dtype=np.uint64, count=count)
+    order = np.argsort(hashes, kind='stable')
+    arrays['id_hash'] = hashes[order]
+    arrays['id_hash_rows'] = order.astype(np.int64)
+    arrays['price_order'] = np.argsort(numbers['price'], kind='stable').astype(np.int64)
+    return arrays, blobs, {field: list(table) for field, table in tables.items()}
+
+
+def _write_meta(path, version, count, tables):
+    with open(os.path.join(path, 'meta.json'), 'w') as file:
+        json.dump({"format": FORMAT_VERSION, "version": version, "count": count, "tables": tables}, file)
+
+
+def _link_or_copy(source, target):
+    # Version directories are never modified in place, so unchanged files can be shared
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _map_blob(path):
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_catalog(products, root, version):
+    """
+    Write a catalog as a new columnar version under root and make it current
+
+    The version is staged in a temporary directory, renamed into place and
+    then published by atomically replacing the CURRENT pointer, so readers
+    never see a partial catalog. Writing a ColumnarCatalog only rewrites its
+    modified columns; everything else is hard-linked. Versions older than the
+    previous one are removed (processes still mapping them keep their pages).
+
+    Parameters:
+    - products (list or ColumnarCatalog): Full product catalog
+    - root (str): Catalog directory
+    - version (str): Catalog version, also used as the directory name
+
+    Returns:
+    - str: Path of the version directory
+    """
+    os.makedirs(root, exist_ok=True)
+    version = str(version)
+    target = os.path.join(root, version)
+    if not os.path.isdir(target):
+        staging = os.path.join(root, f".{version}.{os.getpid()}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        try:
+            if isinstance(products, ColumnarCatalog):
+                products.write_to(staging, version)
+            else:
+                arrays, blobs, tables = _encode_products(products)
+                for name, array in arrays.items():
+                    np.save(os.path.join(staging, f'{name}.npy'), array)
+                for name, blob in blobs.items():
+                    with open(os.path.join(staging, f'{name}.bin'), 'wb') as file:
+                        file.write(blob)
+                _write_meta(staging, version, len(products), tables)
+            os.rename(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(target):
+                raise
+    if isinstance(products, ColumnarCatalog) and products.version == version:
+        # Later saves can link from the new directory instead of the one it was loaded from
+        products.path, products.modified = target, set()
+
+    pointer = os.path.join(root, CURRENT_FILE)
+    previous = _read_pointer(root)
+    temp_path = f"{pointer}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as file:
+        file.write(version)
+    os.replace(temp_path, pointer)
+
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name not in (version, previous) and not name.startswith('.') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return target
+
+
+def _read_pointer(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+class _RowLookup(Mapping):
+    """
+    Read-only product ID -> row mapping backed by the sorted ID hash column
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, product_id):
+        row = self.catalog.row_of(product_id)
+        if row is None:
+            raise KeyError(product_id)
+        return row
+
+    def __contains__(self, product_id):
+        return self.catalog.row_of(product_id) is not None
+
+    def __iter__(self):
+        return iter(self.catalog.ids())
+
+    def __len__(self):
+        return len(self.catalog)
+
+
+class _ProductLookup(_RowLookup):
+    """
+    Read-only product ID -> product mapping
+    """
+
+    def __getitem__(self, product_id):
+        return self.catalog[super().__getitem__(product_id)]
+
+
+class ColumnarCatalog(Sequence):
+    """
+    Read-only product catalog stored as memory-mapped columns
+
+    Numeric fields are .npy columns, category, subcategory, brand and tags are
+    codes into interned string tables, and names, descriptions and features
+    are UTF-8 blobs. Opening a catalog maps the files without reading them, so
+    startup cost does not grow with catalog size and every worker process
+    shares the same pages through the OS page cache.
+
+    The catalog behaves as a list of product dicts: products are decoded from
+    the columns when accessed, and the most recently used ones are cached.
+    """
+
+    def __init__(self, path):
+        """
+        Open one catalog version directory
+
+        Parameters:
+        - path (str): Version directory written by write_catalog()
+        """
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        if meta.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar catalog format {meta.get('format')}")
+        self.path = path
+        self.version = meta['version']
+        self.tables = meta['tables']
+        self.columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        self.blobs = {name: _map_blob(os.path.join(path, f'{name}.bin')) for name in BLOB_FIELDS}
+        # Columns changed in memory since the catalog was opened
+        self.modified = set()
+        self._reset_caches()
+
+    @classmethod
+    def open(cls, root):
+        """
+        Open the current version of a catalog directory (or a version directory itself)
+        """
+        if os.path.exists(os.path.join(root, 'meta.json')):
+            return cls(root)
+        version = _read_pointer(root)
+        if not version:
+            raise FileNotFoundError(f"No columnar catalog found at {root}")
+        return cls(os.path.join(root, version))
+
+    def _reset_caches(self):
+        self.row_by_id = _RowLookup(self)
+        self._cached_product = functools.lru_cache(maxsize=PRODUCT_CACHE_SIZE)(self._decode)
+
+    def __len__(self):
+        return len(self.columns['present'])
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self._cached_product(i) for i in range(*row.indices(len(self)))]
+        row = operator.index(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("catalog row out of range")
+        return self._cached_product(row)
+
+    def __iter__(self):
+        # Full scans bypass the cache so they do not evict hot products
+        for row in range(len(self)):
+            yield self._decode(row)
+
+    def _text(self, field, row):
+        offsets = self.columns[f'{field}_offsets']
+        return self.blobs[field][int(offsets[row]):int(offsets[row + 1])].decode('utf-8')
+
+    def _decode(self, row):
+        columns = self.columns
+        mask = int(columns['present'][row])
+        product = {}
+        for bit, (field, kind) in enumerate(FIELDS):
+            if not mask & (1 << bit):
+                continue
+            if kind == 'text':
+                product[field] = self._text(field, row)
+            elif kind == 'string':
+                product[field] = self.tables[field][columns[field][row]]
+            elif kind == 'number':
+                value = float(columns[field][row])
+                product[field] = int(value) if mask & INT_BITS[field] else value
+            elif kind == 'integer':
+                product[field] = int(columns[field][row])
+            elif kind == 'json':
+                product[field] = json.loads(self._text(field, row))
+            else:
+                start, end = columns['tag_offsets'][row:row + 2]
+                table = self.tables['tags']
+                product[field] = [table[code] for code in columns['tag_codes'][start:end].tolist()]
+        extras = self._text('extras', row)
+        if extras:
+            product.update(json.loads(extras))
+        return product
+
+    def row_of(self, product_id):
+        """
+        Row of a product ID, or None if it is not in the catalog
+        """
+        if not isinstance(product_id, str):
+            return None
+        hashes = self.columns['id_hash']
+        target = np.uint64(_id_hash(product_id))
+        i = int(np.searchsorted(hashes, target))
+        while i < len(hashes) and hashes[i] == target:
+            row = int(self.columns['id_hash_rows'][i])
+            if self._text('id', row) == product_id:
+                return row
+            i += 1
+        return None
+
+    def ids(self):
+        """
+        Product IDs in catalog order, without decoding the products
+        """
+        offsets = self.columns['id_offsets'].tolist()
+        blob = self.blobs['id']
+        return [blob[offsets[row]:offsets[row + 1]].decode('utf-8') for row in range(len(self))]
+
+    def codes(self, field):
+        """
+        Interned code per row for category, subcategory or brand; missing values get len(table)
+        """
+        codes = self.columns[field]
+        return np.where(codes < 0, len(self.tables[field]), codes).astype(np.int32)
+
+    def numeric(self, field):
+        """
+        Float column for price, rating or inventory, NaN where a product has no value
+        """
+        present = (np.asarray(self.columns['present']) & (1 << FIELD_BITS[field])) != 0
+        return np.where(present, self.columns[field], np.nan).astype(np.float64)
+
+    def tag_entries(self):
+        """
+        Parallel (row, tag code) arrays with one entry per tag occurrence
+        """
+        offsets = self.columns['tag_offsets']
+        rows = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(offsets))
+        return rows, np.asarray(self.columns['tag_codes'], dtype=np.int32)
+
+    def scoring_columns(self):
+        """
+        Column arrays for ScoringEngine, built without decoding any product
+        """
+        tag_rows, tag_codes = self.tag_entries()
+        if len(tag_rows):
+            # Tags are de-duplicated per product, as ScoringEngine does
+            pairs = _sorted_unique(tag_rows.astype(np.int64) * len(self.tables['tags']) + tag_codes)
+            tag_rows = (pairs // len(self.tables['tags'])).astype(np.int32)
+            tag_codes = (pairs % len(self.tables['tags'])).astype(np.int32)
+        return {
+            "row_by_id": self.row_by_id,
+            "category_vocab": {value: code for code, value in enumerate(self.tables['category'])},
+            "category_codes": self.codes('category'),
+            "brand_vocab": {value: code for code, value in enumerate(self.tables['brand'])},
+            "brand_codes": self.codes('brand'),
+            "prices": np.asarray(self.columns['price'], dtype=np.float64),
+            "tag_vocab": {value: code for code, value in enumerate(self.tables['tags'])},
+            "tag_rows": tag_rows,
+            "tag_codes": tag_codes,
+        }
+
+    def numeric_only(self, row, product):
+        """
+        Whether product differs from the one at row only in columnar numeric fields
+        """
+        old = self._decode(row)
+        mask = int(self.columns['present'][row])
+        for field in NUMERIC_FIELDS:
+            if field in old and not mask & (1 << FIELD_BITS[field]):
+                # The old value lives in the extras blob
+                return False
+            if field in product and not _fits(KINDS[field], product[field]):
+                return False
+        return _dump_json(_without_numeric(old)) == _dump_json(_without_numeric(product))
+
+    def with_numeric(self, updates, version):
+        """
+        New catalog with price, rating and inventory replaced for some rows
+
+        Only the touched columns are copied into memory; blobs, tables and
+        other columns stay shared with this catalog.
+
+        Parameters:
+        - updates (dict): Row -> product dict holding the new numeric values
+        - version (str): Version of the new catalog
+
+        Returns:
+        - ColumnarCatalog
+        """
+        new = copy.copy(self)
+        new.version = version
+        new.columns = dict(self.columns)
+        new.modified = set(self.modified)
+        present = np.array(self.columns['present'])
+        changed = {field: np.array(self.columns[field]) for field in NUMERIC_FIELDS}
+        for row, product in updates.items():
+            mask = int(present[row])
+            for field, column in changed.items():
+                bit = 1 << FIELD_BITS[field]
+                mask &= ~(bit | INT_BITS.get(field, 0))
+                if field in product:
+                    column[row] = product[field]
+                    mask |= bit
+                    if isinstance(product[field], int) and field in INT_BITS:
+                        mask |= INT_BITS[field]
+            present[row] = mask
+        new.columns['present'] = present
+        new.columns.update(changed)
+        new.modified.add('present')
+        new.modified.update(changed)
+        if 'price' in changed:
+            new.columns['price_order'] = np.argsort(changed['price'], kind='stable').astype(np.int64)
+            new.modified.add('price_order')
+        new._reset_caches()
+        return new
+
+    def write_to(self, path, version):
+        """
+        Write this catalog into an empty directory, linking unmodified files
+        """
+        for name in ARRAYS:
+            target = os.path.join(path, f'{name}.npy')
+            if name in self.modified:
+                np.save(target, self.columns[name])
+            else:
+                _link_or_copy(os.path.join(self.path, f'{name}.npy'), target)
+        for name in BLOB_FIELDS:
+            _link_or_copy(os.path.join(self.path, f'{name}.bin'), os.path.join(path, f'{name}.bin'))
+        _write_meta(path, version, len(self), self.tables)
+
+
+class ColumnarCatalogIndex:
+    """
+    CatalogIndex counterpart for a ColumnarCatalog
+
+    Lookups run on the columns: IDs through the sorted ID hash column,
+    category, subcategory, brand and tag buckets through code arrays grouped
+    on first use, and price ranges through the stored price order. Matching
+    products are decoded only when returned.
+    """
+
+    def __init__(self, catalog):
+        """
+        Parameters:
+        - catalog (ColumnarCatalog): Catalog to index
+        """
+        self.products = catalog
+        self.version = catalog.version
+        self.by_id = _ProductLookup(catalog)
+        self._groups = {}
+        self._keys = {}
+        self._price_keys = None
+
+    def __len__(self):
+        return len(self.products)
+
+    @functools.cached_property
+    def categories(self):
+        return self._listing('category')
+
+    @functools.cached_property
+    def brands(self):
+        return self._listing('brand')
+
+    def _listing(self, field):
+        table = self.products.tables[field]
+        counts = np.bincount(self.products.codes(field), minlength=len(table) + 1)
+        return sorted({value for code, value in enumerate(table) if counts[code] and value})
+
+    def apply_changes(self, upserts=(), deletes=(), version=None):
+        """
+        Return a new index with products replaced, added and deleted
+
+        Price, rating and inventory changes to existing products stay
+        columnar. Any other change materializes the catalog into an in-memory
+        CatalogIndex; saving it writes a new columnar version.
+        """
+        from services.catalog_index import CatalogIndex
+
+        upserts = list(upserts)
+        deletes = [pid for pid in deletes if pid in self.by_id]
+        rows = [self.products.row_of(product['id']) for product in upserts]
+        if not deletes and all(row is not None and self.products.numeric_only(row, product)
+                               for row, product in zip(rows, upserts)):
+            updates = dict(zip(rows, upserts))
+            return ColumnarCatalogIndex(self.products.with_numeric(updates, version))
+        materialized = CatalogIndex(list(self.products), self.version)
+        return materialized.apply_changes(upserts, deletes, version)
+
+    @staticmethod
+    def _key(value):
+        return value.lower() if isinstance(value, str) else value
+
+    def _group(self, field):
+        """
+        Rows sorted by code (catalog order within a code) and the bounds of each code
+        """
+        if field not in self._groups:
+            if field == 'tags':
+                entry_rows, codes = self.products.tag_entries()
+            else:
+                codes = self.products.codes(field)
+                entry_rows = np.arange(len(codes))
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(self.products.tables[field]) + 1))
+            keys = {}
+            for code, value in enumerate(self.products.tables[field]):
+                keys.setdefault(self._key(value), []).append(code)
+            self._keys[field] = keys
+            self._groups[field] = (entry_rows[order], bounds)
+        return self._groups[field]
+
+    def _bucket(self, field, value):
+        rows, bounds = self._group(field)
+        codes = self._keys[field].get(self._key(value), [])
+        if not codes:
+            return []
+        selected = np.concatenate([rows[bounds[code]:bounds[code + 1]] for code in codes])
+        if len(codes) > 1 or field == 'tags':
+            selected = _sorted_unique(selected)
+        return [self.products[row] for row in selected.tolist()]
+
+    def get(self, product_id):
+        """
+        Get a product by ID, or None if it does not exist
+        """
+        row = self.products.row_of(product_id)
+        return None if row is None else self.products[row]
+
+    def get_many(self, product_ids):
+        """
+        Get the products for a list of IDs, skipping unknown IDs and keeping order
+        """
+        products = (self.get(pid) for pid in product_ids)
+        return [product for product in products if product is not None]
+
+    def with_category(self, category):
+        """
+        Get products in a category, in catalog order
+        """
+        return self._bucket('category', category)
+
+    def with_subcategory(self, subcategory):
+        """
+        Get products in a subcategory, in catalog order
+        """
+        return self._bucket('subcategory', subcategory)
+
+    def with_brand(self, brand):
+        """
+        Get products of a brand, in catalog order
+        """
+        return self._bucket('brand', brand)
+
+    def with_tag(self, tag):
+        """
+        Get products carrying a tag, in catalog order
+        """
+        return self._bucket('tags', tag)
+
+    def in_price_range(self, min_price=0, max_price=float('inf')):
+        """
+        Get products with min_price <= price <= max_price, ordered by price
+        """
+        order = self.products.columns['price_order']
+        if self._price_keys is None:
+            self._price_keys = np.asarray(self.products.columns['price'])[order]
+        lo = int(np.searchsorted(self._price_keys, min_price, side='left'))
+        hi = int(np.searchsorted(self._price_keys, max_price, side='right'))
+        return [self.products[row] for row in order[lo:hi].tolist()]
+
+
+if __name__ == "__main__":
+    # Offline conversion: python -m services.columnar_catalog [data_path] [catalog_path]
+    from config import config
+    from services.product_service import ProductService
+
+    config['CATALOG_FORMAT'] = 'json'
+    if len(sys.argv) > 1:
+        config['DATA_PATH'] = sys.argv[1]
+    product_service = ProductService()
+    if not product_service.version:
+        sys.exit(f"No valid catalog at {config['DATA_PATH']}")
+    output_path = sys.argv[2] if len(sys.argv) > 2 else config['CATALOG_COLUMNAR_PATH']
+    written = write_catalog(product_service.get_all_products(), output_path, product_service.version)
+    print(f"Wrote {len(product_service.get_all_products())} products to {written}")
@@ -0,0 +1,285 @@
+import functools
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Relative weight of each product field in its embedding
+FIELD_WEIGHTS = (
+    ('name', 2.0),
+    ('category', 1.5),
+    ('subcategory', 1.5),
+    ('brand', 1.0),
+    ('tags', 2.0),
+    ('features', 1.0),
+    ('description', 1.0),
+)
+
+
+def tokenize(text):
+    """
+    Split text into lowercase alphanumeric tokens
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _bucket(token, dim):
+    """
+    Deterministic hash bucket and sign for a token (stable across processes)
+    """
+    digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+    value = int.from_bytes(digest, 'little')
+    return value % dim, 1.0 if (value >> 63) & 1 else -1.0
+
+
+def _field_text(value):
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(v) for v in value)
+    return str(value) if value is not None else ''
+
+
+def preference_text(user_preferences):
+    """
+    Free text of a user's stated preferences, for text matching
+
+    Price ranges are numeric constraints, not text signal, so they are left out.
+    """
+    return ' '.join(
+        _field_text(value) for key, value in (user_preferences or {}).items()
+        if not isinstance(value, dict) and 'price' not in key.lower()
+    )
+
+
+def _term_counts(weighted_texts, dim):
+    """
+    Weighted term counts per (bucket, sign) for a list of (text, weight) pairs
+    """
+    counts = {}
+    for text, weight in weighted_texts:
+        for token in tokenize(text):
+            key = _bucket(token, dim)
+            counts[key] = counts.get(key, 0.0) + weight
+    return counts
+
+
+class EmbeddingIndex:
+    """
+    Dense retrieval index over the product catalog
+
+    Products are embedded with a deterministic hashing TF-IDF scheme over their
+    name, category, brand, tags, features and description, so no model download
+    is needed. Vectors are L2-normalized float32 rows stored in a .npy file and
+    memory-mapped on load, letting every worker share the same pages.
+    """
+
+    def __init__(self, vectors, idf, product_ids, catalog_version=None):
+        """
+        Parameters:
+        - vectors (numpy.ndarray): One normalized embedding row per product
+        - idf (numpy.ndarray): Inverse document frequency per hash bucket
+        - product_ids (list): Product ID for each row
+        - catalog_version (str, optional): Catalog version the index was built from
+        """
+        self.vectors = vectors
+        self.idf = idf
+        self.dim = vectors.shape[1]
+        self.product_ids = product_ids
+        self.row_by_id = {pid: row for row, pid in enumerate(product_ids)}
+        self.catalog_version = catalog_version
+
+    @classmethod
+    def build(cls, products, dim=256, catalog_version=None):
+        """
+        Embed every product in the catalog
+
+        Parameters:
+        - products (list): Full product catalog
+        - dim (int): Embedding dimension (number of hash buckets)
+        - catalog_version (str, optional): Catalog version to record
+
+        Returns:
+        - EmbeddingIndex
+        """
+        doc_counts = [
+            _term_counts([(_field_text(p.get(field)), weight) for field, weight in FIELD_WEIGHTS], dim)
+            for p in products
+        ]
+
+        document_frequency = np.zeros(dim, dtype=np.float64)
+        for counts in doc_counts:
+            for bucket in {bucket for bucket, _ in counts}:
+                document_frequency[bucket] += 1
+        idf = np.log((1 + len(products)) / (1 + document_frequency)) + 1
+
+        vectors = np.zeros((len(products), dim), dtype=np.float32)
+        for row, counts in enumerate(doc_counts):
+            for (bucket, sign), count in counts.items():
+                vectors[row, bucket] += sign * (1 + math.log(count)) * idf[bucket]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        vectors /= norms
+
+        return cls(vectors, idf.astype(np.float32), [p['id'] for p in products], catalog_version)
+
+    def save(self, path):
+        """
+        Write the index to a directory (vectors.npy, idf.npy, meta.json)
+
+        Files are replaced rather than rewritten, so processes that have the
+        previous index memory-mapped keep reading intact files, and meta.json
+        is replaced last.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, array in (('vectors', np.ascontiguousarray(self.vectors)), ('idf', self.idf)):
+            temp_path = os.path.join(path, f'.{name}.{os.getpid()}.npy')
+            np.save(temp_path, array)
+            os.replace(temp_path, os.path.join(path, f'{name}.npy'))
+        temp_path = os.path.join(path, f'.meta.{os.getpid()}.json')
+        with open(temp_path, 'w') as file:
+            json.dump({
+                "catalog_version": self.catalog_version,
+                "dim": self.dim,
+                "product_ids": self.product_ids
+            }, file)
+        os.replace(temp_path, os.path.join(path, 'meta.json'))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index written by save(), memory-mapping the vector matrix
+        """
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        idf = np.load(os.path.join(path, 'idf.npy'))
+        if vectors.shape != (len(meta['product_ids']), meta['dim']) or idf.shape != (meta['dim'],):
+            # Another process replaced the arrays between our reads
+            raise ValueError("Embedding index files do not match their metadata")
+        return cls(vectors, idf, meta['product_ids'], meta.get('catalog_version'))
+
+    def matches(self, products):
+        """
+        Whether the index rows line up with the given catalog
+        """
+        if hasattr(products, 'ids'):
+            # Columnar catalogs list their IDs without decoding every product
+            return products.ids() == self.product_ids
+        return len(products) == len(self.product_ids) and all(
+            p['id'] == pid for p, pid in zip(products, self.product_ids)
+        )
+
+    def encode_text(self, text):
+        """
+        Embed free text into the index space (unnormalized)
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for (bucket, sign), count in _term_counts([(text, 1.0)], self.dim).items():
+            vector[bucket] += sign * (1 + math.log(count)) * self.idf[bucket]
+        return vector
+
+    def user_vector(self, user_preferences, browsed_products):
+        """
+        Build a query vector from browsing history and stated preferences
+
+        The mean of the browsed products' embeddings and the embedding of the
+        preference values are normalized and weighted equally.
+
+        Returns:
+        - numpy.ndarray or None: Normalized query vector, None if there is no signal
+        """
+        parts = []
+        rows = [self.row_by_id[p['id']] for p in browsed_products if p['id'] in self.row_by_id]
+        if rows:
+            parts.append(np.asarray(self.vectors[rows]).mean(axis=0))
+
+        text = preference_text(user_preferences)
+        if text.strip():
+            parts.append(self.encode_text(text))
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for part in parts:
+            norm = np.linalg.norm(part)
+            if norm > 0:
+                vector += part / norm
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def similarities(self, vector):
+        """
+        Cosine similarity of every product to a normalized query vector
+        """
+        return self.vectors @ vector
+
+    def search(self, vector, k, exclude_ids=()):
+        """
+        Top-k products by cosine similarity
+
+        Parameters:
+        - vector (numpy.ndarray): Normalized query vector
+        - k (int): Number of results
+        - exclude_ids (iterable): Product IDs to leave out
+
+        Returns:
+        - list: (row, similarity) tuples, most similar first
+        """
+        sims = np.array(self.similarities(vector), dtype=np.float32)
+        excluded = [self.row_by_id[pid] for pid in exclude_ids if pid in self.row_by_id]
+        if excluded:
+            sims[excluded] = -np.inf
+        k = min(k, len(sims) - len(excluded))
+        if k <= 0:
+            return []
+        rows = np.argpartition(-sims, k - 1)[:k]
+        rows = rows[np.argsort(-sims[rows], kind='stable')]
+        return [(int(row), float(sims[row])) for row in rows]
+
+
+def load_or_build_index(products, path, dim=256, catalog_version=None):
+    """
+    Load the on-disk index if it matches the catalog, otherwise build and save it
+
+    Parameters:
+    - products (list): Full product catalog
+    - path (str): Index directory
+    - dim (int): Embedding dimension for a fresh build
+    - catalog_version (str, optional): Expected catalog version
+
+    Returns:
+    - EmbeddingIndex
+    """
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        try:
+            index = EmbeddingIndex.load(path)
+            if index.catalog_version == catalog_version and index.dim == dim and index.matches(products):
+                return index
+        except Exception as e:
+            print(f"Error loading embedding index: {str(e)}")
+
+    index = EmbeddingIndex.build(products, dim, catalog_version)
+    try:
+        index.save(path)
+        return EmbeddingIndex.load(path)
+    except Exception as e:
+        print(f"Error saving embedding index: {str(e)}")
+        return index
+
+
+if __name__ == "__main__":
+    # Offline build: python -m services.embedding_index [data_path] [index_path]
+    from config import config
+    from services.product_service import ProductService
+
+    if len(sys.argv) > 1:
+        config['DATA_PATH'] = sys.argv[1]
+    product_service = ProductService()
+    output_path = sys.argv[2] if len(sys.argv) > 2 else config['EMBEDDING_INDEX_PATH']
+    built = EmbeddingIndex.build(product_service.get_all_products(), config['EMBEDDING_DIM'], product_service.version)
+    built.save(output_path)
+    print(f"Embedded {len(built.product_ids)} products ({built.dim} dims) into {output_path}")
@@ -0,0 +1,121 @@
+import hashlib
+import json
+
+from services.prompt_builder import render_candidate
+from services.recommendation_cache import DiskCacheBackend, InMemoryCacheBackend, _canonical_value, call_backend
+from services.segment_materializer import segment_of
+
+
+class ExplanationCache:
+    """
+    Short LLM explanations keyed by (product, preference segment) and shared across users
+
+    Explanations are written for the segment's representative preferences
+    (see services.segment_materializer.segment_of), never for one user's
+    browsing history, so every user in the segment can reuse them.
+    Preferences that do not form a segment are keyed by their normalized
+    form instead. Keys include a hash of the product fields the LLM saw, so
+    a product whose name, price, tags or features change is explained again.
+
+    get_many(), put_many() and stats() are coroutines; each makes one trip
+    to the backend's thread (see services.recommendation_cache.call_backend).
+    """
+
+    def __init__(self, backend, ttl=86400, price_bands=()):
+        """
+        Parameters:
+        - backend: Storage backend implementing get/set/clear/__len__ (see services.recommendation_cache)
+        - ttl (float): Seconds an explanation stays valid
+        - price_bands (list): Ascending price band edges used to form segments
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.price_bands = list(price_bands)
+        self.hits = 0
+        self.misses = 0
+
+    def segment(self, user_preferences):
+        """
+        Segment key and the preferences explanations for it are written against
+
+        Returns:
+        - tuple: (segment key, preferences)
+        """
+        segment = segment_of(user_preferences, self.price_bands)
+        if segment is not None:
+            return segment
+        preferences = _canonical_value(None, user_preferences or {})
+        return json.dumps(preferences, sort_keys=True, separators=(',', ':'), default=str), user_preferences or {}
+
+    def _key(self, segment_key, product):
+        fingerprint = render_candidate(product, "compact")
+        return hashlib.sha256(f"{segment_key}\n{fingerprint}".encode('utf-8')).hexdigest()
+
+    async def get_many(self, segment_key, products):
+        """
+        Cached explanations of products for a segment
+
+        Returns:
+        - dict: Explanation per product ID, for the products that have one
+        """
+        keys = [self._key(segment_key, product) for product in products]
+        values = await call_backend(self.backend, lambda: [self.backend.get(key) for key in keys])
+        found = {}
+        for product, explanation in zip(products, values):
+            if explanation is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                found[product['id']] = explanation
+        return found
+
+    async def put_many(self, segment_key, products, explanations):
+        """
+        Store explanations (keyed by product ID) for the given products
+        """
+        entries = [
+            (self._key(segment_key, product), explanations[product['id']])
+            for product in products if explanations.get(product['id'])
+        ]
+
+        def write():
+            for key, explanation in entries:
+                self.backend.set(key, explanation, self.ttl)
+
+        if entries:
+            await call_backend(self.backend, write)
+
+    async def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": await call_backend(self.backend, len, self.backend)
+        }
+
+
+def create_explanation_cache(settings):
+    """
+    Build the explanation cache described by the config, or None if disabled
+
+    Parameters:
+    - settings (dict): Application config
+
+    Returns:
+    - ExplanationCache or None
+    """
+    backend_name = settings['EXPLANATION_CACHE_BACKEND'].lower()
+    if backend_name in ('none', 'off', ''):
+        return None
+    if backend_name == 'disk':
+        backend = DiskCacheBackend(settings['EXPLANATION_CACHE_PATH'], settings['EXPLANATION_CACHE_MAX_ENTRIES'])
+    elif backend_name == 'memory':
+        backend = InMemoryCacheBackend(settings['EXPLANATION_CACHE_MAX_ENTRIES'])
+    else:
+        raise ValueError(f"Unknown EXPLANATION_CACHE_BACKEND: {settings['EXPLANATION_CACHE_BACKEND']}")
+    price_bands = [float(edge) for edge in settings['SEGMENT_PRICE_BANDS'].split(',') if edge.strip()]
+    return ExplanationCache(backend, settings['EXPLANATION_CACHE_TTL'], price_bands)
@@ -0,0 +1,103 @@
+from services.co_view_model import CoViewModel
+
+
+class FallbackRecommender:
+    """
+    Deterministic local recommender used when the LLM is slow or failing
+
+    Ranks with the same vectorized relevance scores as the LLM candidate
+    filter, boosted by co-view and popularity signals, and writes templated
+    explanations from the matched criteria. Runs in a few milliseconds.
+    """
+
+    def __init__(self, signals=None, count=5, co_browse_weight=2.0, popularity_weight=1.0):
+        """
+        Parameters:
+        - signals (CoViewModel, optional): Co-view neighbours and popularity counts
+        - count (int): Number of recommendations to return
+        - co_browse_weight (float): Score added for the most co-browsed product
+        - popularity_weight (float): Score added for the most viewed product
+        """
+        self.signals = signals or CoViewModel()
+        self.count = count
+        self.co_browse_weight = co_browse_weight
+        self.popularity_weight = popularity_weight
+
+    def recommend(self, engine, criteria, browsed_products):
+        """
+        Recommend products locally
+
+        Parameters:
+        - engine (ScoringEngine): Scoring engine for the current catalog
+        - criteria (dict): Relevance criteria from LLMService._relevance_criteria
+        - browsed_products (list): Products the user has viewed
+
+        Returns:
+        - dict: Recommendations in the same shape as the LLM path
+        """
+        scores = engine.score(**criteria)
+
+        browsed_ids = [p['id'] for p in browsed_products]
+        co_browsed = self.signals.co_viewed(browsed_ids)
+        for product_id, weight in co_browsed.items():
+            row = engine.row_by_id.get(product_id)
+            if row is not None and product_id not in criteria["exclude_ids"]:
+                scores[row] += self.co_browse_weight * weight
+
+        # Popularity only reorders the relevant shortlist, so it stays O(k)
+        shortlist = engine.top_k(scores, self.count * 4)
+        ranked = sorted(
+            ((float(scores[row]) + self.popularity_weight * self.signals.popularity(engine.products[row]['id']), int(row))
+             for row in shortlist),
+            key=lambda item: (-item[0], item[1])
+        )[:self.count]
+
+        return self.explain_ranked(
+            [(score, engine.products[row]) for score, row in ranked], criteria, co_browsed
+        )
+
+    def explain_ranked(self, ranked, criteria, co_browsed):
+        """
+        Recommendations with templated explanations for already ranked products
+
+        Parameters:
+        - ranked (list): (score, product) tuples, best first
+        - criteria (dict): Relevance criteria from LLMService._relevance_criteria
+        - co_browsed (dict): Co-view weight per product ID
+
+        Returns:
+        - dict: Recommendations in the same shape as the LLM path, confidence scaled to the best score
+        """
+        best = ranked[0][0] if ranked else 1.0
+        recommendations = []
+        for score, product in ranked:
+            recommendations.append({
+                "product": product,
+                "explanation": self._explain(product, criteria, co_browsed.get(product['id'], 0)),
+                "confidence_score": max(1, min(10, round(10 * score / best))) if best > 0 else 1
+            })
+        return {
+            "recommendations": recommendations,
+            "count": len(recommendations)
+        }
+
+    def _explain(self, product, criteria, co_browse_weight):
+        """
+        Templated explanation listing why a product was picked
+        """
+        reasons = []
+        if product.get('category') in criteria["relevant_categories"]:
+            reasons.append(f"It matches your interest in {product['category']}.")
+        if product.get('brand') in criteria["relevant_brands"]:
+            reasons.append(f"It's from {product['brand']}, a brand you've shown interest in.")
+        if criteria["min_price"] > 0 or criteria["max_price"] != float('inf'):
+            if criteria["min_price"] <= product['price'] <= criteria["max_price"]:
+                reasons.append(f"At ${product['price']} it fits your preferred price range.")
+        shared_tags = sorted(set(product.get('tags', [])) & criteria["relevant_tags"])
+        if shared_tags:
+            reasons.append(f"It shares {', '.join(shared_tags[:3])} with products you viewed.")
+        if co_browse_weight > 0:
+            reasons.append("Shoppers who viewed the same products often looked at this one too.")
+        if not reasons:
+            reasons.append(f"It's a well-rated {product.get('subcategory') or product['category']} pick.")
+        return " ".join(reasons)
@@ -0,0 +1,146 @@
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the standard library encoder
+    orjson = None
+
+
+def dumps(value):
+    """
+    Encode a value as compact UTF-8 JSON bytes, with orjson when it is installed
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # Integers beyond 64 bits and other types orjson rejects
+            pass
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+
+class RawJSON:
+    """
+    Already-encoded JSON, inserted verbatim by encode()
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def encode(value):
+    """
+    Encode a value as JSON bytes, splicing in RawJSON fragments without re-encoding them
+
+    Only the dicts and lists that contain fragments are walked in Python;
+    everything else is handed to dumps() whole.
+    """
+    parts = []
+    _encode_into(value, parts)
+    return b''.join(parts)
+
+
+def _contains_raw(value):
+    if isinstance(value, RawJSON):
+        return True
+    if isinstance(value, dict):
+        return any(_contains_raw(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_contains_raw(v) for v in value)
+    return False
+
+
+def _encode_into(value, parts):
+    if isinstance(value, RawJSON):
+        parts.append(value.data)
+    elif not _contains_raw(value):
+        parts.append(dumps(value))
+    elif isinstance(value, dict):
+        parts.append(b'{')
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                parts.append(b',')
+            parts.append(dumps(str(key)))
+            parts.append(b':')
+            _encode_into(item, parts)
+        parts.append(b'}')
+    else:
+        parts.append(b'[')
+        for i, item in enumerate(value):
+            if i:
+                parts.append(b',')
+            _encode_into(item, parts)
+        parts.append(b']')
+
+
+class ProductJSONCache:
+    """
+    Size-bounded LRU of encoded product JSON
+
+    Entries are keyed by product ID and remember the product dict they were
+    encoded from. Catalog snapshots never modify a product in place (a change
+    produces a new dict), so an entry is only served for the very same dict
+    and a new catalog version re-encodes exactly the products it replaced.
+    """
+
+    def __init__(self, max_entries=50000):
+        """
+        Parameters:
+        - max_entries (int): Most products to keep encoded; 0 disables caching
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def product(self, product, fields=None):
+        """
+        Encoded JSON of a product, or of only the given fields (not cached)
+
+        Returns:
+        - RawJSON
+        """
+        if fields:
+            return RawJSON(dumps({field: product[field] for field in fields if field in product}))
+        product_id = product.get('id')
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is not None and entry[0] is product:
+                self._entries.move_to_end(product_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        raw = RawJSON(dumps(product))
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[product_id] = (product, raw)
+                self._entries.move_to_end(product_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return raw
+
+    def products(self, products, fields=None):
+        """
+        Encoded JSON of a list of products
+        """
+        return [self.product(product, fields) for product in products]
+
+    def recommendations(self, recommendations):
+        """
+        Recommendations with their product dicts replaced by cached encodings
+        """
+        return [
+            {**rec, "product": self.product(rec["product"])} if isinstance(rec.get("product"), dict) else rec
+            for rec in recommendations
+        ]
+
+    def stats(self):
+        """
+        Hit/miss counters and current size
+        """
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
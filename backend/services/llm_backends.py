@@ -0,0 +1,500 @@
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+import json
+import time
+
+import httpx
+
+from services.llm_resilience import (
+    BATCH, INTERACTIVE, RETRYABLE_STATUS_CODES, CircuitBreaker, LLMProviderError, PriorityGate, QueueTimeoutError,
+    RateLimiter, backoff_delay, parse_retry_after
+)
+from services.metrics import LLM_LATENCY, LLM_TOKENS
+
+# Weight of the newest sample in a backend's moving average latency
+LATENCY_SMOOTHING = 0.2
+
+
+# Errors from reading a response body that is not the expected JSON shape
+MALFORMED_RESPONSE_ERRORS = (KeyError, IndexError, TypeError, AttributeError, ValueError)
+
+
+class LLMBackend(ABC):
+    """
+    Interface for chat-completion providers
+
+    Implementations own their connection pool, timeout and failure handling,
+    and raise LLMProviderError when a call cannot be completed.
+    """
+
+    name = None
+    cost_per_1k_tokens = 0.0
+    latency = None
+
+    def available(self):
+        """
+        Whether the backend is currently worth trying (e.g. its circuit is not open)
+        """
+        return True
+
+    @abstractmethod
+    async def chat_completion(self, payload, priority=INTERACTIVE, estimated_tokens=0):
+        """
+        Run a chat completion and return the message content
+
+        Parameters:
+        - payload (dict): OpenAI-style request body without "model"
+        - priority (int): INTERACTIVE or BATCH
+        - estimated_tokens (int): Upper bound on tokens used, for rate limiting
+
+        Returns:
+        - str: Content of the first choice
+        """
+
+    @abstractmethod
+    def chat_completion_stream(self, payload, priority=INTERACTIVE, estimated_tokens=0):
+        """
+        Run a streamed chat completion; implementations are async generators yielding content deltas
+        """
+
+    async def aclose(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Backend for any server speaking the OpenAI chat completions API
+
+    Covers the OpenAI API itself and local model servers with an OpenAI-style
+    endpoint (llama.cpp server, vLLM, Ollama), each with its own connection
+    pool, timeout, concurrency gate, rate limiter, retry policy and circuit
+    breaker.
+
+    Each attempt waits for the rate limiter and then for a concurrency slot;
+    both queues serve interactive requests ahead of batch work. The waits
+    and the provider call are each bounded by the timeout. An attempt that
+    times out in the local queues raises QueueTimeoutError, which is not
+    retried and does not count against the provider. Rate limiting, server errors,
+    timeouts and connection errors are retried with jittered exponential
+    backoff that honors Retry-After, and the circuit breaker fails calls fast
+    while the provider is down.
+    """
+
+    def __init__(self, name, api_base, model_name, api_key=None, timeout=30.0, max_connections=100,
+                 max_concurrency=256, max_queue=1024, requests_per_minute=0, tokens_per_minute=0,
+                 max_retries=3, retry_base_delay=0.5, retry_max_delay=10.0, breaker_failures=5,
+                 breaker_reset=30.0, cost_per_1k_tokens=0.0):
+        """
+        Parameters:
+        - name (str): Name used in routes and stats
+        - api_base (str): Base URL up to and including /v1
+        - model_name (str): Model requested from this backend
+        - api_key (str, optional): Bearer token; local servers usually need none
+        - timeout (float): Seconds allowed per attempt for the provider, and separately for the waits for rate limits and a slot
+        - max_connections (int): Size of this backend's connection pool
+        - max_concurrency (int): Calls in flight at once
+        - max_queue (int): Calls waiting for a slot, and for each rate limit (0 means unbounded)
+        - requests_per_minute (int): Client-side request limit (0 disables)
+        - tokens_per_minute (int): Client-side token limit (0 disables)
+        - max_retries (int): Retries after the first attempt
+        - retry_base_delay (float): Backoff before the first retry, doubled per retry
+        - retry_max_delay (float): Longest backoff, and the longest Retry-After honored
+        - breaker_failures (int): Consecutive failures that open the circuit (0 disables)
+        - breaker_reset (float): Seconds the circuit stays open
+        - cost_per_1k_tokens (float): Price used by cost-based routing
+        """
+        self.name = name
+        self.api_base = api_base.rstrip('/')
+        self.model_name = model_name
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.gate = PriorityGate(max_concurrency, max_queue)
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute, max_queue)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.latency = None
+        self._client = None
+
+    def _get_client(self):
+        """
+        Return the backend's async HTTP client, creating it on first use
+        """
+        if self._client is None:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._client = httpx.AsyncClient(
+                base_url=self.api_base,
+                headers=headers,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        """
+        Close the pooled HTTP client
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def available(self):
+        if self.breaker.state != CircuitBreaker.OPEN:
+            return True
+        return time.monotonic() >= self.breaker.opened_at + self.breaker.reset_timeout
+
+    def _record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def _raise_for_status(self, response):
+        """
+        Raise LLMProviderError for an error response, marking which ones are worth retrying
+        """
+        if response.status_code < 400:
+            return
+        raise LLMProviderError(
+            f"{self.name} returned HTTP {response.status_code}: {response.text[:200]}",
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers),
+            retryable=response.status_code in RETRYABLE_STATUS_CODES or response.status_code >= 500
+        )
+
+    def _retry_delay(self, error, attempt):
+        """
+        Record a failed attempt and return the delay before retrying it
+
+        Rate limiting (HTTP 429) and local queue timeouts are not counted as an outage by the circuit breaker.
+
+        Returns:
+        - float or None: Seconds to wait, None if the error should be raised
+        """
+        if error.retryable and error.status_code != 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+        if not error.retryable or attempt >= self.max_retries:
+            return None
+        delay = backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay, error.retry_after)
+        # Don't hold a request longer than we would back off on our own
+        if delay > self.retry_max_delay:
+            return None
+        return delay
+
+    async def _admit(self, priority, estimated_tokens):
+        """
+        Wait for the rate limiter and a concurrency slot, for at most the timeout
+        """
+        try:
+            await asyncio.wait_for(self._acquire(priority, estimated_tokens), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise QueueTimeoutError(self.name, self.timeout)
+
+    async def _acquire(self, priority, estimated_tokens):
+        await self.rate_limiter.acquire(estimated_tokens, priority)
+        await self.gate.acquire(priority)
+
+    async def _completion_attempt(self, payload, priority, estimated_tokens):
+        """
+        One completion request; returns (content, usage dict reported by the provider)
+        """
+        await self._admit(priority, estimated_tokens)
+        try:
+            response = await asyncio.wait_for(
+                self._get_client().post("/chat/completions", json=payload), timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise LLMProviderError(f"{self.name} call timed out after {self.timeout}s")
+        except httpx.TransportError as e:
+            raise LLMProviderError(f"{self.name} connection error: {str(e)}")
+        finally:
+            self.gate.release()
+        self._raise_for_status(response)
+        try:
+            body = response.json()
+            return body["choices"][0]["message"]["content"], body.get("usage") or {}
+        except MALFORMED_RESPONSE_ERRORS as e:
+            # Counted as a provider failure, so it is retried, fails over and trips the breaker
+            raise LLMProviderError(f"{self.name} returned a malformed response: {e!r}")
+
+    async def chat_completion(self, payload, priority=INTERACTIVE, estimated_tokens=0):
+        payload = {**payload, "model": self.model_name}
+        self.calls += 1
+        for attempt in itertools.count():
+            self.breaker.before_call()
+            started_at = time.monotonic()
+            try:
+                content, usage = await self._completion_attempt(payload, priority, estimated_tokens)
+            except LLMProviderError as e:
+                LLM_LATENCY.labels(self.name, "completion", "error").observe(time.monotonic() - started_at)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self.failures += 1
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                self.rate_limiter.settle(estimated_tokens, usage.get("total_tokens"))
+                elapsed = time.monotonic() - started_at
+                self._record_latency(elapsed)
+                LLM_LATENCY.labels(self.name, "completion", "ok").observe(elapsed)
+                LLM_TOKENS.labels(self.name, "prompt").inc(usage.get("prompt_tokens") or 0)
+                LLM_TOKENS.labels(self.name, "completion").inc(usage.get("completion_tokens") or 0)
+                return content
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _stream_attempt(self, payload, priority, estimated_tokens):
+        """
+        One streamed completion request, yielding content deltas
+
+        The concurrency slot is held for the whole stream. The timeout bounds
+        the waits for rate limits and a slot, and separately each read and
+        the total stream duration.
+        """
+        loop = asyncio.get_running_loop()
+        await self._admit(priority, estimated_tokens)
+        deadline = loop.time() + self.timeout
+        try:
+            async with self._get_client().stream("POST", "/chat/completions", json=payload) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    self._raise_for_status(response)
+                async for line in response.aiter_lines():
+                    if loop.time() > deadline:
+                        raise LLMProviderError(f"{self.name} call timed out after {self.timeout}s")
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        choices = json.loads(data).get("choices") or [{}]
+                        delta = choices[0].get("delta", {}).get("content")
+                    except MALFORMED_RESPONSE_ERRORS as e:
+                        raise LLMProviderError(f"{self.name} returned a malformed stream chunk: {e!r}")
+                    if delta:
+                        yield delta
+        except httpx.TimeoutException:
+            raise LLMProviderError(f"{self.name} call timed out after {self.timeout}s")
+        except httpx.TransportError as e:
+            raise LLMProviderError(f"{self.name} connection error: {str(e)}")
+        finally:
+            self.gate.release()
+
+    async def chat_completion_stream(self, payload, priority=INTERACTIVE, estimated_tokens=0):
+        """
+        Streamed variant of chat_completion; failures are retried only until the first delta
+        """
+        payload = {**payload, "model": self.model_name, "stream": True}
+        self.calls += 1
+        for attempt in itertools.count():
+            self.breaker.before_call()
+            started = False
+            started_at = time.monotonic()
+            try:
+                async for delta in self._stream_attempt(payload, priority, estimated_tokens):
+                    if not started:
+                        started = True
+                        self._record_latency(time.monotonic() - started_at)
+                    yield delta
+            except LLMProviderError as e:
+                LLM_LATENCY.labels(self.name, "stream", "error").observe(time.monotonic() - started_at)
+                delay = self._retry_delay(e, attempt)
+                if delay is None or started:
+                    self.failures += 1
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                LLM_LATENCY.labels(self.name, "stream", "ok").observe(time.monotonic() - started_at)
+                return
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "circuit_state": self.breaker.state,
+            "circuit_rejected": self.breaker.rejected,
+            "active_calls": self.gate.active,
+            "queued_calls": self.gate.queued,
+            "queue_rejected": self.gate.rejected,
+            "rate_limit_queued": self.rate_limiter.queued,
+            "rate_limit_rejected": self.rate_limiter.rejected
+        }
+
+
+class LLMRouter:
+    """
+    Sends each call to the best backend of its route, falling back down the route
+
+    Routes are ordered lists of backend names per priority. With the
+    "ordered" strategy backends are tried in the configured order; "latency"
+    tries the backend with the lowest moving-average latency first (untried
+    backends first, so every backend gets measured) and "cost" the cheapest.
+    Backends whose circuit is open are tried last.
+    """
+
+    STRATEGIES = ("ordered", "latency", "cost")
+
+    def __init__(self, backends, routes, strategy="ordered"):
+        """
+        Parameters:
+        - backends (dict): Backend name -> LLMBackend
+        - routes (dict): Priority (INTERACTIVE or BATCH) -> list of backend names
+        - strategy (str): "ordered", "latency" or "cost"
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown LLM routing strategy: {strategy}")
+        for priority, names in routes.items():
+            if not names:
+                raise ValueError(f"No LLM backends configured for priority {priority}")
+            for name in names:
+                if name not in backends:
+                    raise ValueError(f"Unknown LLM backend in route: {name}")
+        self.backends = backends
+        self.routes = routes
+        self.strategy = strategy
+        self.fallbacks = 0
+
+    def candidates(self, priority):
+        """
+        Backends to try for a call, best first
+        """
+        route = [self.backends[name] for name in self.routes[priority]]
+        if self.strategy == "latency":
+            route.sort(key=lambda b: (b.latency is not None, b.latency or 0.0))
+        elif self.strategy == "cost":
+            route.sort(key=lambda b: b.cost_per_1k_tokens)
+        # Stable sort: healthy backends keep their order ahead of open circuits
+        route.sort(key=lambda b: not b.available())
+        return route
+
+    async def chat_completion(self, payload, priority=INTERACTIVE, estimated_tokens=0):
+        last_error = None
+        for backend in self.candidates(priority):
+            if last_error is not None:
+                self.fallbacks += 1
+            try:
+                return await backend.chat_completion(payload, priority, estimated_tokens)
+            except LLMProviderError as e:
+                print(f"LLM backend {backend.name} failed: {str(e)}")
+                last_error = e
+        raise last_error
+
+    async def chat_completion_stream(self, payload, priority=INTERACTIVE, estimated_tokens=0):
+        last_error = None
+        for backend in self.candidates(priority):
+            if last_error is not None:
+                self.fallbacks += 1
+            started = False
+            try:
+                async for delta in backend.chat_completion_stream(payload, priority, estimated_tokens):
+                    started = True
+                    yield delta
+                return
+            except LLMProviderError as e:
+                if started:
+                    raise
+                print(f"LLM backend {backend.name} failed: {str(e)}")
+                last_error = e
+        raise last_error
+
+    async def aclose(self):
+        for backend in self.backends.values():
+            await backend.aclose()
+
+    def stats(self):
+        return {
+            "strategy": self.strategy,
+            "routes": {
+                "interactive": self.routes[INTERACTIVE],
+                "batch": self.routes[BATCH]
+            },
+            "fallbacks": self.fallbacks,
+            "backends": {name: backend.stats() for name, backend in self.backends.items()}
+        }
+
+
+def _route(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def create_llm_router(settings):
+    """
+    Build the LLM backends and router described by the config
+
+    The "openai" backend uses the OPENAI_* and LLM_* settings. A "local"
+    backend is added when LOCAL_LLM_API_BASE is set.
+
+    Parameters:
+    - settings (dict): Application config
+
+    Returns:
+    - LLMRouter
+    """
+    shared = {
+        "max_queue": settings['LLM_QUEUE_MAX'],
+        "retry_base_delay": settings['LLM_RETRY_BASE_DELAY'],
+        "retry_max_delay": settings['LLM_RETRY_MAX_DELAY'],
+        "breaker_failures": settings['LLM_BREAKER_FAILURES'],
+        "breaker_reset": settings['LLM_BREAKER_RESET']
+    }
+    backends = {
+        "openai": OpenAICompatibleBackend(
+            "openai",
+            api_base=settings['OPENAI_API_BASE'],
+            model_name=settings['MODEL_NAME'],
+            api_key=settings['OPENAI_API_KEY'],
+            timeout=settings['LLM_TIMEOUT'],
+            max_connections=settings['LLM_MAX_CONNECTIONS'],
+            max_concurrency=settings['LLM_MAX_CONCURRENCY'],
+            requests_per_minute=settings['LLM_RATE_LIMIT_RPM'],
+            tokens_per_minute=settings['LLM_RATE_LIMIT_TPM'],
+            max_retries=settings['LLM_MAX_RETRIES'],
+            cost_per_1k_tokens=settings['OPENAI_COST_PER_1K_TOKENS'],
+            **shared
+        )
+    }
+    if settings['LOCAL_LLM_API_BASE']:
+        # A local server has no quota to protect; fail over quickly instead of retrying
+        backends["local"] = OpenAICompatibleBackend(
+            "local",
+            api_base=settings['LOCAL_LLM_API_BASE'],
+            model_name=settings['LOCAL_LLM_MODEL'],
+            timeout=settings['LOCAL_LLM_TIMEOUT'],
+            max_connections=settings['LOCAL_LLM_MAX_CONCURRENCY'],
+            max_concurrency=settings['LOCAL_LLM_MAX_CONCURRENCY'],
+            max_retries=1,
+            cost_per_1k_tokens=settings['LOCAL_LLM_COST_PER_1K_TOKENS'],
+            **shared
+        )
+    routes = {
+        INTERACTIVE: _route(settings['LLM_ROUTE_INTERACTIVE']),
+        BATCH: _route(settings['LLM_ROUTE_BATCH'])
+    }
+    return LLMRouter(backends, routes, settings['LLM_ROUTING_STRATEGY'])
@@ -0,0 +1,383 @@
+import asyncio
+import email.utils
+import heapq
+import itertools
+import random
+import time
+
+# Request priorities for PriorityGate; lower values are served first
+INTERACTIVE = 0
+BATCH = 1
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMProviderError(Exception):
+    """
+    Failed call to the LLM provider
+
+    Attributes:
+    - status_code (int or None): HTTP status, None for network errors and timeouts
+    - retry_after (float or None): Seconds the provider asked us to wait
+    - retryable (bool): Whether the same request may succeed if retried
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None, retryable=True):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+class CircuitOpenError(LLMProviderError):
+    """
+    Raised without calling the provider while the circuit breaker is open
+    """
+
+    def __init__(self, retry_in):
+        super().__init__(f"LLM provider circuit open, retrying in {retry_in:.1f}s", retryable=False)
+
+
+class QueueFullError(LLMProviderError):
+    """
+    Raised when the LLM request queue is full (or a queued request was displaced)
+    """
+
+    def __init__(self):
+        super().__init__("LLM request queue is full", retryable=False)
+
+
+class QueueTimeoutError(LLMProviderError):
+    """
+    Raised when a call spent its whole timeout waiting for a rate limit or a concurrency slot
+
+    Local throttling, not a provider failure: it is neither retried nor
+    counted by the circuit breaker.
+    """
+
+    def __init__(self, name, timeout):
+        super().__init__(f"{name} call waited {timeout}s for a rate limit or concurrency slot", retryable=False)
+
+
+def parse_retry_after(headers):
+    """
+    Seconds to wait from Retry-After (seconds or HTTP date) or retry-after-ms headers
+
+    Returns:
+    - float or None: Delay in seconds, None when no usable header is present
+    """
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay, max_delay, retry_after=None):
+    """
+    Delay before retry number `attempt` (0-based)
+
+    Uses exponential backoff with full jitter, so clients that failed together
+    do not retry together. A provider Retry-After is used as a lower bound.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class _BucketWaiter:
+    __slots__ = ('priority', 'order', 'amount', 'wake', 'rejected')
+
+    def __init__(self, priority, order, amount):
+        self.priority = priority
+        self.order = order
+        self.amount = amount
+        self.wake = None
+        self.rejected = False
+
+    def __lt__(self, other):
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`
+
+    A rate of 0 disables the bucket. Requests larger than the capacity are
+    allowed once the bucket is full, so a single oversized call cannot block
+    forever. Waiters are served by priority, then arrival order, like
+    PriorityGate: only the first waiter may take tokens, so interactive
+    calls go ahead of batch calls that are already waiting. At most
+    `max_queue` callers wait (0 means unbounded); when the queue is full, a
+    new caller displaces the newest waiter of a lower priority, and is
+    rejected with QueueFullError if there is none. Callers bound the wait by
+    cancelling it (e.g. with asyncio.wait_for).
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, max_queue=0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self.max_queue = max_queue
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.rejected = 0
+        self._waiters = []
+        self._order = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _wake_first(self):
+        if self._waiters and self._waiters[0].wake is not None and not self._waiters[0].wake.done():
+            self._waiters[0].wake.set_result(None)
+
+    def _remove(self, waiter):
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+        self._wake_first()
+
+    def _displace(self, priority):
+        """
+        Reject the newest lowest-priority waiter to make room, or raise QueueFullError
+        """
+        worst = max(self._waiters, default=None)
+        if worst is None or worst.priority <= priority:
+            self.rejected += 1
+            raise QueueFullError()
+        worst.rejected = True
+        self._waiters.remove(worst)
+        heapq.heapify(self._waiters)
+        if worst.wake is not None and not worst.wake.done():
+            worst.wake.set_result(None)
+        self.rejected += 1
+
+    async def acquire(self, amount=1, priority=INTERACTIVE):
+        """
+        Wait until `amount` tokens are available and this caller is first in line, then take them
+        """
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        self._refill()
+        if not self._waiters and self.tokens >= amount:
+            self.tokens -= amount
+            return
+        if self.max_queue and len(self._waiters) >= self.max_queue:
+            self._displace(priority)
+
+        loop = asyncio.get_running_loop()
+        waiter = _BucketWaiter(priority, next(self._order), amount)
+        heapq.heappush(self._waiters, waiter)
+        try:
+            while True:
+                if waiter.rejected:
+                    raise QueueFullError()
+                self._refill()
+                first = self._waiters[0] is waiter
+                if first and self.tokens >= amount:
+                    heapq.heappop(self._waiters)
+                    self.tokens -= amount
+                    self._wake_first()
+                    return
+                # The first waiter sleeps until its tokens have accrued; the rest until woken
+                waiter.wake = loop.create_future()
+                await asyncio.wait({waiter.wake}, timeout=(amount - self.tokens) / self.rate if first else None)
+        except BaseException:
+            self._remove(waiter)
+            raise
+
+    def refund(self, amount):
+        """
+        Return tokens that were reserved but not used
+        """
+        if self.rate > 0 and amount > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+            self._wake_first()
+
+
+class RateLimiter:
+    """
+    Client-side limits on requests per minute and tokens per minute
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_queue=0):
+        self.requests = TokenBucket(requests_per_minute, max_queue=max_queue)
+        self.tokens = TokenBucket(tokens_per_minute, max_queue=max_queue)
+
+    async def acquire(self, estimated_tokens, priority=INTERACTIVE):
+        await self.requests.acquire(1, priority)
+        await self.tokens.acquire(estimated_tokens, priority)
+
+    @property
+    def queued(self):
+        return self.requests.queued + self.tokens.queued
+
+    @property
+    def rejected(self):
+        return self.requests.rejected + self.tokens.rejected
+
+    def settle(self, estimated_tokens, used_tokens):
+        """
+        Give back the part of the token estimate a completed call did not use
+        """
+        if used_tokens is not None:
+            self.tokens.refund(estimated_tokens - used_tokens)
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after repeated provider failures
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    raise CircuitOpenError for `reset_timeout` seconds. Then a single trial
+    call is let through (half-open): success closes the circuit, failure opens
+    it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_in_flight = False
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless a call may go to the provider now
+        """
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in > 0:
+                self.rejected += 1
+                raise CircuitOpenError(retry_in)
+            self.state = self.HALF_OPEN
+        if self._trial_in_flight:
+            self.rejected += 1
+            raise CircuitOpenError(0)
+        self._trial_in_flight = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._trial_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold > 0:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        End a call that neither succeeded nor failed (e.g. it was cancelled)
+        """
+        self._trial_in_flight = False
+
+
+class PriorityGate:
+    """
+    Concurrency limit whose waiters are served by priority, then arrival order
+
+    At most `limit` holders run at once. At most `max_queue` callers wait
+    (0 means unbounded); when the queue is full, a new caller displaces the
+    newest waiter of a lower priority, and is rejected if there is none.
+    """
+
+    def __init__(self, limit, max_queue=0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._waiters = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority=INTERACTIVE):
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return
+        if self.max_queue and self.queued >= self.max_queue:
+            self._displace(priority)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.queued += 1
+        try:
+            await future
+        except BaseException:
+            if not future.done() or future.cancelled():
+                future.cancel()
+                self.queued -= 1
+            elif future.exception() is None:
+                # The slot was handed over just as we were cancelled
+                self.release()
+            raise
+
+    def _displace(self, priority):
+        """
+        Reject the newest lowest-priority waiter to make room, or raise QueueFullError
+        """
+        live = [entry for entry in self._waiters if not entry[2].done()]
+        worst = max(live, key=lambda entry: (entry[0], entry[1]), default=None)
+        if worst is None or worst[0] <= priority:
+            self.rejected += 1
+            raise QueueFullError()
+        worst[2].set_exception(QueueFullError())
+        self.queued -= 1
+        self.rejected += 1
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                self.queued -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def slot(self, priority=INTERACTIVE):
+        return _GateSlot(self, priority)
+
+
+class _GateSlot:
+    def __init__(self, gate, priority):
+        self.gate = gate
+        self.priority = priority
+
+    async def __aenter__(self):
+        await self.gate.acquire(self.priority)
+
+    async def __aexit__(self, *exc_info):
+        self.gate.release()
@@ -1,69 +1,553 @@
-import openai
+import asyncio
+import threading
 from config import config
+from services.embedding_index import load_or_build_index, preference_text
+from services.explanation_cache import create_explanation_cache
+from services.co_view_model import CoViewModel
+from services.fallback_recommender import FallbackRecommender
+from services.llm_backends import create_llm_router
+from services.llm_resilience import BATCH, INTERACTIVE
+from services.metrics import CANDIDATES, LLM_RESPONSES
+from services.prompt_builder import PromptBuilder
+from services.recommendation_pipeline import (
+    LLM_EXPLAIN, CoViewCandidates, EmbeddingCandidates, FeatureExtraction, KeywordCandidates, LLMExplain, LLMRerank,
+    LocalExplainer, LocalRanker, PostFilters, RecommendationPipeline, RuleCandidates
+)
+from services.recommendation_cache import create_recommendation_cache, make_cache_key
+from services.response_parser import ParseStats, parse_recommendations
+from services.scoring_engine import ScoringEngine, ScoringWeights
+from services.single_flight import SingleFlight
 
 class LLMService:
     """
     Service to handle interactions with the LLM API
+    
+    Completions are requested through a shared async HTTP client so that a slow
+    call never blocks the event loop, and every call is bounded by a timeout
+    and can be cancelled by the caller. Calls are routed to pluggable backends
+    (the OpenAI API, a local model server), each with its own connection pool,
+    rate limits, priority queue, retries and circuit breaker.
     """
     
-    def __init__(self):
+    def __init__(self, product_service=None, search_service=None, co_view_model=None):
         """
         Initialize the LLM service with configuration
+        
+        Parameters:
+        - product_service (ProductService, optional): Indexed catalog used for product lookups
+        - search_service (SearchService, optional): Full-text search used as a candidate generator
+        - co_view_model (CoViewModel, optional): "Also viewed" neighbours from browsing history
         """
-        openai.api_key = config['OPENAI_API_KEY']
+        self.product_service = product_service
+        self.search_service = search_service
+        self.co_view = co_view_model or CoViewModel(config['CO_BROWSE_WINDOW'], config['CO_VIEW_NEIGHBOURS'])
+        self.co_view_weight = config['CO_VIEW_WEIGHT']
         self.model_name = config['MODEL_NAME']
         self.max_tokens = config['MAX_TOKENS']
         self.temperature = config['TEMPERATURE']
+        self.router = create_llm_router(config)
+        self.cache = create_recommendation_cache(config)
+        self.single_flight = SingleFlight() if config['SINGLE_FLIGHT_ENABLED'] else None
+        self.batch_concurrency = config['BATCH_CONCURRENCY']
+        self.fallback_enabled = config['FALLBACK_ENABLED']
+        self.hedge_deadline = config['HEDGE_DEADLINE']
+        self.hedge_upgrade_via_cache = config['HEDGE_UPGRADE_VIA_CACHE']
+        self.fallback = FallbackRecommender(self.co_view, count=config['FALLBACK_COUNT'])
+        self._background_tasks = set()
+        self.scoring_weights = ScoringWeights.from_config(config)
+        self._scoring_engine = None
+        self._scoring_engine_source = None
+        self._scoring_engine_lock = threading.Lock()
+        self.retrieval_enabled = config['RETRIEVAL_ENABLED']
+        self.retrieval_top_k = config['RETRIEVAL_TOP_K']
+        self.retrieval_weight = config['RETRIEVAL_WEIGHT']
+        self._embedding_index = None
+        self._embedding_index_source = None
+        self._embedding_rebuild = None
+        self._embedding_lock = threading.Lock()
+        self.search_candidates_enabled = config['SEARCH_CANDIDATES_ENABLED']
+        self.search_candidate_top_k = config['SEARCH_CANDIDATE_TOP_K']
+        self.search_candidate_weight = config['SEARCH_CANDIDATE_WEIGHT']
+        self.candidate_limit = config['CANDIDATE_LIMIT']
+        self.parse_stats = ParseStats()
+        self.explanations = create_explanation_cache(config)
+        self.prompt_builder = PromptBuilder(
+            token_budget=config['PROMPT_TOKEN_BUDGET'],
+            prompt_format=config['PROMPT_FORMAT'],
+            model_name=self.model_name,
+            max_snippets=config['PROMPT_SNIPPET_CACHE_SIZE']
+        )
+        self.pipeline = self._build_pipeline()
+    
+    def _build_pipeline(self):
+        """
+        Assemble the recommendation pipeline from config
+        
+        Candidate generators (rules, embeddings, co-views, keywords) feed
+        feature extraction and a weighted local ranker; post-filters prune
+        the shortlist, the LLM picks and explains from it (or, with
+        PIPELINE_LLM_MODE=explain, only explains the local top picks), and
+        the local explainer answers when the LLM stage is skipped or gives up.
+        """
+        in_stock_only = config['PIPELINE_IN_STOCK_ONLY']
+        max_per_brand = config['PIPELINE_MAX_PER_BRAND']
+        # Over-fetch when post-filters may drop products from the shortlist
+        pool = self.candidate_limit * (3 if in_stock_only or max_per_brand > 0 else 1)
+        weights = {
+            'rules': 1.0,
+            'embedding': self.retrieval_weight,
+            'co_view': self.co_view_weight,
+            'keyword': self.search_candidate_weight
+        }
+        return RecommendationPipeline([
+            RuleCandidates(self),
+            EmbeddingCandidates(self),
+            CoViewCandidates(self),
+            KeywordCandidates(self),
+            FeatureExtraction(pool),
+            LocalRanker(weights, pool),
+            PostFilters(self.candidate_limit, in_stock_only, max_per_brand),
+            LLMExplain(
+                self,
+                self.fallback,
+                self.explanations,
+                max_tokens=config['EXPLANATION_MAX_TOKENS'],
+                budget=config['PIPELINE_LLM_BUDGET']
+            ) if config['PIPELINE_LLM_MODE'] == LLM_EXPLAIN else LLMRerank(
+                self,
+                mode=config['PIPELINE_LLM_MODE'],
+                count=self.fallback.count,
+                margin=config['PIPELINE_LLM_MARGIN'],
+                budget=config['PIPELINE_LLM_BUDGET']
+            ),
+            LocalExplainer(self.fallback)
+        ], budget=config['PIPELINE_LOCAL_BUDGET_MS'] / 1000)
     
-    def generate_recommendations(self, user_preferences, browsing_history, all_products):
+    async def aclose(self):
+        """
+        Close the backends' pooled HTTP clients
+        """
+        await self.router.aclose()
+    
+    def _estimate_tokens(self, messages, max_tokens):
+        """
+        Upper bound on the tokens a completion uses, for the tokens-per-minute limit
+        """
+        return sum(self.prompt_builder.counter.count(m["content"]) for m in messages) + max_tokens
+    
+    async def _chat_completion(self, messages, max_tokens=None, priority=INTERACTIVE):
+        """
+        Request a chat completion and return the message content
+        
+        The call goes to the backends routed for its priority, best first,
+        moving on to the next backend when one fails (see services.llm_backends).
+        
+        Parameters:
+        - messages (list): Chat messages in OpenAI format
+        - max_tokens (int, optional): Completion token limit, defaults to config
+        - priority (int): INTERACTIVE or BATCH
+        
+        Returns:
+        - str: Content of the first choice
+        """
+        payload = {
+            "messages": messages,
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature
+        }
+        estimated_tokens = self._estimate_tokens(messages, payload["max_tokens"])
+        return await self.router.chat_completion(payload, priority, estimated_tokens)
+    
+    async def _chat_completion_stream(self, messages, max_tokens=None, priority=INTERACTIVE):
+        """
+        Request a streamed chat completion and yield content deltas as they arrive
+        
+        Routed like _chat_completion; a backend that fails before its first
+        delta is replaced by the next one.
+        
+        Parameters:
+        - messages (list): Chat messages in OpenAI format
+        - max_tokens (int, optional): Completion token limit, defaults to config
+        - priority (int): INTERACTIVE or BATCH
+        
+        Yields:
+        - str: Content delta
+        """
+        payload = {
+            "messages": messages,
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature
+        }
+        estimated_tokens = self._estimate_tokens(messages, payload["max_tokens"])
+        async for delta in self.router.chat_completion_stream(payload, priority, estimated_tokens):
+            yield delta
+    
+    def _build_messages(self, prompt):
+        """
+        Chat messages for a recommendation prompt
+        """
+        return [
+            {"role": "system", "content": "You are a helpful eCommerce product recommendation assistant."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _cache_key(self, user_preferences, browsing_history):
+        """
+        Recommendation cache key for a request, or None when caching is disabled
+        """
+        if self.cache is None:
+            return None
+        return self.cache.key_for(user_preferences, browsing_history, self._catalog_version())
+    
+    async def test_api_connection(self):
+        """
+        Check that the LLM API accepts a minimal completion request
+        
+        Returns:
+        - bool: True if the API answered
+        """
+        try:
+            await self._chat_completion([{"role": "user", "content": "ping"}], max_tokens=1)
+            return True
+        except Exception as e:
+            print(f"Error testing LLM API: {str(e)}")
+            return False
+    
+    async def generate_recommendations(self, user_preferences, browsing_history, all_products, priority=INTERACTIVE):
         """
         Generate personalized product recommendations based on user preferences and browsing history
         
+        Results come from the recommendation pipeline (see _build_pipeline);
+        they carry "source": "local" when the LLM stage was skipped.
+        
         Parameters:
         - user_preferences (dict): User's stated preferences
         - browsing_history (list): List of product IDs the user has viewed
         - all_products (list): Full product catalog
+        - priority (int): INTERACTIVE for user requests, BATCH for background work
         
         Returns:
         - dict: Recommended products with explanations
         """
-        # TODO: Implement LLM-based recommendation logic
-        # This is where your prompt engineering expertise will be evaluated
+        # Serve identical (after normalization) requests from the cache
+        cache_key = self._cache_key(user_preferences, browsing_history)
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        if self.single_flight is None:
+            return await self._generate_uncached(user_preferences, browsing_history, all_products, cache_key, priority)
+        
+        # Concurrent identical requests share one LLM call
+        flight_key = cache_key or make_cache_key(user_preferences, browsing_history, self._catalog_version())
+        return await self.single_flight.do(
+            flight_key,
+            lambda: self._generate_uncached(user_preferences, browsing_history, all_products, cache_key, priority)
+        )
+    
+    async def _generate_uncached(self, user_preferences, browsing_history, all_products, cache_key, priority=INTERACTIVE,
+                                 on_recommendation=None):
+        """
+        Run the recommendation pipeline and cache a usable result under cache_key
         
+        With on_recommendation the LLM stage runs in streaming mode and each
+        recommendation is passed to it as soon as it is parsed.
+        """
         # Get browsed products details
-        browsed_products = []
-        for product_id in browsing_history:
-            for product in all_products:
-                if product["id"] == product_id:
-                    browsed_products.append(product)
-                    break
-        
-        # Create a prompt for the LLM
-        # IMPLEMENT YOUR PROMPT ENGINEERING HERE
-        prompt = self._create_recommendation_prompt(user_preferences, browsed_products, all_products)
-        
-        # Call the LLM API
+        browsed_products = self._lookup_products(browsing_history, all_products)
+        context = self.pipeline.context(user_preferences, browsed_products, all_products, priority)
+        
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "You are a helpful eCommerce product recommendation assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
-            
-            # Parse the LLM response to extract recommendations
-            # IMPLEMENT YOUR RESPONSE PARSING LOGIC HERE
-            recommendations = self._parse_recommendation_response(response.choices[0].message.content, all_products)
-            
-            return recommendations
-            
+            if on_recommendation is None:
+                await self.pipeline.run(context)
+            else:
+                await self._run_streaming(context, on_recommendation)
+            recommendations = context.result
+            CANDIDATES.labels('shortlist').observe(len(context.ranked))
         except Exception as e:
             # Handle any errors from the LLM API
             print(f"Error calling LLM API: {str(e)}")
             raise Exception(f"Failed to generate recommendations: {str(e)}")
+        
+        # Only cache usable results so a bad completion is retried next time
+        if cache_key is not None and context.cacheable and recommendations.get("recommendations"):
+            await self.cache.set(cache_key, recommendations)
+        
+        return recommendations
+    
+    def record_view(self, product_id, previous_history, user_id=None):
+        """
+        Feed a browsing-history event into the co-view model
+        
+        Parameters:
+        - product_id (str): Product that was viewed
+        - previous_history (list): The user's history before this view
+        - user_id (str, optional): Viewing user, recorded in the event log
+        """
+        self.co_view.record_view(product_id, previous_history, user_id)
+    
+    def local_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Recommend products without calling the LLM
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+        
+        Returns:
+        - dict: Recommended products with templated explanations
+        """
+        browsed_products = self._lookup_products(browsing_history, all_products)
+        criteria = self._relevance_criteria(user_preferences, browsed_products)
+        return self.fallback.recommend(self._get_scoring_engine(all_products), criteria, browsed_products)
+    
+    async def generate_recommendations_hedged(self, user_preferences, browsing_history, all_products, deadline=None):
+        """
+        Generate recommendations with the LLM, falling back to the local recommender
+        
+        The LLM call is started first. If it fails, returns nothing usable, or
+        has not finished within the deadline, the local result is served
+        instead. With HEDGE_UPGRADE_VIA_CACHE the late LLM call keeps running
+        and lands in the cache, so the next identical request gets the LLM
+        result.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+        - deadline (float, optional): Seconds to wait for the LLM, defaults to HEDGE_DEADLINE (0 waits indefinitely)
+        
+        Returns:
+        - dict: Recommendations plus "source" ("llm", "local" or "fallback")
+        """
+        if not self.fallback_enabled:
+            result = await self.generate_recommendations(user_preferences, browsing_history, all_products)
+            return {"source": "llm", **result}
+        
+        deadline = self.hedge_deadline if deadline is None else deadline
+        task = asyncio.ensure_future(self.generate_recommendations(user_preferences, browsing_history, all_products))
+        try:
+            done, _ = await asyncio.wait({task}, timeout=deadline or None)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        
+        if done:
+            try:
+                result = task.result()
+                if result.get("recommendations"):
+                    return {"source": "llm", **result}
+            except Exception as e:
+                print(f"Serving local recommendations after LLM failure: {str(e)}")
+        elif self.hedge_upgrade_via_cache and self.cache is not None:
+            # Let the slow call finish in the background to warm the cache
+            self._background_tasks.add(task)
+            task.add_done_callback(self._finish_background_task)
+        else:
+            task.cancel()
+        
+        result = self.local_recommendations(user_preferences, browsing_history, all_products)
+        return {**result, "source": "fallback"}
+    
+    def _finish_background_task(self, task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background LLM call failed: {str(task.exception())}")
+    
+    async def stream_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Generate recommendations, yielding each one as soon as it is ready
+        
+        Runs the same pipeline as generate_recommendations(), with the LLM
+        stage in streaming mode: recommendations it picks are yielded as soon
+        as the LLM finishes writing each one, those of other stages (the
+        local explainer, PIPELINE_LLM_MODE=explain) once the stage is done.
+        Cached results are replayed immediately, and identical requests in
+        flight share one pipeline run whether they stream or not.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+        
+        Yields:
+        - tuple: (source, recommendation), source being "llm", "local" or "fallback"
+        """
+        cache_key = self._cache_key(user_preferences, browsing_history)
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                for recommendation in cached["recommendations"]:
+                    yield cached.get("source", "llm"), recommendation
+                return
+        
+        streamed = asyncio.Queue()
+        
+        def generate():
+            return self._generate_uncached(
+                user_preferences, browsing_history, all_products, cache_key, INTERACTIVE, streamed.put_nowait
+            )
+        
+        if self.single_flight is None:
+            task = asyncio.ensure_future(generate())
+        else:
+            # An identical request already in flight is joined instead, and its result replayed
+            flight_key = cache_key or make_cache_key(user_preferences, browsing_history, self._catalog_version())
+            task = asyncio.ensure_future(self.single_flight.do(flight_key, generate))
+        
+        sent = 0
+        getter = None
+        try:
+            while not task.done():
+                getter = asyncio.ensure_future(streamed.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    sent += 1
+                    yield "llm", getter.result()
+            while not streamed.empty():
+                sent += 1
+                yield "llm", streamed.get_nowait()
+            result = task.result()
+        finally:
+            task.cancel()
+            if getter is not None:
+                getter.cancel()
+        
+        source = result.get("source", "llm")
+        for recommendation in result["recommendations"][sent:]:
+            yield source, recommendation
+    
+    async def _run_streaming(self, context, on_recommendation):
+        """
+        Run the pipeline with the LLM stage in streaming mode
+        
+        Like generate_recommendations_hedged(), with FALLBACK_ENABLED the wait
+        for the first recommendation is bounded by HEDGE_DEADLINE, and a
+        failure before it is answered by the local explainer with "source":
+        "fallback".
+        
+        Parameters:
+        - context (PipelineContext): The request
+        - on_recommendation (callable): Called with each recommendation the LLM stage yields
+        """
+        stage = await self.pipeline.advance(context)
+        if stage is not None and hasattr(stage, 'stream'):
+            streamed = 0
+            try:
+                deadline = self.hedge_deadline if self.fallback_enabled else 0
+                async for recommendation in self.pipeline.stream(stage, context, deadline):
+                    streamed += 1
+                    on_recommendation(recommendation)
+            except Exception as e:
+                if streamed or not self.fallback_enabled:
+                    raise
+                print(f"Serving local recommendations after LLM failure: {str(e)}")
+                context.cacheable = False
+                await self.pipeline.run(context)
+                context.result = {**context.result, "source": "fallback"}
+                return
+        if context.result is None:
+            await self.pipeline.run(context)
+    
+    async def generate_batch_recommendations(self, profiles, all_products, concurrency=None):
+        """
+        Generate recommendations for many user profiles, yielding results as they complete
+        
+        Profiles whose normalized preferences and history are identical share a
+        single generation. At most `concurrency` generations run at once; the
+        scoring engine, embedding index and recommendation cache are shared
+        with interactive traffic.
+        
+        Parameters:
+        - profiles (list): Dicts with "id", "preferences" and "browsing_history"
+        - all_products (list): Full product catalog
+        - concurrency (int, optional): Maximum concurrent generations, defaults to config
+        
+        Yields:
+        - tuple: (list of profile IDs, result dict or None, error message or None)
+        """
+        groups = {}
+        for profile in profiles:
+            key = make_cache_key(
+                profile["preferences"], profile["browsing_history"], self._catalog_version(),
+                self.cache.history_order_sensitive if self.cache is not None else False
+            )
+            if key in groups:
+                groups[key][1].append(profile["id"])
+            else:
+                groups[key] = (profile, [profile["id"]])
+        
+        semaphore = asyncio.Semaphore(concurrency or self.batch_concurrency)
+        
+        async def run(profile, profile_ids):
+            async with semaphore:
+                if not profile["preferences"]:
+                    return profile_ids, None, "No user preferences provided"
+                try:
+                    result = await self.generate_recommendations(
+                        user_preferences=profile["preferences"],
+                        browsing_history=profile["browsing_history"],
+                        all_products=all_products,
+                        priority=BATCH
+                    )
+                    return profile_ids, result, None
+                except Exception as e:
+                    return profile_ids, None, str(e)
+        
+        tasks = [asyncio.ensure_future(run(profile, ids)) for profile, ids in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def _enrich_recommendation(self, rec, get_product):
+        """
+        Attach full product details to a parsed recommendation
+        
+        Returns:
+        - dict or None: Enriched recommendation, None if the product ID is unknown
+        """
+        if not isinstance(rec, dict):
+            return None
+        product_details = get_product(rec.get('product_id'))
+        if not product_details:
+            return None
+        return {
+            "product": product_details,
+            "explanation": rec.get('explanation', ''),
+            "confidence_score": rec.get('score', 5)
+        }
+    
+    def _catalog_version(self):
+        """
+        Version of the catalog recommendations are computed against
+        """
+        if self.product_service is not None:
+            return self.product_service.version
+        return None
+    
+    def _product_getter(self, all_products):
+        """
+        Return a function mapping a product ID to its product dict (or None)
+        
+        Uses the catalog index when a product service is available, otherwise
+        builds a one-off id map over all_products.
+        """
+        if self.product_service is not None:
+            return self.product_service.get_product_by_id
+        return {p['id']: p for p in all_products}.get
+    
+    def _lookup_products(self, product_ids, all_products):
+        """
+        Resolve product IDs to product dicts, skipping unknown IDs
+        """
+        get_product = self._product_getter(all_products)
+        products = (get_product(pid) for pid in product_ids)
+        return [p for p in products if p is not None]
     
     def _create_recommendation_prompt(self, user_preferences, browsed_products, all_products):
         """
@@ -79,103 +563,35 @@ class LLMService:
         Returns:
         - str: Prompt for the LLM
         """
-        # TODO: Implement your prompt engineering strategy
-        # THIS FUNCTION MUST BE IMPLEMENTED BY THE CANDIDATE
-        
         # First, determine relevant products based on user preferences to reduce token usage
         relevant_products = self._filter_relevant_products(user_preferences, browsed_products, all_products)
-
-        # Example basic prompt structure (you should significantly improve this):
-        prompt = """You are an expert e-commerce personalization engine that provides highly tailored product recommendations.
-Your task is to analyze a user's preferences and browsing history, then recommend products that would genuinely interest them.
-For each recommendation, provide thoughtful reasoning that connects the product's attributes to the user's demonstrated preferences.
-
-Follow these guidelines:
-1. Prioritize products that match multiple preference criteria
-2. Consider both explicit preferences AND implicit interests shown in browsing history
-3. Recommend a diverse selection (don't recommend too many similar items)
-4. For each recommendation, provide specific reasons why this product matches the user's preferences
-5. If the user has browsed products from a specific brand, consider recommending other products from that brand
-6. Consider price sensitivity based on the price range of browsed products
-
-Your response MUST be in valid JSON format as shown in the example below:
-[
-  {
-    "product_id": "product123",
-    "explanation": "This product matches your preference for athletic gear and aligns with your interest in running shoes based on your browsing history. The price point is within your preferred range, and it features the lightweight design you indicated as important.",
-    "score": 9
-  },
-  ...
-]
-"""
-
-        # Add user preferences to the prompt
-        prompt += "\n\n## USER PREFERENCES\n"
-        if user_preferences:
-            for key, value in user_preferences.items():
-                prompt += f"- {key}: {value}\n"
-        else:
-            prompt += "- No explicit preferences provided\n"
-        
-        # Add browsing history to the prompt
-        prompt += "\n\n## BROWSING HISTORY\n"
-        if browsed_products:
-            for i, product in enumerate(browsed_products, 1):
-                prompt += f"{i}. {product['name']} (ID: {product['id']})\n"
-                prompt += f"   - Category: {product['category']}, Subcategory: {product.get('subcategory', 'N/A')}\n"
-                prompt += f"   - Price: ${product['price']}, Brand: {product['brand']}, Rating: {product.get('rating', 'N/A')}\n"
-                prompt += f"   - Tags: {', '.join(product.get('tags', []))}\n"
-                
-                # Truncate description to save tokens
-                description = product.get('description', '')
-                if description and len(description) > 100:
-                    description = description[:97] + "..."
-                prompt += f"   - Description: {description}\n"
-        else:
-            prompt += "- No browsing history available\n"
-        
-        # Add available products (filtered for relevance)
-        prompt += "\n\n## AVAILABLE PRODUCTS FOR RECOMMENDATION\n"
-        for i, product in enumerate(relevant_products, 1):
-            prompt += f"{i}. {product['name']} (ID: {product['id']})\n"
-            prompt += f"   - Category: {product['category']}, Subcategory: {product.get('subcategory', 'N/A')}\n"
-            prompt += f"   - Price: ${product['price']}, Brand: {product['brand']}\n"
-            prompt += f"   - Tags: {', '.join(product.get('tags', []))}\n"
-            
-            # Include features as they're important for recommendations
-            if 'features' in product and product['features']:
-                prompt += f"   - Features: {', '.join(product['features'][:3])}\n"
-        
-        # Final instructions
-        prompt += "\n\n## RECOMMENDATION TASK\n"
-        prompt += "Based on the user preferences and browsing history above, recommend 5 products from the available catalog.\n"
-        prompt += "For each recommendation, provide:\n"
-        prompt += "1. The product_id\n"
-        prompt += "2. A detailed explanation (2-3 sentences) on why this product matches the user's preferences and browsing patterns\n"
-        prompt += "3. A confidence score from 1-10 indicating how well this matches their preferences\n\n"
-        prompt += "Return ONLY a valid JSON array with these recommendations. Do not include any other text or explanation outside the JSON structure."
-        
-        # You would likely want to include the product catalog in the prompt
-        # But be careful about token limits!
-        # For a real implementation, you might need to filter the catalog to relevant products first
-        
+        return self._build_prompt(user_preferences, browsed_products, relevant_products)
+    
+    def _build_prompt(self, user_preferences, browsed_products, relevant_products):
+        """
+        Prompt asking the LLM to recommend from an already selected shortlist
+        """
+        # Pack as many candidates as fit the token budget, using cached per-product snippets
+        version = self._catalog_version()
+        if self.prompt_builder.catalog_version != version:
+            changes = self._catalog_changes(self.prompt_builder.catalog_version)
+            self.prompt_builder.invalidate(version, None if changes is None else changes.product_ids)
+        prompt, _, _ = self.prompt_builder.build(
+            user_preferences, browsed_products, relevant_products, version
+        )
         return prompt
-    def _filter_relevant_products(self, user_preferences, browsed_products, all_products):
+    
+    def _relevance_criteria(self, user_preferences, browsed_products):
         """
-        Filter the product catalog to the most relevant products based on user preferences
-        to keep within token limits.
+        Derive scoring criteria from user preferences and browsing history
         
         Parameters:
         - user_preferences (dict): User's stated preferences
         - browsed_products (list): Products the user has viewed
-        - all_products (list): Full product catalog
         
         Returns:
-        - list: Filtered list of relevant products
+        - dict: Keyword arguments for ScoringEngine.score()
         """
-        relevant_products = []
-        browsed_product_ids = [p['id'] for p in browsed_products]
-        
         # Create a set of relevant categories from user preferences and browsing history
         relevant_categories = set()
         relevant_brands = set()
@@ -218,56 +634,195 @@ Your response MUST be in valid JSON format as shown in the example below:
                 min_price = float(parts[0].strip().replace('$', ''))
                 max_price = float(parts[1].strip().replace('$', ''))
         
-        # Score each product for relevance
-        product_scores = []
-        for product in all_products:
-            # Skip products already browsed
-            if product['id'] in browsed_product_ids:
-                continue
-            
-            score = 0
-            
-            # Category match
-            if product['category'] in relevant_categories:
-                score += 3
-            
-            # Brand match
-            if product['brand'] in relevant_brands:
-                score += 2
-            
-            # Price range match
-            if min_price <= product['price'] <= max_price:
-                score += 2
+        return {
+            "relevant_categories": relevant_categories,
+            "relevant_brands": relevant_brands,
+            "relevant_tags": relevant_tags,
+            "min_price": min_price,
+            "max_price": max_price,
+            "exclude_ids": {p['id'] for p in browsed_products}
+        }
+    
+    def _catalog_changes(self, since_version):
+        """
+        Changes to the catalog after since_version, or None if they are not known
+        """
+        if self.product_service is None or since_version is None:
+            return None
+        return self.product_service.changes_since(since_version)
+    
+    def _get_scoring_engine(self, all_products):
+        """
+        Return the scoring engine for the catalog, updating it when the catalog changes
+        
+        Replaced and added products are re-encoded incrementally; deletions
+        and full reloads rebuild the engine.
+        """
+        if self.product_service is not None:
+            source = self._catalog_version()
+        else:
+            source = (id(all_products), len(all_products))
+        if self._scoring_engine is not None and self._scoring_engine_source == source:
+            return self._scoring_engine
+        # Pipelines rank in worker threads, so only one of them updates the engine
+        with self._scoring_engine_lock:
+            if self._scoring_engine is None or self._scoring_engine_source != source:
+                changes = self._catalog_changes(self._scoring_engine_source) if self._scoring_engine is not None else None
+                if changes is not None and not changes.deleted:
+                    self._scoring_engine = self._scoring_engine.updated(all_products, changes.product_ids)
+                else:
+                    self._scoring_engine = ScoringEngine.for_products(all_products, self.scoring_weights)
+                self._scoring_engine_source = source
+            return self._scoring_engine
+    
+    def _embedding_source(self, all_products):
+        return self._catalog_version() if self.product_service is not None else (id(all_products), len(all_products))
+    
+    def _get_embedding_index(self, all_products):
+        """
+        Return the embedding index for the catalog, loading or rebuilding it when the catalog changes
+        
+        Changes that leave product text alone (price, inventory, rating) keep
+        the current index. Otherwise the index is loaded or built in a
+        background thread and never on the caller's: the previous index
+        keeps serving meanwhile, and before the first one is ready this
+        returns None.
+        """
+        source = self._embedding_source(all_products)
+        if self._embedding_index is None:
+            self._start_embedding_rebuild(all_products, source)
+        elif self._embedding_index_source != source:
+            changes = self._catalog_changes(self._embedding_index_source)
+            if changes is None or changes.text_changed:
+                self._start_embedding_rebuild(all_products, source)
+            else:
+                self._embedding_index_source = source
+        return self._embedding_index
+    
+    def warm_indexes(self, wait=False):
+        """
+        Start loading or building the embedding and search indexes for the current catalog in the background
+        
+        Until they are ready, recommendations are made without embedding and
+        keyword candidates.
+        
+        Parameters:
+        - wait (bool): Block until both are ready (for scripts and benchmarks)
+        """
+        if self.product_service is None:
+            return
+        all_products = self.product_service.get_all_products()
+        builds = []
+        if self.retrieval_enabled:
+            self._get_embedding_index(all_products)
+            builds.append(self._embedding_rebuild)
+        if self.search_service is not None and self.search_candidates_enabled:
+            builds.append(self.search_service.start_build())
+        if wait:
+            for thread in builds:
+                if thread is not None:
+                    thread.join()
+    
+    def _start_embedding_rebuild(self, all_products, source):
+        """
+        Load or build the index for a catalog version in a background thread, one rebuild at a time
+        
+        A catalog change that lands during a rebuild starts another one on
+        the next request after it finishes.
+        """
+        with self._embedding_lock:
+            if self._embedding_rebuild is not None:
+                return
+            version = self._catalog_version()
             
-            # Tag match
-            if 'tags' in product:
-                matching_tags = set(product['tags']) & relevant_tags
-                score += len(matching_tags)
+            def rebuild():
+                try:
+                    index = load_or_build_index(
+                        all_products, config['EMBEDDING_INDEX_PATH'], config['EMBEDDING_DIM'], version
+                    )
+                except Exception as e:
+                    print(f"Error rebuilding embedding index: {str(e)}")
+                    index = None
+                with self._embedding_lock:
+                    if index is not None:
+                        self._embedding_index = index
+                        self._embedding_index_source = source
+                    self._embedding_rebuild = None
             
-            # Add to scoring list if it has any relevance
-            if score > 0:
-                product_scores.append((product, score))
+            self._embedding_rebuild = threading.Thread(target=rebuild, name="embedding-index-rebuild", daemon=True)
+            self._embedding_rebuild.start()
+    
+    def _retrieve_similar(self, user_preferences, browsed_products, all_products):
+        """
+        Shortlist products by embedding similarity to the user
+        
+        While a rebuild is in progress the previous index answers, and its
+        rows are mapped to the current catalog by product ID (products it
+        does not know are simply not retrieved).
+        
+        Returns:
+        - list: (row, similarity) tuples for the top RETRIEVAL_TOP_K products, empty if there is no
+          signal or no index has been built yet
+        """
+        self._get_embedding_index(all_products)
+        with self._embedding_lock:
+            # Read both together: a finished rebuild swaps them in a worker thread
+            index, index_source = self._embedding_index, self._embedding_index_source
+        if index is None:
+            return []
+        stale = index_source != self._embedding_source(all_products)
+        user_vector = index.user_vector(user_preferences, browsed_products)
+        if user_vector is None:
+            return []
+        similar = index.search(user_vector, self.retrieval_top_k, exclude_ids={p['id'] for p in browsed_products})
+        if not stale:
+            return similar
+        row_by_id = self._get_scoring_engine(all_products).row_by_id
+        rows = ((row_by_id.get(index.product_ids[row]), similarity) for row, similarity in similar)
+        return [(row, similarity) for row, similarity in rows if row is not None]
+    
+    def _search_candidates(self, user_preferences, browsed_products):
+        """
+        Shortlist products by keyword relevance (BM25) to the user's preferences and browsed product names
         
-        # Sort by relevance score and take top results
-        product_scores.sort(key=lambda x: x[1], reverse=True)
+        Returns:
+        - list: (row, score) tuples with scores scaled to 0-1, empty if there is no signal
+        """
+        text = ' '.join([preference_text(user_preferences)] + [p.get('name', '') for p in browsed_products])
+        return self.search_service.candidates(
+            text, self.search_candidate_top_k, exclude_ids={p['id'] for p in browsed_products}
+        )
+    
+    def _filter_relevant_products(self, user_preferences, browsed_products, all_products):
+        """
+        Filter the product catalog to the most relevant products based on user preferences
+        to keep within token limits.
         
-        # Get top 20 relevant products or all if less than 20
-        max_products = min(20, len(product_scores))
-        relevant_products = [item[0] for item in product_scores[:max_products]]
+        Runs the local stages of the recommendation pipeline: candidate
+        generation, ranking and post-filters.
         
-        # If we have fewer than 10 products, add some random ones for diversity
-        if len(relevant_products) < 10:
-            available_products = [p for p in all_products if p['id'] not in browsed_product_ids and p not in relevant_products]
-            import random
-            random_products = random.sample(available_products, min(10 - len(relevant_products), len(available_products)))
-            relevant_products.extend(random_products)
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - all_products (list): Full product catalog
         
-        return relevant_products
+        Returns:
+        - list: Filtered list of relevant products
+        """
+        context = self.pipeline.context(user_preferences, browsed_products, all_products)
+        shortlist = self.pipeline.run_local(context).shortlist
+        CANDIDATES.labels('shortlist').observe(len(shortlist))
+        return shortlist
     
     def _parse_recommendation_response(self, llm_response, all_products):
         """
         Parse the LLM response to extract product recommendations
         
+        Accepts prose and code fences around the JSON, trailing commas, wrapper
+        objects and output truncated by the token limit. Unknown and duplicate
+        product IDs are dropped; counters for each case are added to
+        self.parse_stats.
+        
         Parameters:
         - llm_response (str): Raw response from the LLM
         - all_products (list): Full product catalog to match IDs with full product info
@@ -275,70 +830,20 @@ Your response MUST be in valid JSON format as shown in the example below:
         Returns:
         - dict: Structured recommendations
         """
-        # TODO: Implement response parsing logic
-        # THIS FUNCTION MUST BE IMPLEMENTED BY THE CANDIDATE
+        get_product = self._product_getter(all_products)
+        parsed, stats = parse_recommendations(llm_response, is_known=lambda pid: get_product(pid) is not None)
+        self.parse_stats.merge(stats)
         
-        # Example implementation (very basic, should be improved):
-        try:
-            import json
-            import re
-            # Try to find JSON content in the response
-            # First attempt: Look for array brackets
-            json_match = re.search(r'\[.*\]', llm_response, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group(0)
-            else:
-                # Second attempt: Look for content between code blocks
-                code_block_match = re.search(r'```(?:json)?(.*?)```', llm_response, re.DOTALL)
-                if code_block_match:
-                    json_str = code_block_match.group(1).strip()
-                else:
-                    # Fallback if JSON parsing fails
-                    return {
-                        "recommendations": [],
-                        "error": "Could not parse recommendations from LLM response"
-                    }
-            
-            # Clean up any non-JSON text that might be in the string
-            json_str = json_str.strip()
-            if not (json_str.startswith('[') and json_str.endswith(']')):
-                # Try to find the start and end of JSON array
-                start_idx = json_str.find('[')
-                end_idx = json_str.rfind(']') + 1
-                if start_idx >= 0 and end_idx > 0:
-                    json_str = json_str[start_idx:end_idx]
-
-            # Parse the JSON string
-            rec_data = json.loads(json_str)
-            
-            # Enrich recommendations with full product details
-            recommendations = []
-            for rec in rec_data:
-                product_id = rec.get('product_id')
-                product_details = None
-                
-                # Find the full product details
-                for product in all_products:
-                    if product['id'] == product_id:
-                        product_details = product
-                        break
-                
-                if product_details:
-                    recommendations.append({
-                        "product": product_details,
-                        "explanation": rec.get('explanation', ''),
-                        "confidence_score": rec.get('score', 5)
-                    })
-            
-            return {
-                "recommendations": recommendations,
-                "count": len(recommendations)
-            }
-            
-        except Exception as e:
-            print(f"Error parsing LLM response: {str(e)}")
+        # Enrich recommendations with full product details
+        recommendations = [self._enrich_recommendation(rec, get_product) for rec in parsed]
+        LLM_RESPONSES.labels("parsed" if recommendations else "unparseable").inc()
+        if not recommendations:
+            print(f"Could not parse recommendations from LLM response: {stats.to_dict()}")
             return {
                 "recommendations": [],
-                "error": f"Failed to parse recommendations: {str(e)}"
-            }
\ No newline at end of file
+                "error": "Could not parse recommendations from LLM response"
+            }
+        return {
+            "recommendations": recommendations,
+            "count": len(recommendations)
+        }
\ No newline at end of file
@@ -0,0 +1,308 @@
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds: HTTP handlers are milliseconds, LLM calls seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Candidate-set size buckets
+SIZE_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    """
+    A single counter or gauge value
+
+    Updates are plain attribute arithmetic without a lock: the event loop
+    is single-threaded, and a lost update from a worker thread only makes
+    a scrape slightly off.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    """
+    Bucket counts, sum and count of one histogram series
+    """
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    """
+    A named metric family with optional labels
+
+    labels(*values) returns the series for those label values, created on
+    first use and cached, so the hot path is one dict lookup and an add.
+    A metric without labels is used directly (inc, set, observe).
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _new_value(self):
+        return _Value()
+
+    def labels(self, *values):
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, self._new_value())
+        return series
+
+    def _unlabelled(self):
+        return self.labels()
+
+    def samples(self):
+        """
+        (suffix, label values, extra labels, value) tuples for the exposition format
+        """
+        return [('', values, (), series.value) for values, series in list(self._series.items())]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1):
+        self._unlabelled().dec(amount)
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def samples(self):
+        samples = []
+        for values, series in list(self._series.items()):
+            with series._lock:
+                counts, total, count = list(series.counts), series.sum, series.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', values, (('le', _format_value(float(bound))),), cumulative))
+            samples.append(('_sum', values, (), total))
+            samples.append(('_count', values, (), count))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """
+    A counter or gauge read from existing service counters when metrics are scraped
+
+    Costs nothing on the hot path. The callback returns (label values, value)
+    pairs.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames, callback):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        try:
+            return [('', tuple(values), (), value) for values, value in self.callback()]
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {str(e)}")
+            return []
+
+
+class Registry:
+    """
+    Collects metrics and renders them in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, labelnames, callback):
+        """
+        Register a metric read from callback() at scrape time, replacing any previous one of that name
+        """
+        return self.register(CallbackMetric(name, documentation, kind, labelnames, callback))
+
+    def render(self):
+        """
+        Returns:
+        - str: Every metric in the text exposition format
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, values, extra, value in metric.samples():
+                labels = _format_labels(metric.labelnames, values, extra)
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code", ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time until the response body was sent", ("method", "route")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_request_duration_seconds", "LLM call attempts by backend, call kind and outcome",
+    ("backend", "kind", "outcome")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "Prompt and completion tokens reported by the LLM provider", ("backend", "type")
+)
+LLM_RESPONSES = REGISTRY.counter(
+    "llm_responses_total", "Recommendation responses by parse outcome (parsed or unparseable)", ("outcome",)
+)
+
+RECOMMENDATIONS = REGISTRY.counter(
+    "recommendations_served_total", "Recommendation responses by source (llm, local, fallback, materialized)",
+    ("source",)
+)
+CANDIDATES = REGISTRY.histogram(
+    "recommendation_candidates", "Candidates per request from each generator, the feature matrix and the shortlist",
+    ("stage",), SIZE_BUCKETS
+)
+PIPELINE_STAGE_LATENCY = REGISTRY.histogram(
+    "recommendation_stage_duration_seconds", "Recommendation pipeline stage run time", ("stage",)
+)
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware timing every HTTP request
+
+    Requests are labelled with the route template (/api/products/{product_id})
+    rather than the path, so the label set stays small. The route is found
+    from the endpoint the router matched, mapped to its path once.
+    """
+
+    def __init__(self, app, routes):
+        """
+        Parameters:
+        - app: ASGI application to wrap
+        - routes (callable): Returns the application's routes (read lazily, after they are registered)
+        """
+        self.app = app
+        self.routes = routes
+        self._paths = {}
+
+    def _route(self, scope):
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        path = self._paths.get(endpoint)
+        if path is None:
+            self._paths = {getattr(route, 'endpoint', None): route.path for route in self.routes()}
+            path = self._paths.get(endpoint, 'unmatched')
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = self._route(scope)
+            HTTP_LATENCY.labels(scope['method'], route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope['method'], route, str(status[0])).inc()
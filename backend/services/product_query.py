@@ -0,0 +1,435 @@
+import base64
+import bisect
+import json
+import threading
+
+import numpy as np
+
+from services.columnar_catalog import ColumnarCatalog
+
+# Sortable fields; every order breaks ties by product ID so cursors are unambiguous
+SORT_FIELDS = ('id', 'price', 'rating', 'name')
+
+# Facet fields with up to this many distinct values are counted with per-value row bitmaps
+FACET_BITMAP_VALUES = 256
+
+# Set bits per byte value, for NumPy releases without np.bitwise_count (added in 2.0)
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def popcount_rows(bitmaps):
+    """
+    Number of set bits in each row of a 2-D uint64 bitmap array
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bitmaps).sum(axis=1, dtype=np.int64)
+    return _BYTE_POPCOUNT[bitmaps.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+def encode_cursor(sort, key):
+    """
+    Opaque cursor resuming after the product with the given sort key
+    """
+    raw = json.dumps({"s": sort, "k": list(key)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor into (sort, key)
+
+    Raises:
+    - ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return data["s"], tuple(data["k"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ProductPage:
+    """
+    One page of a product query
+
+    Attributes:
+    - catalog (list): Catalog snapshot the rows refer to
+    - rows (list): Catalog rows of the products on this page, in order
+    - total (int): Number of products matching the filters
+    - next_cursor (str or None): Cursor for the following page, None on the last page
+    """
+
+    def __init__(self, catalog, rows, total, next_cursor):
+        self.catalog = catalog
+        self.rows = rows
+        self.total = total
+        self.next_cursor = next_cursor
+
+    def products(self, fields=None):
+        """
+        Yield the page's products, keeping only the given fields if any
+        """
+        for row in self.rows:
+            product = self.catalog[row]
+            yield product if not fields else {field: product[field] for field in fields if field in product}
+
+
+class ProductQuery:
+    """
+    Filtered, sorted and paginated views over one catalog snapshot
+
+    Filter and sort columns are numpy arrays built from the snapshot on first
+    use (straight from the columns of a columnar catalog), so a query is a few
+    vectorized mask operations over the whole catalog plus a slice of a
+    precomputed sort order. Pagination is keyset-based: a cursor holds the
+    sort key of the last product returned, so it stays valid when the
+    catalog changes between pages.
+    """
+
+    def __init__(self, index):
+        """
+        Parameters:
+        - index (CatalogIndex or ColumnarCatalogIndex): Catalog snapshot to query
+        """
+        self.index = index
+        self.products = index.products
+        self._columns = {}
+        self._lock = threading.RLock()
+
+    def _column(self, name, build=None):
+        """
+        Build (once) and return a named column, using build() or the matching _build_ method
+        """
+        column = self._columns.get(name)
+        if column is None:
+            with self._lock:
+                column = self._columns.get(name)
+                if column is None:
+                    column = self._columns[name] = (build or getattr(self, f'_build_{name}'))()
+        return column
+
+    def _values(self, field):
+        return [product.get(field) for product in self.products]
+
+    def _numeric(self, field):
+        # Missing or non-numeric values become NaN, which fails every comparison
+        if isinstance(self.products, ColumnarCatalog):
+            return self.products.numeric(field)
+        values = [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in self._values(field)]
+        return np.array(values, dtype=np.float64)
+
+    def _build_price(self):
+        return self._numeric('price')
+
+    def _build_rating(self):
+        return self._numeric('rating')
+
+    def _build_inventory(self):
+        return self._numeric('inventory')
+
+    def _interned(self, field):
+        """
+        (values, codes) for a string field; missing values get the code len(values)
+        """
+        if isinstance(self.products, ColumnarCatalog):
+            return self.products.tables[field], self.products.codes(field)
+        vocab = {}
+        codes = np.array([vocab.setdefault(v, len(vocab)) if v is not None else -1 for v in self._values(field)],
+                         dtype=np.int32)
+        codes[codes < 0] = len(vocab)
+        return list(vocab), codes
+
+    def _build_category(self):
+        return self._interned('category')
+
+    def _build_brand(self):
+        return self._interned('brand')
+
+    def _build_tags(self):
+        """
+        (values, rows, codes) with one entry per tag occurrence
+        """
+        if isinstance(self.products, ColumnarCatalog):
+            rows, codes = self.products.tag_entries()
+            return self.products.tables['tags'], rows, codes
+        vocab = {}
+        rows = []
+        codes = []
+        for row, product in enumerate(self.products):
+            for tag in product.get('tags', ()):
+                rows.append(row)
+                codes.append(vocab.setdefault(tag, len(vocab)))
+        return list(vocab), np.array(rows, dtype=np.int64), np.array(codes, dtype=np.int64)
+
+    @staticmethod
+    def _ranks(values):
+        # Dense rank of each row's value: equal values share a rank, so ties fall through to the ID tie-break
+        values = np.array(values, dtype=str)
+        order = np.argsort(values, kind='stable')
+        ranks = np.empty(len(values), dtype=np.int64)
+        if len(values):
+            ordered = values[order]
+            ranks[order] = np.concatenate(([0], np.cumsum(ordered[1:] != ordered[:-1])))
+        return ranks
+
+    def _build_id_rank(self):
+        ids = self.products.ids() if isinstance(self.products, ColumnarCatalog) else self._values('id')
+        return self._ranks([str(pid) for pid in ids])
+
+    def _build_name_rank(self):
+        return self._ranks([str(product.get('name', '')) for product in self.products])
+
+    def _sort_values(self, sort):
+        """
+        Primary sort array for a sort field (ranks for id and name)
+        """
+        if sort in ('id', 'name'):
+            return self._column(f'{sort}_rank')
+        # Products without a value sort before every other product
+        return self._column(f'sort_{sort}', lambda: np.nan_to_num(self._column(sort), nan=-np.inf))
+
+    def _order(self, sort):
+        """
+        Rows in ascending (sort value, product ID) order
+        """
+        return self._column(
+            f'order_{sort}', lambda: np.lexsort((self._column('id_rank'), self._sort_values(sort)))
+        )
+
+    def _positions(self, sort):
+        """
+        Position of each row in the ascending order for a sort field
+        """
+        def build():
+            order = self._order(sort)
+            positions = np.empty(len(order), dtype=np.int64)
+            positions[order] = np.arange(len(order))
+            return positions
+        return self._column(f'positions_{sort}', build)
+
+    def sort_key(self, sort, row):
+        """
+        Comparable sort key of a row: (value, product ID)
+        """
+        product = self.products[row]
+        if sort == 'id':
+            return (str(product['id']),)
+        if sort == 'name':
+            return (str(product.get('name', '')), str(product['id']))
+        return (float(self._sort_values(sort)[row]), str(product['id']))
+
+    def _matching(self, field, wanted):
+        """
+        Boolean mask of rows whose interned field matches any wanted value (case-insensitive)
+        """
+        wanted = {value.lower() for value in wanted}
+        if field == 'tags':
+            values, rows, codes = self._column('tags')
+        else:
+            values, codes = self._column(field)
+        table = np.array([isinstance(v, str) and v.lower() in wanted for v in values] + [False], dtype=bool)
+        if len(values) <= FACET_BITMAP_VALUES:
+            # OR the matching values' bitmaps instead of scanning every row or tag
+            matched = np.bitwise_or.reduce(self._bitmaps(field)[table[:-1]], axis=0)
+            return np.unpackbits(matched.view(np.uint8), count=len(self.products), bitorder='little').view(bool)
+        if field != 'tags':
+            return table[codes]
+        mask = np.zeros(len(self.products), dtype=bool)
+        mask[rows[table[codes]]] = True
+        return mask
+
+    def filter_masks(self, categories=(), brands=(), tags=(), min_price=None, max_price=None,
+                     min_rating=None, in_stock=False):
+        """
+        Boolean mask per active filter, keyed by facet (category, brand, tags, price, rating, in_stock)
+
+        Values within a filter are alternatives (brand=A or brand=B).
+
+        Parameters:
+        - categories (list): Categories to include
+        - brands (list): Brands to include
+        - tags (list): Products carrying any of these tags
+        - min_price (float, optional): Lowest price
+        - max_price (float, optional): Highest price
+        - min_rating (float, optional): Lowest rating; unrated products are excluded
+        - in_stock (bool): Only products with positive inventory (or no inventory tracking)
+
+        Returns:
+        - dict: Facet name -> numpy.ndarray of bool
+        """
+        masks = {}
+        if categories:
+            masks['category'] = self._matching('category', categories)
+        if brands:
+            masks['brand'] = self._matching('brand', brands)
+        if tags:
+            masks['tags'] = self._matching('tags', tags)
+        if min_price is not None or max_price is not None:
+            price = self._column('price')
+            masks['price'] = (price >= (min_price if min_price is not None else -np.inf)) & \
+                             (price <= (max_price if max_price is not None else np.inf))
+        if min_rating is not None:
+            masks['rating'] = self._column('rating') >= min_rating
+        if in_stock:
+            masks['in_stock'] = ~(self._column('inventory') <= 0)
+        return masks
+
+    @staticmethod
+    def combine(masks):
+        """
+        AND of a list of masks, or None for an empty list
+        """
+        if not masks:
+            return None
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = mask & other
+        return mask
+
+    def filter_mask(self, **filters):
+        """
+        Boolean mask of the products passing every filter, or None when nothing is filtered
+
+        Accepts the keyword arguments of filter_masks(); filters are combined with AND.
+        """
+        return self.combine(list(self.filter_masks(**filters).values()))
+
+    def _build_tag_codes(self):
+        """
+        Tag codes per product as a padded (rows, max tags) matrix; padding is len(tag values)
+        """
+        values, rows, codes = self._column('tags')
+        offsets = np.searchsorted(rows, np.arange(len(self.products) + 1))
+        width = int(np.diff(offsets).max()) if len(rows) else 0
+        matrix = np.full((len(self.products), width), len(values), dtype=np.int32)
+        matrix[rows, np.arange(len(rows)) - offsets[rows]] = codes
+        return matrix
+
+    def _bitmaps(self, field):
+        """
+        Packed row bitmap per value of category, brand or tags (one row of uint64 words per value)
+        """
+        def build():
+            if field == 'tags':
+                values, rows, codes = self._column('tags')
+            else:
+                values, codes = self._column(field)
+                rows = np.arange(len(codes))
+            words = (len(self.products) + 63) // 64
+            bitmaps = np.zeros((len(values), words * 8), dtype=np.uint8)
+            for code in range(len(values)):
+                present = np.zeros(words * 64, dtype=bool)
+                present[rows[codes == code]] = True
+                bitmaps[code] = np.packbits(present, bitorder='little')
+            return bitmaps.view(np.uint64)
+        return self._column(f'bitmaps_{field}', build)
+
+    def facet_counts(self, field, mask=None, limit=10):
+        """
+        Most common values of category, brand or tags among the rows selected by mask
+
+        Fields with at most FACET_BITMAP_VALUES distinct values are counted by
+        intersecting per-value row bitmaps with the mask; others by counting
+        the codes of the selected rows.
+
+        Returns:
+        - list: {"value", "count"} dicts, most frequent first
+        """
+        values = self._column(field)[0]
+        if len(values) <= FACET_BITMAP_VALUES:
+            bitmaps = self._bitmaps(field)
+            if mask is None:
+                counts = self._column(f'counts_{field}', lambda: popcount_rows(bitmaps))
+            else:
+                packed = np.zeros(bitmaps.shape[1] * 64, dtype=bool)
+                packed[:len(mask)] = mask
+                selected = np.packbits(packed, bitorder='little').view(np.uint64)
+                counts = popcount_rows(bitmaps & selected)
+        else:
+            codes = self._column('tag_codes') if field == 'tags' else self._column(field)[1]
+            if mask is not None:
+                codes = codes[np.flatnonzero(mask)]
+            counts = np.bincount(codes.ravel(), minlength=len(values) + 1)[:len(values)]
+        top = np.argsort(-counts, kind='stable')[:limit]
+        return [{"value": values[code], "count": int(counts[code])} for code in top.tolist() if counts[code] > 0]
+
+    def price_counts(self, edges, mask=None):
+        """
+        Number of selected products per price bucket
+
+        Parameters:
+        - edges (list): Ascending bucket lower bounds; the last bucket is open-ended
+        - mask (numpy.ndarray, optional): Rows to count
+
+        Returns:
+        - list: {"min", "max", "count"} dicts, "max" is None for the last bucket
+        """
+        edges = list(edges)
+        # Bucket 0 holds prices below the first edge (and missing prices)
+        buckets = self._column(
+            f'price_buckets_{edges}',
+            lambda: np.searchsorted(np.array(edges, dtype=np.float64), np.nan_to_num(self._column('price'), nan=-np.inf),
+                                    side='right').astype(np.int16)
+        )
+        if mask is not None:
+            buckets = buckets[np.flatnonzero(mask)]
+        counts = np.bincount(buckets, minlength=len(edges) + 1)[1:]
+        return [
+            {"min": low, "max": edges[i + 1] if i + 1 < len(edges) else None, "count": int(counts[i])}
+            for i, low in enumerate(edges)
+        ]
+
+    def page(self, sort='id', descending=False, limit=50, cursor=None, **filters):
+        """
+        Return one page of matching products
+
+        Parameters:
+        - sort (str): One of SORT_FIELDS
+        - descending (bool): Reverse the sort order
+        - limit (int): Maximum products on the page
+        - cursor (str, optional): next_cursor of the previous page
+        - filters: Keyword arguments accepted by filter_mask()
+
+        Returns:
+        - ProductPage
+
+        Raises:
+        - ValueError: If the sort field or cursor is invalid
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort by {sort}; use one of {', '.join(SORT_FIELDS)}")
+        count = len(self.products)
+        order = self._order(sort)
+        start = 0
+        if cursor:
+            cursor_sort, key = decode_cursor(cursor)
+            if cursor_sort != sort:
+                raise ValueError("Cursor was issued for a different sort order")
+            key_at = lambda position: self.sort_key(sort, int(order[position]))
+            try:
+                if descending:
+                    start = count - bisect.bisect_left(range(count), key, key=key_at)
+                else:
+                    start = bisect.bisect_right(range(count), key, key=key_at)
+            except TypeError:
+                raise ValueError("Invalid cursor")
+
+        mask = self.filter_mask(**filters)
+        if mask is None:
+            total = count
+            rows = (order[::-1] if descending else order)[start:]
+        else:
+            # Sort the matching rows' positions in the order rather than scanning the whole order
+            positions = np.sort(self._positions(sort)[mask])
+            total = len(positions)
+            if descending:
+                positions = positions[positions < count - start][::-1]
+            else:
+                positions = positions[positions >= start]
+            rows = order[positions]
+        page = rows[:limit].tolist()
+        next_cursor = None
+        if len(rows) > limit and page:
+            next_cursor = encode_cursor(sort, self.sort_key(sort, page[-1]))
+        return ProductPage(self.products, page, total, next_cursor)
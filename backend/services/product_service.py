@@ -1,46 +1,409 @@
+import hashlib
 import json
+import os
+import threading
 from config import config
+from services.catalog_index import CatalogIndex
+from services.columnar_catalog import CURRENT_FILE, ColumnarCatalog, ColumnarCatalogIndex, write_catalog
+from services.product_query import ProductQuery
+
+# Fields every product needs for indexing, scoring and prompts
+REQUIRED_FIELDS = ('id', 'name', 'category', 'price', 'brand')
+
+# Fields that do not affect product text (embeddings, prompt snippets other than price)
+NON_TEXT_FIELDS = {'price', 'inventory', 'rating'}
+
+# Sidecar next to DATA_PATH recording the version of the catalog save() wrote
+VERSION_SUFFIX = '.version'
+
+
+class CatalogChanges:
+    """
+    Products touched between two catalog versions
+    """
+
+    def __init__(self):
+        self.product_ids = set()
+        self.fields = set()
+        self.added = False
+        self.deleted = False
+
+    @property
+    def text_changed(self):
+        """
+        Whether products were added, deleted, or had descriptive fields changed
+        """
+        return self.added or self.deleted or bool(self.fields - NON_TEXT_FIELDS)
+
+
+def validate_product(product):
+    """
+    Raise ValueError unless product has the required fields with usable types
+    """
+    if not isinstance(product, dict):
+        raise ValueError("Product must be an object")
+    missing = [field for field in REQUIRED_FIELDS if product.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Product {product.get('id', '?')} is missing {', '.join(missing)}")
+    if isinstance(product['price'], bool) or not isinstance(product['price'], (int, float)):
+        raise ValueError(f"Product {product['id']} has a non-numeric price")
+    if not isinstance(product.get('tags', []), list) or not isinstance(product.get('features', []), list):
+        raise ValueError(f"Product {product['id']} tags and features must be lists")
+
+
+class _HashingWriter:
+    """
+    File wrapper hashing the UTF-8 bytes written through it
+    """
+
+    def __init__(self, file, digest):
+        self.file = file
+        self.digest = digest
+
+    def write(self, text):
+        self.digest.update(text.encode('utf-8'))
+        return self.file.write(text)
+
 
 class ProductService:
     """
     Service to handle product data operations
+
+    The catalog lives in a CatalogIndex snapshot that is replaced in a single
+    assignment, so readers always see one consistent version. Snapshots are
+    swapped by reloading the data file (reload_if_changed() is polled by the
+    file watcher) or by applying incremental upserts, patches and deletes.
+    Each snapshot has a version that downstream caches key on, and a bounded
+    change log lets derived indexes update only what changed.
+
+    With CATALOG_FORMAT=columnar the catalog is read from memory-mapped
+    columns under CATALOG_COLUMNAR_PATH (see services.columnar_catalog)
+    instead of parsing DATA_PATH.
     """
-    
+
     def __init__(self):
         """
         Initialize the product service with data path from config
         """
         self.data_path = config['DATA_PATH']
-        self.products = self._load_products()
-    
+        self.columnar_path = config['CATALOG_COLUMNAR_PATH'] if config['CATALOG_FORMAT'] == 'columnar' else None
+        self.change_log_size = config['CATALOG_CHANGE_LOG_SIZE']
+        self._change_log = []
+        self._file_stamp = None
+        self._write_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._saved_version = None
+        self._query = None
+        loaded = self._load_index()
+        if loaded is None:
+            self.index = CatalogIndex([])
+        else:
+            self.index, self._file_stamp = loaded
+            self._saved_version = self.index.version
+
+    @property
+    def products(self):
+        return self.index.products
+
+    @property
+    def version(self):
+        return self.index.version
+
+    def _stat_file(self):
+        # A columnar catalog changes when its CURRENT pointer is replaced
+        path = os.path.join(self.columnar_path, CURRENT_FILE) if self.columnar_path else self.data_path
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _version_path(self):
+        return f"{self.data_path}{VERSION_SUFFIX}"
+
+    def _file_version(self, digest):
+        """
+        Version of a data file with the given SHA-1: the one save() recorded for it, else its content hash
+        """
+        try:
+            with open(self._version_path()) as file:
+                saved = json.load(file)
+            if saved.get('sha1') == digest and saved.get('version'):
+                return str(saved['version'])
+        except (OSError, ValueError, AttributeError):
+            pass
+        return digest[:12]
+
     def _load_products(self):
         """
         Load products from the JSON data file
+
+        The catalog version is a content hash of the file, or for a file
+        written by save() the version it was saved at, so every worker
+        loading the same data agrees on it with the worker that wrote it.
+
+        Records failing validate_product() are skipped and logged, so one bad
+        record does not take the rest of the catalog down with it.
+
+        Returns:
+        - tuple or None: (products, version, file stamp), None if the file cannot be read or is not a list
         """
         try:
-            with open(self.data_path, 'r') as file:
-                return json.load(file)
+            stamp = self._stat_file()
+            with open(self.data_path, 'rb') as file:
+                raw = file.read()
+            records = json.loads(raw)
+            if not isinstance(records, list):
+                raise ValueError("Product data must be a list")
+            products = []
+            errors = []
+            for product in records:
+                try:
+                    validate_product(product)
+                except ValueError as e:
+                    errors.append(str(e))
+                    continue
+                products.append(product)
+            if errors:
+                print(f"Skipped {len(errors)} invalid products: {'; '.join(errors[:5])}")
+            return products, self._file_version(hashlib.sha1(raw).hexdigest()), stamp
         except Exception as e:
             print(f"Error loading product data: {str(e)}")
-            return []
-    
+            return None
+
+    def _load_index(self):
+        """
+        Load the catalog in the configured format and index it
+
+        Returns:
+        - tuple or None: (index, file stamp), None if the catalog cannot be read or is invalid
+        """
+        if self.columnar_path:
+            try:
+                stamp = self._stat_file()
+                return ColumnarCatalogIndex(ColumnarCatalog.open(self.columnar_path)), stamp
+            except Exception as e:
+                print(f"Error loading columnar catalog: {str(e)}")
+                return None
+        loaded = self._load_products()
+        if loaded is None:
+            return None
+        products, version, stamp = loaded
+        return CatalogIndex(products, version), stamp
+
+    def reload(self):
+        """
+        Re-read the data file and swap in a freshly built snapshot
+
+        Safe to call from a worker thread. A file that fails to load or
+        validate leaves the current catalog in place, and so does a reload
+        that raced with incremental changes (the next poll retries it).
+
+        Returns:
+        - bool: True if the catalog changed
+        """
+        base = self.index
+        loaded = self._load_index()
+        if loaded is None:
+            # Don't retry (and log) the same broken file on every poll
+            self._file_stamp = self._stat_file()
+            return False
+        index, stamp = loaded
+        version = index.version
+        if version == base.version:
+            self._file_stamp = stamp
+            return False
+        with self._swap_lock:
+            if self.index is not base:
+                return False
+            self.index = index
+            self._file_stamp = stamp
+            self._saved_version = version
+            # Derived indexes cannot be patched across a full reload
+            self._change_log = []
+        return True
+
+    def reload_if_changed(self):
+        """
+        Reload the data file if it changed since it was last read or written
+
+        Returns:
+        - bool: True if the catalog changed
+        """
+        # Waiting for an in-progress save() keeps our own writes from looking like external edits
+        with self._write_lock:
+            stamp = self._stat_file()
+            if stamp is None or stamp == self._file_stamp:
+                return False
+            return self.reload()
+
+    def apply_changes(self, upserts=(), patches=(), deletes=()):
+        """
+        Apply incremental catalog changes as one new version
+
+        Parameters:
+        - upserts (list): Complete products, replacing any product with the same ID
+        - patches (list): Partial products with an "id", merged into existing products (e.g. price, inventory)
+        - deletes (list): IDs of products to remove
+
+        Returns:
+        - dict: New version and the number of products upserted, patched and deleted
+
+        Raises:
+        - ValueError: If a product is invalid or a patch targets an unknown product
+        """
+        index = self.index
+        changes = CatalogChanges()
+        changed = {}
+        for product in upserts:
+            validate_product(product)
+            old = index.get(product['id'])
+            if old is None:
+                changes.added = True
+                changes.fields.update(product)
+            else:
+                changes.fields.update(k for k in set(old) | set(product) if old.get(k) != product.get(k))
+            changed[product['id']] = product
+        patched = 0
+        for patch in patches:
+            product_id = patch.get('id') if isinstance(patch, dict) else None
+            base = changed.get(product_id) or index.get(product_id)
+            if base is None:
+                raise ValueError(f"Product with ID {product_id} not found")
+            product = {**base, **patch}
+            validate_product(product)
+            changes.fields.update(k for k in patch if base.get(k) != patch[k])
+            changed[product_id] = product
+            patched += 1
+        deleted = [pid for pid in dict.fromkeys(deletes) if pid in index.by_id and pid not in changed]
+        changes.deleted = bool(deleted)
+        changes.product_ids.update(changed, deleted)
+
+        if not changes.product_ids:
+            return {"version": index.version, "upserted": 0, "patched": 0, "deleted": 0}
+
+        # Chain versions so every worker applying the same changes agrees on them;
+        # save() records the version with the file for workers that reload it instead
+        encoded = json.dumps(
+            {"base": index.version, "upserts": list(changed.values()), "deletes": deleted},
+            sort_keys=True, default=str
+        )
+        version = hashlib.sha1(encoded.encode('utf-8')).hexdigest()[:12]
+        updated = index.apply_changes(changed.values(), deleted, version)
+        with self._swap_lock:
+            if self.index is not index:
+                # A reload landed meanwhile; apply the changes on top of it
+                return self.apply_changes(upserts, patches, deletes)
+            self.index = updated
+            self._change_log.append((index.version, version, changes))
+            del self._change_log[:-self.change_log_size]
+        return {"version": version, "upserted": len(upserts), "patched": patched, "deleted": len(deleted)}
+
+    def changes_since(self, version):
+        """
+        Merge the changes made after a catalog version
+
+        Parameters:
+        - version (str): Version a derived index was built from
+
+        Returns:
+        - CatalogChanges or None: None if the version is unknown or older than the change log
+        """
+        merged = CatalogChanges()
+        if version == self.index.version:
+            return merged
+        start = next((i for i, (base, _, _) in enumerate(self._change_log) if base == version), None)
+        if start is None:
+            return None
+        for _, _, changes in self._change_log[start:]:
+            merged.product_ids |= changes.product_ids
+            merged.fields |= changes.fields
+            merged.added |= changes.added
+            merged.deleted |= changes.deleted
+        return merged
+
+    def save(self):
+        """
+        Atomically write the current catalog back to the data file (or a new columnar version)
+
+        Safe to call from a worker thread; does nothing if this version is
+        already on disk. The file watcher ignores this write, so the
+        in-memory version is kept. The version is recorded in a sidecar file
+        (keyed by the data file's hash) before the data file is replaced, so
+        other workers reloading the file pick up the same version.
+        """
+        with self._write_lock:
+            index = self.index
+            if index.version == self._saved_version:
+                return
+            if self.columnar_path:
+                write_catalog(index.products, self.columnar_path, index.version)
+            else:
+                temp_path = f"{self.data_path}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    digest = hashlib.sha1()
+                    json.dump(index.products, _HashingWriter(file, digest), indent=2)
+                version_temp_path = f"{self._version_path()}.tmp"
+                with open(version_temp_path, 'w') as file:
+                    json.dump({"sha1": digest.hexdigest(), "version": index.version}, file)
+                os.replace(version_temp_path, self._version_path())
+                os.replace(temp_path, self.data_path)
+            self._file_stamp = self._stat_file()
+            self._saved_version = index.version
+
     def get_all_products(self):
         """
         Return all products
         """
-        return self.products
-    
+        return self.index.products
+
+    def product_query(self):
+        """
+        Return the ProductQuery for the current catalog snapshot, building it after each change
+        """
+        query = self._query
+        if query is None or query.index is not self.index:
+            query = self._query = ProductQuery(self.index)
+        return query
+
     def get_product_by_id(self, product_id):
         """
         Get a specific product by ID
         """
-        for product in self.products:
-            if product['id'] == product_id:
-                return product
-        return None
-    
+        return self.index.get(product_id)
+
+    def get_products_by_ids(self, product_ids):
+        """
+        Get products for a list of IDs, skipping unknown IDs
+        """
+        return self.index.get_many(product_ids)
+
     def get_products_by_category(self, category):
         """
-        Get products filtered by category
+        Get products filtered by category (case-insensitive)
+        """
+        return self.index.with_category(category)
+
+    def get_products_by_brand(self, brand):
+        """
+        Get products filtered by brand (case-insensitive)
+        """
+        return self.index.with_brand(brand)
+
+    def get_products_in_price_range(self, min_price=0, max_price=float('inf')):
+        """
+        Get products within a price range, ordered by price
+        """
+        return self.index.in_price_range(min_price, max_price)
+
+    def get_categories(self):
+        """
+        Get the sorted list of distinct categories
+        """
+        return self.index.categories
+
+    def get_brands(self):
+        """
+        Get the sorted list of distinct brands
         """
-        return [p for p in self.products if p['category'] == category]
\ No newline at end of file
+        return self.index.brands
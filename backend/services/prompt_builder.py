@@ -0,0 +1,281 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to the regex estimate below
+    tiktoken = None
+
+PROMPT_HEADER = """You are an expert e-commerce personalization engine that provides highly tailored product recommendations.
+Your task is to analyze a user's preferences and browsing history, then recommend products that would genuinely interest them.
+For each recommendation, provide thoughtful reasoning that connects the product's attributes to the user's demonstrated preferences.
+
+Follow these guidelines:
+1. Prioritize products that match multiple preference criteria
+2. Consider both explicit preferences AND implicit interests shown in browsing history
+3. Recommend a diverse selection (don't recommend too many similar items)
+4. For each recommendation, provide specific reasons why this product matches the user's preferences
+5. If the user has browsed products from a specific brand, consider recommending other products from that brand
+6. Consider price sensitivity based on the price range of browsed products
+
+Your response MUST be in valid JSON format as shown in the example below:
+[
+  {
+    "product_id": "product123",
+    "explanation": "This product matches your preference for athletic gear and aligns with your interest in running shoes based on your browsing history. The price point is within your preferred range, and it features the lightweight design you indicated as important.",
+    "score": 9
+  },
+  ...
+]
+"""
+
+PROMPT_TASK = """
+
+## RECOMMENDATION TASK
+Based on the user preferences and browsing history above, recommend 5 products from the available catalog.
+For each recommendation, provide:
+1. The product_id
+2. A detailed explanation (2-3 sentences) on why this product matches the user's preferences and browsing patterns
+3. A confidence score from 1-10 indicating how well this matches their preferences
+
+Return ONLY a valid JSON array with these recommendations. Do not include any other text or explanation outside the JSON structure."""
+
+EXPLAIN_PROMPT = """You are an e-commerce assistant. The products below were already chosen for a shopper with these preferences:
+{preferences}
+Products, one per line, columns: {columns}
+{products}
+For each product write one sentence (at most 30 words) explaining why it suits these preferences. Do not mention other products.
+Return ONLY a valid JSON array: [{{"product_id": "...", "explanation": "..."}}]"""
+
+COMPACT_COLUMNS = "id|name|category|subcategory|price|brand|tags|features"
+
+ESTIMATE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Headroom on the estimate for the IDs, numbers and rare words BPE splits into several tokens
+ESTIMATE_MARGIN = 1.25
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens with tiktoken when installed, otherwise estimates
+
+    tiktoken is optional (`pip install tiktoken`; it downloads its encodings
+    on first use). The estimate counts words and punctuation marks, which
+    is close to the BPE count for plain English but low for product IDs,
+    prices and brand names, so it is scaled up by ESTIMATE_MARGIN to keep
+    prompts within the budget rather than just over it.
+    """
+
+    def __init__(self, model_name=None):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except Exception:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return math.ceil(len(ESTIMATE_PATTERN.findall(text)) * ESTIMATE_MARGIN)
+
+
+def _truncate(text, limit):
+    if text and len(text) > limit:
+        return text[:limit - 3] + "..."
+    return text
+
+
+def _compact_field(value):
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def render_candidate(product, prompt_format):
+    """
+    Render a candidate product as a prompt snippet (without its list number)
+    """
+    if prompt_format == "compact":
+        return "|".join(_compact_field(v) for v in (
+            product['id'],
+            product['name'],
+            product['category'],
+            product.get('subcategory', ''),
+            product['price'],
+            product['brand'],
+            ";".join(product.get('tags', [])),
+            ";".join(product.get('features', [])[:3])
+        )) + "\n"
+
+    lines = [
+        f"{product['name']} (ID: {product['id']})\n",
+        f"   - Category: {product['category']}, Subcategory: {product.get('subcategory', 'N/A')}\n",
+        f"   - Price: ${product['price']}, Brand: {product['brand']}\n",
+        f"   - Tags: {', '.join(product.get('tags', []))}\n"
+    ]
+    # Include features as they're important for recommendations
+    if 'features' in product and product['features']:
+        lines.append(f"   - Features: {', '.join(product['features'][:3])}\n")
+    return "".join(lines)
+
+
+def render_browsed(product):
+    """
+    Render a browsed product as a prompt snippet (without its list number)
+    """
+    # Truncate description to save tokens
+    description = _truncate(product.get('description', ''), 100)
+    return "".join([
+        f"{product['name']} (ID: {product['id']})\n",
+        f"   - Category: {product['category']}, Subcategory: {product.get('subcategory', 'N/A')}\n",
+        f"   - Price: ${product['price']}, Brand: {product['brand']}, Rating: {product.get('rating', 'N/A')}\n",
+        f"   - Tags: {', '.join(product.get('tags', []))}\n",
+        f"   - Description: {description}\n"
+    ])
+
+
+class PromptBuilder:
+    """
+    Assembles recommendation prompts within a token budget
+
+    Each product's rendered snippet and its token count are cached per catalog
+    version, so building a prompt is a handful of dict lookups and one join.
+    The cache is an LRU of at most max_snippets entries, so a large catalog
+    keeps only the snippets of products that are actually recommended.
+    Candidates are packed in ranked order until the budget left after the
+    fixed sections runs out.
+    """
+
+    def __init__(self, token_budget=3000, prompt_format="verbose", model_name=None, max_snippets=20000):
+        """
+        Parameters:
+        - token_budget (int): Maximum prompt size in tokens
+        - prompt_format (str): "verbose" (one block per product) or "compact" (one table row per product)
+        - model_name (str, optional): Model whose tokenizer to use when tiktoken is installed
+        - max_snippets (int): Most rendered snippets to keep; 0 disables caching
+        """
+        if prompt_format not in ("verbose", "compact"):
+            raise ValueError(f"Unknown prompt format: {prompt_format}")
+        self.token_budget = token_budget
+        self.prompt_format = prompt_format
+        self.counter = TokenCounter(model_name)
+        self.header_tokens = self.counter.count(PROMPT_HEADER) + self.counter.count(PROMPT_TASK)
+        self.max_snippets = max_snippets
+        self._snippets = OrderedDict()
+        self._lock = threading.Lock()
+        self.catalog_version = None
+
+    def invalidate(self, catalog_version, product_ids=None):
+        """
+        Move the snippet cache to a new catalog version
+
+        Parameters:
+        - catalog_version (str): Version the cache now belongs to
+        - product_ids (iterable, optional): Products whose snippets changed; None drops every snippet
+        """
+        with self._lock:
+            if product_ids is None:
+                self._snippets = OrderedDict()
+            else:
+                product_ids = set(product_ids)
+                self._snippets = OrderedDict(
+                    (key, value) for key, value in self._snippets.items() if key[1] not in product_ids
+                )
+            self.catalog_version = catalog_version
+
+    def _snippet(self, kind, product, catalog_version):
+        """
+        Cached (text, tokens) for a product snippet
+        """
+        if catalog_version != self.catalog_version:
+            self.invalidate(catalog_version)
+        key = (kind, product['id'])
+        with self._lock:
+            cached = self._snippets.get(key)
+            if cached is not None:
+                self._snippets.move_to_end(key)
+                return cached
+        text = render_browsed(product) if kind == "browsed" else render_candidate(product, kind)
+        cached = (text, self.counter.count(text))
+        if self.max_snippets > 0:
+            with self._lock:
+                self._snippets[key] = cached
+                while len(self._snippets) > self.max_snippets:
+                    self._snippets.popitem(last=False)
+        return cached
+
+    def build(self, user_preferences, browsed_products, candidates, catalog_version=None):
+        """
+        Build the recommendation prompt
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - candidates (list): Candidate products, most relevant first
+        - catalog_version (str, optional): Catalog version snippets are cached under
+
+        Returns:
+        - tuple: (prompt, number of candidates included, estimated prompt tokens)
+        """
+        parts = [PROMPT_HEADER]
+
+        # Add user preferences to the prompt
+        parts.append("\n\n## USER PREFERENCES\n")
+        if user_preferences:
+            for key, value in user_preferences.items():
+                parts.append(f"- {key}: {value}\n")
+        else:
+            parts.append("- No explicit preferences provided\n")
+
+        # Add browsing history to the prompt
+        parts.append("\n\n## BROWSING HISTORY\n")
+        if browsed_products:
+            for i, product in enumerate(browsed_products, 1):
+                parts.append(f"{i}. ")
+                parts.append(self._snippet("browsed", product, catalog_version)[0])
+        else:
+            parts.append("- No browsing history available\n")
+
+        # Add available products (filtered for relevance)
+        parts.append("\n\n## AVAILABLE PRODUCTS FOR RECOMMENDATION\n")
+        if self.prompt_format == "compact":
+            parts.append(f"One product per line, columns: {COMPACT_COLUMNS}\n")
+
+        used = self.header_tokens + self.counter.count("".join(parts[1:]))
+        included = 0
+        for i, product in enumerate(candidates, 1):
+            text, tokens = self._snippet(self.prompt_format, product, catalog_version)
+            # List numbers cost about two tokens in the verbose format
+            cost = tokens + (2 if self.prompt_format == "verbose" else 0)
+            if used + cost > self.token_budget and included > 0:
+                break
+            if self.prompt_format == "verbose":
+                parts.append(f"{i}. ")
+            parts.append(text)
+            used += cost
+            included += 1
+
+        # Final instructions
+        parts.append(PROMPT_TASK)
+        return "".join(parts), included, used
+
+    def build_explanations(self, user_preferences, products, catalog_version=None):
+        """
+        Build a prompt asking only for short explanations of already chosen products
+
+        Parameters:
+        - user_preferences (dict): Preferences the explanations address
+        - products (list): Products to explain
+        - catalog_version (str, optional): Catalog version snippets are cached under
+
+        Returns:
+        - str: Prompt for the LLM
+        """
+        preferences = "".join(f"- {key}: {value}\n" for key, value in user_preferences.items()) \
+            or "- No explicit preferences provided\n"
+        return EXPLAIN_PROMPT.format(
+            preferences=preferences.rstrip("\n"),
+            columns=COMPACT_COLUMNS,
+            products="".join(self._snippet("compact", product, catalog_version)[0] for product in products).rstrip("\n")
+        )
@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Preference keys holding lists whose order carries no meaning
+LIST_PREFERENCE_KEYS = ('preferred_categories', 'preferred_brands', 'categories', 'brands')
+
+# Disk caches: drop expired entries and trim to max_entries once per this many writes (or a tenth of max_entries)
+PRUNE_EVERY = 100
+
+
+def _canonical_value(key, value):
+    """
+    Normalize a single preference value so equivalent inputs compare equal
+    """
+    if isinstance(value, dict):
+        return {k: _canonical_value(k, v) for k, v in sorted(value.items())}
+    if key in LIST_PREFERENCE_KEYS:
+        if isinstance(value, str):
+            value = value.split(',')
+        if isinstance(value, list):
+            return sorted({v.strip() if isinstance(v, str) else v for v in value if v not in ('', None)}, key=str)
+    if isinstance(value, list):
+        return [_canonical_value(None, v) for v in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def canonicalize_inputs(user_preferences, browsing_history, catalog_version, history_order_sensitive=False):
+    """
+    Build a canonical, JSON-serializable form of a recommendation request
+
+    Parameters:
+    - user_preferences (dict): User's stated preferences
+    - browsing_history (list): List of product IDs the user has viewed
+    - catalog_version (str): Version of the catalog the result depends on
+    - history_order_sensitive (bool): Keep history order instead of treating it as a set
+
+    Returns:
+    - dict: Canonical representation of the inputs
+    """
+    history = list(dict.fromkeys(browsing_history or []))
+    if not history_order_sensitive:
+        history.sort()
+    return {
+        "preferences": _canonical_value(None, user_preferences or {}),
+        "history": history,
+        "catalog_version": catalog_version
+    }
+
+
+def make_cache_key(user_preferences, browsing_history, catalog_version, history_order_sensitive=False):
+    """
+    Hash the canonical form of a recommendation request into a cache key
+    """
+    canonical = canonicalize_inputs(user_preferences, browsing_history, catalog_version, history_order_sensitive)
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class InMemoryCacheBackend:
+    """
+    Size-bounded LRU cache held in process memory
+    """
+
+    # Calls are cheap dict operations, run directly on the event loop
+    executor = None
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCacheBackend:
+    """
+    Size-bounded LRU cache stored in a SQLite file
+
+    Survives restarts and can be shared by several workers on the same host.
+    Values are stored as JSON. Counting the entries scans the table, so
+    instead of checking the size on every write, expired entries are
+    dropped and the cache trimmed to max_entries once per PRUNE_EVERY
+    writes, or per tenth of max_entries if that is fewer, so it runs at
+    most that many entries over in between.
+
+    Calls block on disk I/O and locks held by other workers, so callers on
+    the event loop run them on `executor`, a single thread that also owns
+    the connection.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache")
+        self._writes = 0
+        self._prune_every = max(1, min(PRUNE_EVERY, max_entries // 10))
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recommendation_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_recommendation_cache_access "
+            "ON recommendation_cache (last_access)"
+        )
+        self.prune()
+
+    def get(self, key):
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM recommendation_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            self._conn.execute("DELETE FROM recommendation_cache WHERE key = ?", (key,))
+            return None
+        self._conn.execute("UPDATE recommendation_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO recommendation_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now)
+        )
+        self._writes += 1
+        if self._writes % self._prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        Delete expired entries, then the least recently used ones beyond max_entries
+
+        Returns:
+        - int: Number of entries evicted for size
+        """
+        self._conn.execute("DELETE FROM recommendation_cache WHERE expires_at < ?", (time.time(),))
+        overflow = len(self) - self.max_entries
+        if overflow <= 0:
+            return 0
+        self._conn.execute(
+            "DELETE FROM recommendation_cache WHERE key IN "
+            "(SELECT key FROM recommendation_cache ORDER BY last_access LIMIT ?)",
+            (overflow,)
+        )
+        self.evictions += overflow
+        return overflow
+
+    def clear(self):
+        self._conn.execute("DELETE FROM recommendation_cache")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM recommendation_cache").fetchone()[0]
+
+
+async def call_backend(backend, method, *args):
+    """
+    Call a cache backend method, on the backend's own thread if it does blocking I/O
+    """
+    if backend.executor is None:
+        return method(*args)
+    return await asyncio.get_running_loop().run_in_executor(backend.executor, method, *args)
+
+
+class RecommendationCache:
+    """
+    TTL cache of parsed recommendation results with hit/miss counters
+
+    get(), set() and stats() are coroutines, so a disk backend never blocks the event loop.
+    """
+
+    def __init__(self, backend, ttl=3600, history_order_sensitive=False):
+        """
+        Parameters:
+        - backend: Storage backend implementing get/set/clear/__len__
+        - ttl (float): Seconds a cached result stays valid
+        - history_order_sensitive (bool): Whether browsing history order is part of the key
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.history_order_sensitive = history_order_sensitive
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, user_preferences, browsing_history, catalog_version):
+        """
+        Cache key for a recommendation request
+        """
+        return make_cache_key(user_preferences, browsing_history, catalog_version, self.history_order_sensitive)
+
+    async def get(self, key):
+        value = await call_backend(self.backend, self.backend.get, key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        await call_backend(self.backend, self.backend.set, key, value, self.ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+    async def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": await call_backend(self.backend, len, self.backend),
+            "evictions": self.backend.evictions
+        }
+
+
+def create_recommendation_cache(settings):
+    """
+    Build the recommendation cache described by the config, or None if disabled
+
+    Parameters:
+    - settings (dict): Application config
+
+    Returns:
+    - RecommendationCache or None
+    """
+    backend_name = settings['CACHE_BACKEND'].lower()
+    if backend_name in ('none', 'off', ''):
+        return None
+    if backend_name == 'disk':
+        backend = DiskCacheBackend(settings['CACHE_PATH'], settings['CACHE_MAX_ENTRIES'])
+    elif backend_name == 'memory':
+        backend = InMemoryCacheBackend(settings['CACHE_MAX_ENTRIES'])
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {settings['CACHE_BACKEND']}")
+    return RecommendationCache(backend, settings['CACHE_TTL'], settings['CACHE_HISTORY_ORDER_SENSITIVE'])
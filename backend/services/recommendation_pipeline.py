@@ -0,0 +1,693 @@
+import asyncio
+import random
+import threading
+import time
+
+import numpy as np
+
+from services.metrics import CANDIDATES, LLM_RESPONSES, PIPELINE_STAGE_LATENCY
+from services.response_parser import StreamingRecommendationParser, parse_recommendations
+
+# Signals the local ranker combines, in feature-matrix column order
+FEATURES = ('rules', 'embedding', 'co_view', 'keyword')
+
+# When the LLM stage runs
+LLM_ALWAYS = 'always'
+LLM_AUTO = 'auto'
+LLM_NEVER = 'never'
+LLM_EXPLAIN = 'explain'
+
+# The shortlist is filled up to this many products so the LLM has a choice
+MIN_SHORTLIST = 10
+
+
+class PipelineContext:
+    """
+    State of one recommendation request as it moves through the pipeline
+
+    Candidate generators add signals, feature extraction and the ranker turn
+    them into a ranked shortlist, post-filters prune it, and the LLM stage or
+    the local explainer sets result. Once result is set the remaining stages
+    are skipped.
+    """
+
+    def __init__(self, user_preferences, browsed_products, all_products, priority=None, budget=0):
+        """
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - all_products (list): Full product catalog
+        - priority (int, optional): INTERACTIVE or BATCH, for the LLM call
+        - budget (float): Seconds for the local stages; optional stages are skipped once it is spent (0 = no limit)
+        """
+        self.user_preferences = user_preferences
+        self.browsed_products = browsed_products
+        self.all_products = all_products
+        self.priority = priority
+        self.budget = budget
+        self.criteria = None
+        self.engine = None
+        self.rule_scores = None
+        self.similar = []
+        self.signals = {}
+        self.rows = None
+        self.features = None
+        self.ranked = []
+        self.result = None
+        self.cacheable = True
+        self.timings = {}
+        self.skipped = {}
+        self.next_stage = 0
+        self.started = time.perf_counter()
+
+    @property
+    def shortlist(self):
+        """
+        Products of the ranked shortlist, best first
+        """
+        return [product for product, _ in self.ranked]
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def over_budget(self):
+        return self.budget > 0 and self.elapsed() >= self.budget
+
+
+class Stage:
+    """
+    One step of the recommendation pipeline
+
+    Subclasses implement run(context), either as a plain method (local
+    stages) or as a coroutine (stages that call out, like the LLM). An
+    async stage may also implement stream(context), an async generator
+    yielding recommendations as they arrive, for streamed requests.
+    Optional local stages are skipped once the local budget is spent; an
+    async stage with a budget is cancelled when it runs over, which fails
+    the request unless the stage is optional.
+    """
+
+    name = None
+    optional = False
+    budget = 0
+
+    def enabled(self, context):
+        """
+        Whether the stage applies to this request at all
+        """
+        return True
+
+    def skip_reason(self, context):
+        """
+        Reason to skip an enabled stage for this request, or None to run it
+        """
+        return None
+
+    def run(self, context):
+        raise NotImplementedError
+
+
+class RuleCandidates(Stage):
+    """
+    Score the whole catalog against the category, brand, price and tag criteria
+    """
+
+    name = 'rules'
+
+    def __init__(self, service):
+        self.service = service
+
+    def run(self, context):
+        context.criteria = self.service._relevance_criteria(context.user_preferences, context.browsed_products)
+        context.engine = self.service._get_scoring_engine(context.all_products)
+        context.rule_scores = context.engine.score(**context.criteria)
+
+
+class EmbeddingCandidates(Stage):
+    """
+    Products semantically close to the user's preferences and history
+    """
+
+    name = 'embedding'
+    optional = True
+
+    def __init__(self, service):
+        self.service = service
+
+    def enabled(self, context):
+        return self.service.retrieval_enabled
+
+    def run(self, context):
+        context.similar = self.service._retrieve_similar(
+            context.user_preferences, context.browsed_products, context.all_products
+        )
+        context.signals['embedding'] = [(row, similarity) for row, similarity in context.similar if similarity > 0]
+
+
+class CoViewCandidates(Stage):
+    """
+    Products other shoppers viewed together with the browsed ones
+    """
+
+    name = 'co_view'
+    optional = True
+
+    def __init__(self, service):
+        self.service = service
+
+    def enabled(self, context):
+        return bool(self.service.co_view_weight) and bool(context.browsed_products)
+
+    def run(self, context):
+        row_by_id = context.engine.row_by_id
+        exclude_ids = context.criteria["exclude_ids"]
+        co_viewed = self.service.co_view.co_viewed([p['id'] for p in context.browsed_products])
+        context.signals['co_view'] = [
+            (row_by_id[product_id], weight) for product_id, weight in co_viewed.items()
+            if product_id in row_by_id and product_id not in exclude_ids
+        ]
+
+
+class KeywordCandidates(Stage):
+    """
+    Products matching the user's preferences and browsed product names by BM25
+    """
+
+    name = 'keyword'
+    optional = True
+
+    def __init__(self, service):
+        self.service = service
+
+    def enabled(self, context):
+        # Search rows index the service's catalog, so only use them against it
+        service = self.service
+        return service.search_service is not None and service.search_candidates_enabled and \
+            context.all_products is service.product_service.get_all_products()
+
+    def run(self, context):
+        context.signals['keyword'] = self.service._search_candidates(context.user_preferences, context.browsed_products)
+
+
+class FeatureExtraction(Stage):
+    """
+    Gather every candidate's signals into a feature matrix, one column per FEATURES entry
+
+    Candidates are the best `pool` rows by rule score plus every row a
+    generator returned. With non-negative weights no other row can reach
+    the top `pool` of the combined score, so ranking the candidates equals
+    ranking the whole catalog.
+    """
+
+    name = 'features'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def run(self, context):
+        rows = set(context.engine.top_k(context.rule_scores, self.pool).tolist())
+        for name, signal in context.signals.items():
+            CANDIDATES.labels(name).observe(len(signal))
+            rows.update(row for row, _ in signal)
+        rows = np.array(sorted(rows), dtype=np.int64)
+        features = np.zeros((len(rows), len(FEATURES)), dtype=np.float64)
+        features[:, 0] = context.rule_scores[rows]
+        for name, signal in context.signals.items():
+            if signal:
+                signal_rows = np.array([row for row, _ in signal], dtype=np.int64)
+                values = np.array([value for _, value in signal], dtype=np.float64)
+                np.add.at(features[:, FEATURES.index(name)], np.searchsorted(rows, signal_rows), values)
+        context.rows = rows
+        context.features = features
+        CANDIDATES.labels('features').observe(len(rows))
+
+
+class LocalRanker(Stage):
+    """
+    Rank candidates by a weighted sum of their features and keep the best `pool`
+
+    A shortlist shorter than MIN_SHORTLIST is filled with the nearest
+    embedding neighbours first and then with random products for diversity.
+    """
+
+    name = 'rank'
+
+    def __init__(self, weights, pool):
+        """
+        Parameters:
+        - weights (dict): Weight per FEATURES entry, missing ones count 0
+        - pool (int): Products to keep
+        """
+        self.weights = np.array([weights.get(name, 0.0) for name in FEATURES], dtype=np.float64)
+        self.pool = pool
+
+    def run(self, context):
+        products = context.engine.products
+        scores = context.features @ self.weights
+        keep = np.flatnonzero(scores > 0)
+        order = keep[np.lexsort((context.rows[keep], -scores[keep]))][:self.pool]
+        ranked = [(products[row], score) for row, score in zip(context.rows[order].tolist(), scores[order].tolist())]
+
+        if len(ranked) < MIN_SHORTLIST:
+            ranked_ids = {product['id'] for product, _ in ranked}
+            for row, _ in context.similar:
+                if len(ranked) >= MIN_SHORTLIST:
+                    break
+                product = context.all_products[row]
+                if product['id'] not in ranked_ids:
+                    ranked.append((product, 0.0))
+                    ranked_ids.add(product['id'])
+
+        if len(ranked) < MIN_SHORTLIST:
+            skip_ids = context.criteria["exclude_ids"] | {product['id'] for product, _ in ranked}
+            needed = MIN_SHORTLIST - len(ranked)
+            # Sample rows rather than filtering the whole catalog; enough extra rows to cover skipped IDs
+            all_products = context.all_products
+            for row in random.sample(range(len(all_products)), min(len(all_products), needed + len(skip_ids))):
+                product = all_products[row]
+                if product['id'] not in skip_ids and len(ranked) < MIN_SHORTLIST:
+                    ranked.append((product, 0.0))
+        context.ranked = ranked
+
+
+class PostFilters(Stage):
+    """
+    Drop out-of-stock products and cap products per brand, then cut the shortlist to `limit`
+    """
+
+    name = 'post_filter'
+
+    def __init__(self, limit, in_stock_only=False, max_per_brand=0):
+        """
+        Parameters:
+        - limit (int): Shortlist size
+        - in_stock_only (bool): Drop products with no inventory (products without inventory tracking stay)
+        - max_per_brand (int): Most products of one brand, 0 for no cap
+        """
+        self.limit = limit
+        self.in_stock_only = in_stock_only
+        self.max_per_brand = max_per_brand
+
+    def enabled(self, context):
+        return self.in_stock_only or self.max_per_brand > 0
+
+    def run(self, context):
+        per_brand = {}
+        kept = []
+        for product, score in context.ranked:
+            if self.in_stock_only and product.get('inventory', 1) <= 0:
+                continue
+            if self.max_per_brand > 0:
+                brand = product.get('brand')
+                if per_brand.get(brand, 0) >= self.max_per_brand:
+                    continue
+                per_brand[brand] = per_brand.get(brand, 0) + 1
+            kept.append((product, score))
+            if len(kept) >= self.limit:
+                break
+        context.ranked = kept
+
+
+class LLMRerank(Stage):
+    """
+    Ask the LLM to pick and explain recommendations from the shortlist
+
+    In "auto" mode the stage is optional: it is skipped when the shortlist
+    leaves nothing to choose (no more products than are recommended) or the
+    local ranking is already decisive (the last recommended product leads
+    the next one by at least `margin`), and a failing, unparseable or
+    over-budget call leaves the request to the local explainer.
+    """
+
+    name = 'llm'
+
+    def __init__(self, service, mode=LLM_ALWAYS, count=5, margin=0, budget=0):
+        """
+        Parameters:
+        - service (LLMService): Builds prompts, calls the LLM and parses responses
+        - mode (str): LLM_ALWAYS, LLM_AUTO or LLM_NEVER
+        - count (int): Recommendations the local explainer would serve
+        - margin (float): Score lead that makes the local ranking decisive in auto mode, 0 to never skip on it
+        - budget (float): Seconds to wait for the LLM, 0 for no limit
+        """
+        self.service = service
+        self.mode = mode
+        self.count = count
+        self.margin = margin
+        self.budget = budget
+        self.optional = mode == LLM_AUTO
+
+    def enabled(self, context):
+        return self.mode != LLM_NEVER
+
+    def skip_reason(self, context):
+        if self.mode != LLM_AUTO:
+            return None
+        if len(context.ranked) <= self.count:
+            return 'no_choice'
+        if self.margin > 0 and context.ranked[self.count - 1][1] - context.ranked[self.count][1] >= self.margin:
+            return 'decisive'
+        return None
+
+    async def run(self, context):
+        service = self.service
+        prompt = service._build_prompt(context.user_preferences, context.browsed_products, context.shortlist)
+        try:
+            content = await service._chat_completion(service._build_messages(prompt), priority=context.priority)
+        except Exception as e:
+            if not self.optional:
+                raise
+            print(f"Ranking locally after LLM failure: {str(e)}")
+            context.cacheable = False
+            return
+        result = service._parse_recommendation_response(content, context.all_products)
+        if result.get("recommendations") or not self.optional:
+            context.result = result
+        else:
+            context.cacheable = False
+
+    async def stream(self, context):
+        """
+        Like run(), but yield each recommendation as soon as the LLM finishes writing it
+
+        A failure after the first recommendation is raised even in auto
+        mode, since part of the answer has already been served.
+        """
+        service = self.service
+        prompt = service._build_prompt(context.user_preferences, context.browsed_products, context.shortlist)
+        get_product = service._product_getter(context.all_products)
+        parser = StreamingRecommendationParser(is_known=lambda product_id: get_product(product_id) is not None)
+        recommendations = []
+        try:
+            async for delta in service._chat_completion_stream(service._build_messages(prompt), priority=context.priority):
+                for rec in parser.feed(delta):
+                    recommendations.append(service._enrich_recommendation(rec, get_product))
+                    yield recommendations[-1]
+            # Salvage a final recommendation cut off by the token limit
+            for rec in parser.finish():
+                recommendations.append(service._enrich_recommendation(rec, get_product))
+                yield recommendations[-1]
+        except Exception as e:
+            if recommendations or not self.optional:
+                raise
+            print(f"Ranking locally after LLM failure: {str(e)}")
+            context.cacheable = False
+            return
+        finally:
+            service.parse_stats.merge(parser.stats)
+
+        LLM_RESPONSES.labels("parsed" if recommendations else "unparseable").inc()
+        if recommendations:
+            context.result = {"recommendations": recommendations, "count": len(recommendations)}
+        elif not self.optional:
+            context.result = {"recommendations": [], "error": "Could not parse recommendations from LLM response"}
+        else:
+            context.cacheable = False
+
+
+class LLMExplain(Stage):
+    """
+    Serve the top of the local ranking with explanations written by the LLM
+
+    The LLM does not choose products here: it is only asked for one short
+    sentence per product, and only for the products whose explanation for
+    the user's preference segment is not cached yet. Explanations it does
+    not return are templated. The stage is optional, so a call over budget
+    leaves the request to the local explainer.
+    """
+
+    name = 'llm'
+    optional = True
+
+    def __init__(self, service, fallback, explanations=None, max_tokens=60, budget=0):
+        """
+        Parameters:
+        - service (LLMService): Builds prompts and calls the LLM
+        - fallback (FallbackRecommender): Sets the count and writes templated explanations
+        - explanations (ExplanationCache, optional): Shared explanation cache
+        - max_tokens (int): Completion tokens allowed per explained product
+        - budget (float): Seconds to wait for the LLM, 0 for no limit
+        """
+        self.service = service
+        self.fallback = fallback
+        self.explanations = explanations
+        self.max_tokens = max_tokens
+        self.budget = budget
+
+    def _segment(self, user_preferences):
+        if self.explanations is not None:
+            return self.explanations.segment(user_preferences)
+        return None, user_preferences
+
+    async def _write(self, preferences, products, priority):
+        """
+        Ask the LLM for explanations of products
+
+        Returns:
+        - dict: Explanation per product ID
+        """
+        service = self.service
+        prompt = service.prompt_builder.build_explanations(preferences, products, service._catalog_version())
+        content = await service._chat_completion(
+            service._build_messages(prompt), max_tokens=self.max_tokens * len(products) + 20, priority=priority
+        )
+        wanted = {product['id'] for product in products}
+        parsed, stats = parse_recommendations(content, is_known=lambda product_id: product_id in wanted)
+        service.parse_stats.merge(stats)
+        LLM_RESPONSES.labels("parsed" if parsed else "unparseable").inc()
+        return {rec["product_id"]: rec["explanation"].strip() for rec in parsed if rec["explanation"].strip()}
+
+    async def run(self, context):
+        picks = context.ranked[:self.fallback.count]
+        products = [product for product, _ in picks]
+        segment_key, preferences = self._segment(context.user_preferences)
+        explained = await self.explanations.get_many(segment_key, products) if self.explanations is not None else {}
+        missing = [product for product in products if product['id'] not in explained]
+        written = {}
+        if missing:
+            try:
+                written = await self._write(preferences, missing, context.priority)
+            except Exception as e:
+                print(f"Using templated explanations after LLM failure: {str(e)}")
+            if self.explanations is not None:
+                await self.explanations.put_many(segment_key, missing, written)
+            explained.update(written)
+            # Templated stand-ins are not cached, so the next request asks again
+            context.cacheable = all(product['id'] in explained for product in products)
+
+        co_viewed = dict((context.engine.products[row]['id'], weight) for row, weight in context.signals.get('co_view', ()))
+        result = self.fallback.explain_ranked([(score, product) for product, score in picks], context.criteria, co_viewed)
+        for rec in result["recommendations"]:
+            rec["explanation"] = explained.get(rec["product"]['id'], rec["explanation"])
+        context.result = {**result, "source": "llm" if explained else "local"}
+
+
+class LocalExplainer(Stage):
+    """
+    Serve the top of the local ranking with templated explanations when the LLM did not answer
+    """
+
+    name = 'explain'
+
+    def __init__(self, fallback):
+        """
+        Parameters:
+        - fallback (FallbackRecommender): Writes the explanations
+        """
+        self.fallback = fallback
+
+    def run(self, context):
+        co_viewed = dict((context.engine.products[row]['id'], weight) for row, weight in context.signals.get('co_view', ()))
+        ranked = [(score, product) for product, score in context.ranked[:self.fallback.count]]
+        context.result = {**self.fallback.explain_ranked(ranked, context.criteria, co_viewed), "source": "local"}
+
+
+class PipelineStats:
+    """
+    Per-stage run counts, timings, budget overruns and skip reasons
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _entry(self, name):
+        entry = self._stages.get(name)
+        if entry is None:
+            entry = self._stages[name] = {"runs": 0, "total_ms": 0.0, "max_ms": 0.0, "over_budget": 0, "skipped": {}}
+        return entry
+
+    def record_run(self, name, seconds, over_budget=False):
+        with self._lock:
+            entry = self._entry(name)
+            entry["runs"] += 1
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+            entry["over_budget"] += over_budget
+
+    def record_skip(self, name, reason):
+        with self._lock:
+            skipped = self._entry(name)["skipped"]
+            skipped[reason] = skipped.get(reason, 0) + 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                name: {
+                    **entry,
+                    "skipped": dict(entry["skipped"]),
+                    "total_ms": round(entry["total_ms"], 3),
+                    "max_ms": round(entry["max_ms"], 3),
+                    "mean_ms": round(entry["total_ms"] / entry["runs"], 3) if entry["runs"] else 0.0
+                }
+                for name, entry in self._stages.items()
+            }
+
+
+class RecommendationPipeline:
+    """
+    Runs stages in order with per-stage timing, budgets and short-circuiting
+
+    run_local() runs the leading synchronous stages (candidates, ranking and
+    filtering) and can be used on its own to build a shortlist; run() goes
+    on with the remaining stages, awaiting the asynchronous ones. From the
+    event loop, local stages run in a worker thread (advance()) so ranking
+    a large catalog does not stall other requests. Streamed requests use
+    advance() and stream() to run the LLM stage in streaming mode, then
+    run() for whatever stages remain.
+    """
+
+    def __init__(self, stages, budget=0):
+        """
+        Parameters:
+        - stages (list): Stage instances, in order
+        - budget (float): Seconds for the local stages, passed to each PipelineContext (0 = no limit)
+        """
+        self.stages = stages
+        self.budget = budget
+        self.stats = PipelineStats()
+
+    def context(self, user_preferences, browsed_products, all_products, priority=None):
+        """
+        A new PipelineContext with this pipeline's budget
+        """
+        return PipelineContext(user_preferences, browsed_products, all_products, priority, self.budget)
+
+    def _skip_reason(self, stage, context):
+        # The local budget only covers the local stages; async stages have their own
+        if stage.optional and context.over_budget() and not asyncio.iscoroutinefunction(stage.run):
+            return 'budget'
+        return stage.skip_reason(context)
+
+    def _timed_out(self, stage, context, limit):
+        if not stage.optional:
+            raise Exception(f"Pipeline stage {stage.name} exceeded its {limit}s budget")
+        context.skipped[stage.name] = 'timeout'
+        context.cacheable = False
+        self.stats.record_skip(stage.name, 'timeout')
+
+    def _finish(self, stage, context, started):
+        elapsed = time.perf_counter() - started
+        context.timings[stage.name] = round(elapsed * 1000, 3)
+        PIPELINE_STAGE_LATENCY.labels(stage.name).observe(elapsed)
+        self.stats.record_run(stage.name, elapsed, stage.budget > 0 and elapsed > stage.budget)
+
+    def _next(self, context):
+        """
+        The next stage to run, recording skipped ones, or None when the pipeline is done
+        """
+        while context.result is None and context.next_stage < len(self.stages):
+            stage = self.stages[context.next_stage]
+            if not stage.enabled(context):
+                context.next_stage += 1
+                continue
+            reason = self._skip_reason(stage, context)
+            if reason is None:
+                return stage
+            context.skipped[stage.name] = reason
+            self.stats.record_skip(stage.name, reason)
+            context.next_stage += 1
+        return None
+
+    def run_local(self, context):
+        """
+        Run stages up to the first asynchronous one
+
+        Returns:
+        - PipelineContext: The same context
+        """
+        stage = self._next(context)
+        while stage is not None and not asyncio.iscoroutinefunction(stage.run):
+            started = time.perf_counter()
+            stage.run(context)
+            self._finish(stage, context, started)
+            context.next_stage += 1
+            stage = self._next(context)
+        return context
+
+    async def advance(self, context):
+        """
+        Run the local stages up to the next asynchronous one in a worker thread
+
+        Returns:
+        - Stage: The asynchronous stage to run next, or None when the pipeline is done
+        """
+        return self._next(await asyncio.to_thread(self.run_local, context))
+
+    async def run(self, context):
+        """
+        Run every remaining stage
+
+        run_local() stops only at asynchronous stages, so the loop awaits
+        each of those and hands back to run_local() for the stages after it.
+
+        Returns:
+        - PipelineContext: The same context, with result set
+        """
+        stage = await self.advance(context)
+        while stage is not None:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(stage.run(context), stage.budget or None)
+            except asyncio.TimeoutError:
+                self._timed_out(stage, context, stage.budget)
+            self._finish(stage, context, started)
+            context.next_stage += 1
+            stage = await self.advance(context)
+        return context
+
+    async def stream(self, stage, context, deadline=0):
+        """
+        Run a streaming stage returned by advance(), yielding its recommendations as they arrive
+
+        The stage budget, or the deadline if it is shorter, bounds the wait
+        for the first recommendation and is handled like a budget overrun in
+        run(); once one has been yielded the stream runs to its end. Call
+        run() afterwards for the stages that remain.
+
+        Parameters:
+        - stage (Stage): Async stage with a stream(context) method
+        - context (PipelineContext): The request
+        - deadline (float): Seconds to wait for the first recommendation, 0 for the stage budget alone
+
+        Yields:
+        - dict: Recommendation
+        """
+        limit = min([limit for limit in (stage.budget, deadline) if limit > 0], default=0)
+        started = time.perf_counter()
+        recommendations = stage.stream(context)
+        try:
+            try:
+                first = await asyncio.wait_for(recommendations.__anext__(), limit or None)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                self._timed_out(stage, context, limit)
+                return
+            yield first
+            async for recommendation in recommendations:
+                yield recommendation
+        finally:
+            await recommendations.aclose()
+            self._finish(stage, context, started)
+            context.next_stage += 1
@@ -0,0 +1,281 @@
+import json
+import re
+
+# Alternative key names models use for the fields we need
+ID_KEYS = ('product_id', 'productId', 'product', 'id')
+EXPLANATION_KEYS = ('explanation', 'reason', 'reasoning', 'rationale')
+SCORE_KEYS = ('score', 'confidence_score', 'confidence')
+
+CLOSERS = {'{': '}', '[': ']'}
+
+# Characters that change scanner state inside and outside JSON strings
+STRING_SPECIAL = re.compile(r'["\\]')
+STRUCTURAL = re.compile(r'["{}\[\],]')
+
+# How many cut points to try when salvaging a truncated object
+MAX_SALVAGE_ATTEMPTS = 16
+
+# Models sometimes emit raw newlines inside strings; accept them
+_decoder = json.JSONDecoder(strict=False)
+
+
+class ParseStats:
+    """
+    Counters describing how a model response was parsed
+    """
+
+    FIELDS = (
+        'objects', 'recommendations', 'invalid_json', 'missing_id', 'unknown_ids',
+        'duplicates', 'trailing_commas', 'salvaged', 'truncated'
+    )
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def merge(self, other):
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+def normalize_recommendation(obj):
+    """
+    Map a parsed object onto {"product_id", "explanation", "score"}, or None without an ID
+    """
+    product_id = next((obj[k] for k in ID_KEYS if isinstance(obj.get(k), (str, int))), None)
+    if product_id is None:
+        return None
+    return {
+        "product_id": str(product_id),
+        "explanation": next((obj[k] for k in EXPLANATION_KEYS if isinstance(obj.get(k), str)), ''),
+        "score": next((obj[k] for k in SCORE_KEYS if isinstance(obj.get(k), (int, float))), 5)
+    }
+
+
+class StreamingRecommendationParser:
+    """
+    Single-pass, incremental parser for LLM recommendation output
+
+    Text is fed in arbitrary chunks. Each character is scanned once, tracking
+    string/escape state and a stack of open containers, and every top-level
+    JSON object is decoded as soon as its closing brace arrives. Text outside
+    objects (prose, code fences, the enclosing array) is skipped, trailing
+    commas are dropped as they are seen, and finish() salvages a final object
+    cut off by the token limit. Objects that wrap a list of recommendations
+    (e.g. {"recommendations": [...]}) are unpacked.
+
+    Recommendations are de-duplicated and, when is_known is given, checked
+    against the catalog.
+    """
+
+    def __init__(self, is_known=None):
+        """
+        Parameters:
+        - is_known (callable, optional): Returns True for product IDs that exist in the catalog
+        """
+        self.is_known = is_known
+        self.stats = ParseStats()
+        self.seen_ids = set()
+        self.buffer = []
+        self.stack = []
+        self.commas = []
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text):
+        """
+        Consume a chunk of model output
+
+        Runs of ordinary characters are skipped with regex searches, so the
+        Python-level loop only runs once per structural character.
+
+        Parameters:
+        - text (str): Next chunk of the response
+
+        Returns:
+        - list: Normalized recommendation dicts completed by this chunk
+        """
+        completed = []
+        buffer = self.buffer
+        stack = self.stack
+        position = 0
+        length = len(text)
+        while position < length:
+            if not stack:
+                # Outside any object: skip prose, code fences and array brackets
+                start = text.find('{', position)
+                if start < 0:
+                    break
+                buffer.clear()
+                self.commas.clear()
+                buffer.append('{')
+                stack.append('{')
+                position = start + 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    buffer.append(text[position])
+                    self.escape = False
+                    position += 1
+                    continue
+                match = STRING_SPECIAL.search(text, position)
+                if match is None:
+                    buffer.append(text[position:])
+                    break
+                end = match.start()
+                buffer.append(text[position:end + 1])
+                if text[end] == '\\':
+                    self.escape = True
+                else:
+                    self.in_string = False
+                position = end + 1
+                continue
+
+            match = STRUCTURAL.search(text, position)
+            if match is None:
+                buffer.append(text[position:])
+                break
+            end = match.start()
+            if end > position:
+                buffer.append(text[position:end])
+            char = text[end]
+            position = end + 1
+            if char == '"':
+                buffer.append(char)
+                self.in_string = True
+            elif char == ',':
+                self.commas.append((len(buffer), len(stack)))
+                buffer.append(char)
+            elif char in '{[':
+                buffer.append(char)
+                stack.append(char)
+            else:
+                self._drop_trailing_comma()
+                buffer.append(CLOSERS[stack.pop()])
+                if not stack:
+                    completed.extend(self._accept(''.join(buffer)))
+                    buffer.clear()
+        return completed
+
+    def finish(self):
+        """
+        Signal the end of the response and salvage a truncated final object
+
+        Returns:
+        - list: Normalized recommendation dicts recovered from the unfinished object
+        """
+        if not self.stack:
+            return []
+        self.stats.truncated += 1
+        buffer = self.buffer
+        candidates = []
+        if not self.escape:
+            closing = '"' if self.in_string else ''
+            candidates.append(''.join(buffer) + closing + self._closers(self.stack))
+        # Cut back to earlier commas, dropping the incomplete member
+        for index, depth in reversed(self.commas[-MAX_SALVAGE_ATTEMPTS:]):
+            candidates.append(''.join(buffer[:index]) + self._closers(self.stack[:depth]))
+
+        self.buffer = []
+        self.stack = []
+        self.commas = []
+        self.in_string = False
+        self.escape = False
+        for candidate in candidates:
+            try:
+                obj = _decoder.decode(candidate)
+            except ValueError:
+                continue
+            recommendations = self._collect(obj)
+            if recommendations:
+                self.stats.salvaged += len(recommendations)
+            return recommendations
+        self.stats.invalid_json += 1
+        return []
+
+    @staticmethod
+    def _closers(stack):
+        return ''.join(CLOSERS[opener] for opener in reversed(stack))
+
+    def _drop_trailing_comma(self):
+        """
+        Remove a comma (and whitespace after it) directly before a closing bracket
+        """
+        buffer = self.buffer
+        end = len(buffer)
+        while end and not buffer[end - 1].strip():
+            end -= 1
+        if end and buffer[end - 1] == ',':
+            del buffer[end - 1:]
+            self.stats.trailing_commas += 1
+            if self.commas and self.commas[-1][0] == end - 1:
+                self.commas.pop()
+
+    def _accept(self, text):
+        try:
+            obj = _decoder.decode(text)
+        except ValueError:
+            self.stats.invalid_json += 1
+            return []
+        return self._collect(obj)
+
+    def _collect(self, obj):
+        """
+        Turn a decoded top-level object into validated recommendations
+        """
+        if not isinstance(obj, dict):
+            return []
+        self.stats.objects += 1
+        recommendation = normalize_recommendation(obj)
+        if recommendation is None:
+            # Wrapper object: unpack the first list of objects it holds
+            nested = next((v for v in obj.values() if isinstance(v, list) and any(isinstance(i, dict) for i in v)), None)
+            if nested is None:
+                self.stats.missing_id += 1
+                return []
+            self.stats.objects -= 1
+            return [rec for item in nested for rec in self._collect(item)]
+
+        product_id = recommendation["product_id"]
+        if product_id in self.seen_ids:
+            self.stats.duplicates += 1
+            return []
+        if self.is_known is not None and not self.is_known(product_id):
+            self.stats.unknown_ids += 1
+            return []
+        self.seen_ids.add(product_id)
+        self.stats.recommendations += 1
+        return [recommendation]
+
+
+def parse_recommendations(text, is_known=None):
+    """
+    Parse a complete model response into recommendations
+
+    Parameters:
+    - text (str): Raw response from the LLM
+    - is_known (callable, optional): Returns True for product IDs that exist in the catalog
+
+    Returns:
+    - tuple: (list of normalized recommendation dicts, ParseStats)
+    """
+    parser = StreamingRecommendationParser(is_known)
+
+    # Fast path: well-formed JSON is decoded in one C-level call
+    start = min((i for i in (text.find('['), text.find('{')) if i >= 0), default=-1)
+    if start >= 0:
+        try:
+            obj, end = _decoder.raw_decode(text, start)
+        except ValueError:
+            obj = None
+        if obj is not None and '{' not in text[end:]:
+            items = obj if isinstance(obj, list) else [obj]
+            return [rec for item in items for rec in parser._collect(item)], parser.stats
+
+    recommendations = parser.feed(text)
+    recommendations.extend(parser.finish())
+    return recommendations, parser.stats
@@ -0,0 +1,259 @@
+import numpy as np
+
+
+class ScoringWeights:
+    """
+    Relevance weights for candidate scoring
+
+    The defaults reproduce the original scheme: +3 for a category match,
+    +2 for a brand match, +2 for a price in range and +1 per matching tag.
+    """
+
+    def __init__(self, category=3.0, brand=2.0, price=2.0, tag=1.0):
+        self.category = category
+        self.brand = brand
+        self.price = price
+        self.tag = tag
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls(
+            category=settings['SCORE_WEIGHT_CATEGORY'],
+            brand=settings['SCORE_WEIGHT_BRAND'],
+            price=settings['SCORE_WEIGHT_PRICE'],
+            tag=settings['SCORE_WEIGHT_TAG']
+        )
+
+
+def _encode(values):
+    """
+    Map values to integer codes; missing values get the sentinel code len(vocab)
+    """
+    vocab = {}
+    codes = []
+    for value in values:
+        if value is None:
+            codes.append(-1)
+        else:
+            codes.append(vocab.setdefault(value, len(vocab)))
+    codes = np.array(codes, dtype=np.int32)
+    codes[codes < 0] = len(vocab)
+    return vocab, codes
+
+
+class ScoringEngine:
+    """
+    Vectorized relevance scoring over the whole catalog
+
+    Category and brand are stored as integer code arrays, tags as a sparse
+    (row, tag code) list and prices as a float array, all built once from the
+    catalog. Scoring a request is then a few lookup-table gathers, a
+    bincount and a partial sort for the top-k.
+    """
+
+    def __init__(self, products, weights=None):
+        """
+        Build the column arrays for a product catalog
+
+        Parameters:
+        - products (list): Full product catalog
+        - weights (ScoringWeights, optional): Scoring weights, defaults to the original scheme
+        """
+        self.products = products
+        self.weights = weights or ScoringWeights()
+        self.row_by_id = {p['id']: row for row, p in enumerate(products)}
+        self.category_vocab, self.category_codes = _encode(p.get('category') for p in products)
+        self.brand_vocab, self.brand_codes = _encode(p.get('brand') for p in products)
+        self.prices = np.array([p['price'] for p in products], dtype=np.float64)
+
+        # Sparse product x tag incidence; tags are de-duplicated per product
+        self.tag_vocab = {}
+        tag_rows = []
+        tag_codes = []
+        for row, product in enumerate(products):
+            for tag in set(product.get('tags', ())):
+                tag_rows.append(row)
+                tag_codes.append(self.tag_vocab.setdefault(tag, len(self.tag_vocab)))
+        self.tag_rows = np.array(tag_rows, dtype=np.int32)
+        self.tag_codes = np.array(tag_codes, dtype=np.int32)
+
+    @classmethod
+    def for_products(cls, products, weights=None):
+        """
+        Engine for a catalog, taking the column arrays straight from it when it provides them
+
+        Parameters:
+        - products (list or ColumnarCatalog): Full product catalog
+        - weights (ScoringWeights, optional): Scoring weights, defaults to the original scheme
+
+        Returns:
+        - ScoringEngine
+        """
+        if not hasattr(products, 'scoring_columns'):
+            return cls(products, weights)
+        engine = object.__new__(cls)
+        engine.products = products
+        engine.weights = weights or ScoringWeights()
+        for name, value in products.scoring_columns().items():
+            setattr(engine, name, value)
+        return engine
+
+    def __len__(self):
+        return len(self.products)
+
+    @staticmethod
+    def _extend_codes(vocab, codes, rows, values):
+        """
+        Copy of codes with rows re-encoded to values, growing vocab as needed
+
+        Rows at or beyond len(codes) are appended. Missing values keep using
+        the sentinel code len(vocab), which is moved if the vocab grows.
+        """
+        old_sentinel = len(vocab)
+        new_codes = [vocab.setdefault(value, len(vocab)) if value is not None else None for value in values]
+        result = np.full(max(len(codes), max(rows, default=-1) + 1), len(vocab), dtype=np.int32)
+        result[:len(codes)] = codes
+        if len(vocab) != old_sentinel:
+            result[:len(codes)][codes == old_sentinel] = len(vocab)
+        for row, code in zip(rows, new_codes):
+            result[row] = len(vocab) if code is None else code
+        return result
+
+    def updated(self, products, changed_ids):
+        """
+        Engine for a new catalog version, re-encoding only the changed rows
+
+        products must keep this engine's rows in place: changed products
+        replaced at their row and new products appended (as produced by
+        CatalogIndex.apply_changes without deletes).
+
+        Parameters:
+        - products (list): Catalog of the new version
+        - changed_ids (iterable): IDs of replaced and appended products
+
+        Returns:
+        - ScoringEngine
+        """
+        engine = object.__new__(ScoringEngine)
+        engine.products = products
+        engine.weights = self.weights
+        if hasattr(products, 'row_by_id'):
+            # Columnar catalogs carry their own ID lookup
+            engine.row_by_id = products.row_by_id
+        else:
+            engine.row_by_id = dict(self.row_by_id)
+            for row in range(len(self.products), len(products)):
+                engine.row_by_id[products[row]['id']] = row
+        rows = sorted(engine.row_by_id[pid] for pid in changed_ids if pid in engine.row_by_id)
+        changed = [products[row] for row in rows]
+
+        engine.category_vocab = dict(self.category_vocab)
+        engine.category_codes = self._extend_codes(
+            engine.category_vocab, self.category_codes, rows, [p.get('category') for p in changed])
+        engine.brand_vocab = dict(self.brand_vocab)
+        engine.brand_codes = self._extend_codes(
+            engine.brand_vocab, self.brand_codes, rows, [p.get('brand') for p in changed])
+        engine.prices = np.zeros(len(products), dtype=np.float64)
+        engine.prices[:len(self.prices)] = self.prices
+        engine.prices[rows] = [p['price'] for p in changed]
+
+        # Drop the changed rows' tag entries and append their new tags
+        engine.tag_vocab = dict(self.tag_vocab)
+        keep = ~np.isin(self.tag_rows, rows)
+        tag_rows = []
+        tag_codes = []
+        for row, product in zip(rows, changed):
+            for tag in set(product.get('tags', ())):
+                tag_rows.append(row)
+                tag_codes.append(engine.tag_vocab.setdefault(tag, len(engine.tag_vocab)))
+        engine.tag_rows = np.concatenate([self.tag_rows[keep], np.array(tag_rows, dtype=np.int32)])
+        engine.tag_codes = np.concatenate([self.tag_codes[keep], np.array(tag_codes, dtype=np.int32)])
+        return engine
+
+    @staticmethod
+    def _lookup_table(vocab, values):
+        """
+        Boolean table over codes (plus the missing-value sentinel) marking the given values
+        """
+        table = np.zeros(len(vocab) + 1, dtype=bool)
+        codes = [vocab[v] for v in values if v in vocab]
+        table[codes] = True
+        return table
+
+    def score(self, relevant_categories=(), relevant_brands=(), relevant_tags=(),
+              min_price=0, max_price=float('inf'), exclude_ids=()):
+        """
+        Score every product against the relevance criteria
+
+        Parameters:
+        - relevant_categories (iterable): Categories to reward
+        - relevant_brands (iterable): Brands to reward
+        - relevant_tags (iterable): Tags to reward, once per matching tag
+        - min_price (float): Lower bound of the preferred price range
+        - max_price (float): Upper bound of the preferred price range
+        - exclude_ids (iterable): Product IDs to force to a score of zero
+
+        Returns:
+        - numpy.ndarray: Score per catalog row
+        """
+        weights = self.weights
+        scores = np.zeros(len(self.products), dtype=np.float64)
+
+        if relevant_categories:
+            table = self._lookup_table(self.category_vocab, relevant_categories)
+            scores += weights.category * table[self.category_codes]
+        if relevant_brands:
+            table = self._lookup_table(self.brand_vocab, relevant_brands)
+            scores += weights.brand * table[self.brand_codes]
+        scores += weights.price * ((self.prices >= min_price) & (self.prices <= max_price))
+        if relevant_tags and len(self.tag_codes):
+            table = self._lookup_table(self.tag_vocab, relevant_tags)
+            matches = np.bincount(self.tag_rows[table[self.tag_codes]], minlength=len(scores))
+            scores += weights.tag * matches
+
+        excluded = [self.row_by_id[pid] for pid in exclude_ids if pid in self.row_by_id]
+        if excluded:
+            scores[excluded] = 0
+        return scores
+
+    @staticmethod
+    def top_k(scores, k):
+        """
+        Rows of the k highest positive scores, best first
+
+        Ties are broken by catalog order, matching a stable descending sort.
+
+        Parameters:
+        - scores (numpy.ndarray): Score per catalog row
+        - k (int): Number of rows to return
+
+        Returns:
+        - numpy.ndarray: Selected row indexes
+        """
+        candidates = np.flatnonzero(scores > 0)
+        if k <= 0 or not len(candidates):
+            return candidates[:0]
+        candidate_scores = scores[candidates]
+        if len(candidates) > k:
+            kth = np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]
+            above = candidates[candidate_scores > kth]
+            ties = candidates[candidate_scores == kth][:k - len(above)]
+            candidates = np.concatenate([above, ties])
+            candidate_scores = scores[candidates]
+        order = np.lexsort((candidates, -candidate_scores))
+        return candidates[order]
+
+    def top_products(self, k, **criteria):
+        """
+        Score the catalog and return the k most relevant products with their scores
+
+        Parameters:
+        - k (int): Number of products to return
+        - criteria: Keyword arguments accepted by score()
+
+        Returns:
+        - list: (product, score) tuples, best first
+        """
+        scores = self.score(**criteria)
+        rows = self.top_k(scores, k)
+        return [(self.products[row], float(scores[row])) for row in rows]
@@ -0,0 +1,188 @@
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from services.embedding_index import _field_text, tokenize
+
+# Term frequency multiplier per field (BM25F-style): a name match counts three times a description match
+FIELD_WEIGHTS = (
+    ('name', 3.0),
+    ('tags', 2.0),
+    ('features', 1.0),
+    ('description', 1.0),
+)
+
+# BM25 term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+
+class SearchIndex:
+    """
+    Inverted full-text index over product names, tags, features and descriptions
+
+    Postings are stored term by term in flat arrays (row and weighted term
+    frequency per entry, with per-term offsets), so a query touches only the
+    postings of its terms. Documents are ranked with BM25. Arrays are saved
+    as .npy files and memory-mapped on load, like the embedding index.
+    """
+
+    def __init__(self, terms, offsets, rows, frequencies, doc_lengths, catalog_version=None):
+        """
+        Parameters:
+        - terms (list): Vocabulary; term i owns postings offsets[i]:offsets[i + 1]
+        - offsets (numpy.ndarray): Start of each term's postings, plus the total
+        - rows (numpy.ndarray): Catalog row of each posting
+        - frequencies (numpy.ndarray): Weighted term frequency of each posting
+        - doc_lengths (numpy.ndarray): Weighted token count per catalog row
+        - catalog_version (str, optional): Catalog version the index was built from
+        """
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.frequencies = frequencies
+        self.doc_lengths = doc_lengths
+        self.catalog_version = catalog_version
+        average = float(np.mean(doc_lengths)) if len(doc_lengths) else 0.0
+        # Per-document BM25 length normalization, K1 * (1 - B + B * length / average)
+        self.length_norms = (K1 * (1 - B + B * np.asarray(doc_lengths) / average)).astype(np.float32) \
+            if average > 0 else np.full(len(doc_lengths), K1, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, products, catalog_version=None):
+        """
+        Index every product in the catalog
+
+        Parameters:
+        - products (list): Full product catalog
+        - catalog_version (str, optional): Catalog version to record
+
+        Returns:
+        - SearchIndex
+        """
+        vocab = {}
+        term_ids = []
+        rows = []
+        frequencies = []
+        doc_lengths = np.zeros(len(products), dtype=np.float32)
+        for row, product in enumerate(products):
+            counts = {}
+            for field, weight in FIELD_WEIGHTS:
+                for token in tokenize(_field_text(product.get(field))):
+                    counts[token] = counts.get(token, 0.0) + weight
+            for token, count in counts.items():
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                rows.append(row)
+                frequencies.append(count)
+            doc_lengths[row] = sum(counts.values())
+
+        term_ids = np.array(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.searchsorted(term_ids[order], np.arange(len(vocab) + 1)).astype(np.int64)
+        return cls(
+            list(vocab),
+            offsets,
+            np.array(rows, dtype=np.int32)[order],
+            np.array(frequencies, dtype=np.float32)[order],
+            doc_lengths,
+            catalog_version
+        )
+
+    def save(self, path):
+        """
+        Write the index to a directory (postings arrays as .npy, vocabulary in meta.json)
+
+        Files are replaced rather than rewritten, so processes that have the
+        previous index memory-mapped keep reading intact files.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ('offsets', 'rows', 'frequencies', 'doc_lengths'):
+            temp_path = os.path.join(path, f'.{name}.{os.getpid()}.npy')
+            np.save(temp_path, np.ascontiguousarray(getattr(self, name)))
+            os.replace(temp_path, os.path.join(path, f'{name}.npy'))
+        temp_path = os.path.join(path, f'.meta.{os.getpid()}.json')
+        with open(temp_path, 'w') as file:
+            json.dump({"catalog_version": self.catalog_version, "count": len(self), "terms": self.terms}, file)
+        os.replace(temp_path, os.path.join(path, 'meta.json'))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index written by save(), memory-mapping the postings
+        """
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in ('offsets', 'rows', 'frequencies', 'doc_lengths')
+        }
+        return cls(meta['terms'], catalog_version=meta.get('catalog_version'), **arrays)
+
+    def scores(self, text):
+        """
+        BM25 score of every product for a free-text query
+
+        Returns:
+        - numpy.ndarray or None: Score per catalog row (0 for non-matching rows), None if no query term is indexed
+        """
+        term_ids = [self.term_ids[token] for token in dict.fromkeys(tokenize(text)) if token in self.term_ids]
+        if not term_ids:
+            return None
+        count = len(self)
+        scores = np.zeros(count, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            rows = self.rows[start:end]
+            frequencies = self.frequencies[start:end]
+            idf = math.log(1 + (count - (end - start) + 0.5) / (end - start + 0.5))
+            # Rows are unique within a term's postings, so fancy-index accumulation is safe
+            scores[rows] += idf * frequencies * (K1 + 1) / (frequencies + self.length_norms[rows])
+        return scores
+
+
+def load_or_build_index(products, path, catalog_version=None):
+    """
+    Load the on-disk index if it was built from this catalog version, otherwise build and save it
+
+    Parameters:
+    - products (list): Full product catalog
+    - path (str): Index directory
+    - catalog_version (str, optional): Expected catalog version
+
+    Returns:
+    - SearchIndex
+    """
+    if catalog_version is not None and os.path.exists(os.path.join(path, 'meta.json')):
+        try:
+            index = SearchIndex.load(path)
+            if index.catalog_version == catalog_version and len(index) == len(products):
+                return index
+        except Exception as e:
+            print(f"Error loading search index: {str(e)}")
+
+    index = SearchIndex.build(products, catalog_version)
+    try:
+        index.save(path)
+        return SearchIndex.load(path)
+    except Exception as e:
+        print(f"Error saving search index: {str(e)}")
+        return index
+
+
+if __name__ == "__main__":
+    # Offline build: python -m services.search_index [index_path]
+    from config import config
+    from services.product_service import ProductService
+
+    product_service = ProductService()
+    output_path = sys.argv[1] if len(sys.argv) > 1 else config['SEARCH_INDEX_PATH']
+    built = SearchIndex.build(product_service.get_all_products(), product_service.version)
+    built.save(output_path)
+    print(f"Indexed {len(built)} products ({len(built.terms)} terms) into {output_path}")
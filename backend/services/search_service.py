@@ -0,0 +1,192 @@
+import threading
+
+import numpy as np
+
+from config import config
+from services.search_index import load_or_build_index
+
+# Facets counted for every search
+FACETS = ('category', 'brand', 'tags', 'price')
+
+# Lower bounds of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = (0, 25, 50, 100, 200, 500)
+
+
+class SearchService:
+    """
+    Full-text product search with facet filters and facet counts
+
+    Text matching uses the BM25 inverted index in services.search_index and
+    filtering uses the ProductQuery masks of the current catalog snapshot, so
+    a search is a handful of posting-list lookups and vectorized mask
+    operations. Facet counts are disjunctive: each facet is counted with every
+    filter except its own applied, so the counts show what selecting another
+    value of that facet would return.
+    """
+
+    def __init__(self, product_service):
+        """
+        Parameters:
+        - product_service (ProductService): Catalog to search
+        """
+        self.product_service = product_service
+        self.index_path = config['SEARCH_INDEX_PATH']
+        self._index = None
+        self._index_source = None
+        self._lock = threading.Lock()
+        self._build = None
+        self._build_lock = threading.Lock()
+
+    def _get_index(self):
+        """
+        Return the search index for the current catalog, loading or rebuilding it when the catalog changes
+
+        Changes that leave product text alone (price, inventory, rating) keep
+        the current index. Blocks while the index is built, so call it off
+        the event loop.
+        """
+        version = self.product_service.version
+        if self._index is not None and self._index_source == version:
+            return self._index
+        with self._lock:
+            return self._refresh_index(version)
+
+    def _refresh_index(self, version):
+        # Caller holds self._lock
+        if self._index is None or self._index_source != version:
+            changes = self.product_service.changes_since(self._index_source) if self._index is not None else None
+            if changes is None or changes.text_changed:
+                self._index = load_or_build_index(self.product_service.get_all_products(), self.index_path, version)
+            self._index_source = version
+        return self._index
+
+    def ready_index(self):
+        """
+        Return the search index for the current catalog if it is ready, without waiting for a build
+
+        A missing or outdated index is loaded or rebuilt in a background
+        thread, one build at a time, and None is returned meanwhile.
+        """
+        version = self.product_service.version
+        if not self._lock.acquire(blocking=False):
+            # A build holds the lock
+            return None
+        try:
+            if self._index is not None and self._index_source == version:
+                return self._index
+            changes = self.product_service.changes_since(self._index_source) if self._index is not None else None
+            if changes is not None and not changes.text_changed:
+                self._index_source = version
+                return self._index
+        finally:
+            self._lock.release()
+        self.start_build()
+        return None
+
+    def start_build(self):
+        """
+        Load or build the index for the current catalog in a background thread, unless one is running
+
+        Returns:
+        - threading.Thread: The running build
+        """
+        with self._build_lock:
+            if self._build is not None:
+                return self._build
+
+            def build():
+                try:
+                    self._get_index()
+                except Exception as e:
+                    print(f"Error building search index: {str(e)}")
+                with self._build_lock:
+                    self._build = None
+
+            self._build = threading.Thread(target=build, name="search-index-build", daemon=True)
+            self._build.start()
+            return self._build
+
+    @staticmethod
+    def _top_rows(rows, scores, k):
+        """
+        The k best rows by descending score, ties in catalog order
+        """
+        if len(rows) > k:
+            # Keep every row tied with the k-th best score so ties stay in catalog order
+            threshold = np.partition(scores[rows], len(rows) - k)[len(rows) - k]
+            rows = rows[scores[rows] >= threshold]
+        return rows[np.lexsort((rows, -scores[rows]))][:k]
+
+    def search(self, text=None, limit=20, offset=0, facets=FACETS, facet_limit=10, **filters):
+        """
+        Search the catalog
+
+        Parameters:
+        - text (str, optional): Free-text query; without it every product matches, in catalog order
+        - limit (int): Maximum results
+        - offset (int): Results to skip
+        - facets (iterable): Facets to count, a subset of FACETS
+        - facet_limit (int): Values per facet (price buckets are always all returned)
+        - filters: Keyword arguments accepted by ProductQuery.filter_masks()
+
+        Returns:
+        - dict: "catalog" snapshot, "results" as (row, score) tuples, "total" matches and "facets" counts
+        """
+        query = self.product_service.product_query()
+        catalog = query.products
+        scores = None
+        matched = None
+        if text and text.strip():
+            scores = self._get_index().scores(text)
+            matched = scores > 0 if scores is not None else np.zeros(len(catalog), dtype=bool)
+
+        masks = query.filter_masks(**filters)
+        selected = query.combine([m for m in (matched,) if m is not None] + list(masks.values()))
+        rows = np.arange(len(catalog)) if selected is None else np.flatnonzero(selected)
+        if scores is None:
+            page = rows[offset:offset + limit]
+            results = [(row, None) for row in page.tolist()]
+        else:
+            page = self._top_rows(rows, scores, offset + limit)[offset:]
+            results = [(row, float(scores[row])) for row in page.tolist()]
+
+        counts = {}
+        for facet in facets:
+            others = [mask for name, mask in masks.items() if name != facet]
+            mask = query.combine([m for m in (matched,) if m is not None] + others)
+            if facet == 'price':
+                counts[facet] = query.price_counts(PRICE_BUCKETS, mask)
+            else:
+                counts[facet] = query.facet_counts(facet, mask, facet_limit)
+
+        return {"catalog": catalog, "results": results, "total": len(rows), "facets": counts}
+
+    def candidates(self, text, k, exclude_ids=()):
+        """
+        Top-k products matching free text, as recommendation candidates
+
+        Parameters:
+        - text (str): Query text (e.g. preferences and browsed product names)
+        - k (int): Maximum candidates
+        - exclude_ids (set): Product IDs to skip
+
+        Never waits for the index: until one is ready for the current
+        catalog (see ready_index) there are no keyword candidates.
+
+        Returns:
+        - list: (row, score) tuples with scores scaled to 0-1, best first; empty if nothing matches
+        """
+        if not text or not text.strip():
+            return []
+        catalog = self.product_service.get_all_products()
+        index = self.ready_index()
+        if index is None or len(index.doc_lengths) != len(catalog):
+            return []
+        scores = index.scores(text)
+        if scores is None:
+            return []
+        rows = np.flatnonzero(scores > 0)
+        top = self._top_rows(rows, scores, k + len(exclude_ids)).tolist()
+        best = float(scores[top[0]]) if top else 0.0
+        results = [(row, float(scores[row]) / best) for row in top if catalog[row]['id'] not in exclude_ids]
+        return results[:k]
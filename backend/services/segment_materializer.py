@@ -0,0 +1,398 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.recommendation_cache import _canonical_value
+
+# Preference keys a segment is made of (the fields of the preferences form)
+SEGMENT_KEYS = ('preferred_categories', 'preferred_brands', 'price_range')
+
+# Reranking bonuses for materialized recommendations, on the LLM's 1-10 confidence scale
+CATEGORY_AFFINITY = 1.0
+BRAND_AFFINITY = 1.0
+TAG_AFFINITY = 0.5
+CO_VIEW_AFFINITY = 2.0
+
+# Seconds a worker may spend materializing a segment before another worker may take it over
+CLAIM_LEASE = 900
+
+
+def parse_price_range(price_range):
+    """
+    (min, max) from a {"min", "max"} dict or a "$10-$50" string; missing bounds are 0 and infinity
+    """
+    try:
+        if isinstance(price_range, dict):
+            return float(price_range.get('min', 0)), float(price_range.get('max', float('inf')))
+        if isinstance(price_range, str) and '-' in price_range:
+            low, high = price_range.split('-', 1)
+            return float(low.strip().replace('$', '')), float(high.strip().replace('$', ''))
+    except (TypeError, ValueError):
+        pass
+    return 0.0, float('inf')
+
+
+def segment_of(preferences, price_bands):
+    """
+    The preference segment a user falls into
+
+    Categories and brands are normalized like recommendation cache keys, and
+    the price range is widened to the enclosing price bands.
+
+    Parameters:
+    - preferences (dict): User's stated preferences
+    - price_bands (list): Ascending price band edges
+
+    Returns:
+    - tuple or None: (segment key, representative preferences), None if the
+      preferences hold anything besides SEGMENT_KEYS
+    """
+    if not preferences or any(key not in SEGMENT_KEYS for key in preferences):
+        return None
+    segment = {}
+    for key in ('preferred_categories', 'preferred_brands'):
+        values = _canonical_value(key, preferences.get(key) or [])
+        if values:
+            segment[key] = values
+    if preferences.get('price_range'):
+        low, high = parse_price_range(preferences['price_range'])
+        band = {"min": max([edge for edge in price_bands if edge <= low], default=0)}
+        upper = [edge for edge in price_bands if edge >= high]
+        if upper:
+            band["max"] = upper[0]
+        segment['price_range'] = band
+    if not segment:
+        return None
+    return json.dumps(segment, sort_keys=True, separators=(',', ':')), segment
+
+
+class SegmentStore:
+    """
+    Segment traffic counts and materialized recommendations in a SQLite file shared by all workers
+
+    Recommendations are versioned by catalog version. Traffic rows also hold
+    a lease so only one worker materializes a segment at a time.
+
+    Calls block on disk I/O and locks held by other workers, so callers on
+    the event loop run them on `executor`, a single thread that also owns
+    the connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="segment-store")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segment_traffic ("
+            "segment TEXT PRIMARY KEY, preferences TEXT NOT NULL, hits INTEGER NOT NULL, "
+            "last_seen REAL NOT NULL, claimed_until REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segment_recommendations ("
+            "segment TEXT NOT NULL, catalog_version TEXT NOT NULL, recommendations TEXT NOT NULL, "
+            "created_at REAL NOT NULL, PRIMARY KEY (segment, catalog_version))"
+        )
+
+    def add_hits(self, counts):
+        """
+        Add observed requests per segment
+
+        Parameters:
+        - counts (dict): Segment key -> (representative preferences, number of requests)
+        """
+        now = time.time()
+        self._conn.executemany(
+            "INSERT INTO segment_traffic (segment, preferences, hits, last_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (segment) DO UPDATE SET hits = hits + excluded.hits, last_seen = excluded.last_seen",
+            [(segment, json.dumps(preferences), hits, now) for segment, (preferences, hits) in counts.items()]
+        )
+
+    def top_segments(self, limit, min_hits=1):
+        """
+        Most requested segments
+
+        Returns:
+        - list: (segment key, representative preferences, hits) tuples
+        """
+        rows = self._conn.execute(
+            "SELECT segment, preferences, hits FROM segment_traffic WHERE hits >= ? "
+            "ORDER BY hits DESC, segment LIMIT ?", (min_hits, limit)
+        ).fetchall()
+        return [(segment, json.loads(preferences), hits) for segment, preferences, hits in rows]
+
+    def claim(self, segment, lease):
+        """
+        Take the segment's lease for `lease` seconds unless another worker holds it
+
+        Returns:
+        - bool: True if this worker should materialize the segment
+        """
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE segment_traffic SET claimed_until = ? WHERE segment = ? AND claimed_until < ?",
+            (now + lease, segment, now)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, segments):
+        """
+        Give up the leases on segments
+        """
+        self._conn.executemany(
+            "UPDATE segment_traffic SET claimed_until = 0 WHERE segment = ?", [(segment,) for segment in segments]
+        )
+
+    def latest(self, segment):
+        """
+        Most recently materialized recommendations for a segment
+
+        Returns:
+        - tuple or None: (catalog version, recommendations, created_at)
+        """
+        row = self._conn.execute(
+            "SELECT catalog_version, recommendations, created_at FROM segment_recommendations "
+            "WHERE segment = ? ORDER BY created_at DESC LIMIT 1", (segment,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def put(self, segment, catalog_version, recommendations):
+        """
+        Store recommendations (product IDs, explanations, confidence scores) for a segment
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO segment_recommendations (segment, catalog_version, recommendations, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (segment, catalog_version, json.dumps(recommendations), time.time())
+        )
+
+    def prune(self, max_age):
+        """
+        Drop recommendations superseded by a newer version, and segments not requested for max_age seconds
+        """
+        cutoff = time.time() - max_age
+        self._conn.execute(
+            "DELETE FROM segment_recommendations WHERE created_at < ("
+            "SELECT MAX(created_at) FROM segment_recommendations AS newer "
+            "WHERE newer.segment = segment_recommendations.segment)"
+        )
+        self._conn.execute("DELETE FROM segment_traffic WHERE last_seen < ?", (cutoff,))
+        self._conn.execute(
+            "DELETE FROM segment_recommendations WHERE segment NOT IN (SELECT segment FROM segment_traffic)"
+        )
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM segment_recommendations").fetchone()[0]
+
+
+class SegmentMaterializer:
+    """
+    Precomputed LLM recommendations for the most requested preference segments
+
+    Interactive requests are counted per segment (see segment_of()). A
+    background job regularly generates recommendations for the top segments
+    through LLMService at batch priority and stores them; requests in a
+    materialized segment are then answered from the store, reranked locally
+    against the user's browsing history, without waiting for the LLM.
+
+    Recommendations stay valid across catalog changes that leave product
+    text alone (price, inventory, rating), like the embedding index, and
+    are regenerated after SEGMENT_TTL seconds.
+    """
+
+    def __init__(self, llm_service, product_service, settings):
+        """
+        Parameters:
+        - llm_service (LLMService): Generates the recommendations
+        - product_service (ProductService): Current catalog
+        - settings (dict): Application config
+        """
+        self.llm_service = llm_service
+        self.product_service = product_service
+        self.store = SegmentStore(settings['SEGMENT_STORE_PATH'])
+        self.price_bands = [float(edge) for edge in settings['SEGMENT_PRICE_BANDS'].split(',') if edge.strip()]
+        self.top_n = settings['SEGMENT_TOP_N']
+        self.min_hits = settings['SEGMENT_MIN_HITS']
+        self.min_results = settings['SEGMENT_MIN_RESULTS']
+        self.ttl = settings['SEGMENT_TTL']
+        self.concurrency = settings['BATCH_CONCURRENCY']
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.served = 0
+        self.missed = 0
+        self.materialized = 0
+
+    async def _call(self, method, *args):
+        """
+        Call a store method on the store's own thread
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.store.executor, method, *args)
+
+    def observe(self, preferences):
+        """
+        Count a recommendation request towards its segment
+
+        Returns:
+        - tuple or None: segment_of(preferences)
+        """
+        segment = segment_of(preferences, self.price_bands)
+        if segment is not None:
+            key, representative = segment
+            with self._lock:
+                _, hits = self._pending.get(key, (representative, 0))
+                self._pending[key] = (representative, hits + 1)
+        return segment
+
+    def _usable(self, catalog_version, created_at):
+        """
+        Whether recommendations made against catalog_version may still be served
+        """
+        if time.time() - created_at > self.ttl:
+            return False
+        if catalog_version == self.product_service.version:
+            return True
+        changes = self.product_service.changes_since(catalog_version)
+        return changes is not None and not changes.text_changed
+
+    async def serve(self, preferences, browsing_history, segment=None):
+        """
+        Materialized recommendations for the user's segment, reranked by browsing history
+
+        Parameters:
+        - preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - segment (tuple, optional): segment_of(preferences), if already computed
+
+        Returns:
+        - dict or None: Recommendations and count, None if the segment is not materialized
+        """
+        segment = segment or segment_of(preferences, self.price_bands)
+        stored = await self._call(self.store.latest, segment[0]) if segment is not None else None
+        if stored is None or not self._usable(stored[0], stored[2]):
+            self.missed += 1
+            return None
+        recommendations = self.rerank(stored[1], preferences, browsing_history)
+        if len(recommendations) < self.min_results:
+            self.missed += 1
+            return None
+        self.served += 1
+        return {"recommendations": recommendations, "count": len(recommendations)}
+
+    def rerank(self, stored, preferences, browsing_history):
+        """
+        Order a segment's recommendations for one user
+
+        Products the user already viewed, no longer in the catalog, or
+        outside the user's exact price range are dropped. The rest are ranked
+        by the LLM's confidence plus bonuses for sharing categories, brands
+        and tags with browsed products and for being viewed together with them.
+        """
+        browsed = self.product_service.get_products_by_ids(browsing_history)
+        browsed_ids = {p['id'] for p in browsed}
+        categories = {p.get('category') for p in browsed}
+        brands = {p.get('brand') for p in browsed}
+        tags = {tag for p in browsed for tag in p.get('tags', ())}
+        co_viewed = self.llm_service.co_view.co_viewed(list(browsed_ids)) if browsed_ids else {}
+        low, high = parse_price_range(preferences.get('price_range'))
+
+        ranked = []
+        for position, rec in enumerate(stored):
+            product = self.product_service.get_product_by_id(rec["id"])
+            if product is None or product['id'] in browsed_ids or not low <= product['price'] <= high:
+                continue
+            affinity = (
+                CATEGORY_AFFINITY * (product.get('category') in categories)
+                + BRAND_AFFINITY * (product.get('brand') in brands)
+                + TAG_AFFINITY * min(len(tags.intersection(product.get('tags', ()))), 2)
+                + CO_VIEW_AFFINITY * co_viewed.get(product['id'], 0.0)
+            )
+            try:
+                confidence = float(rec["confidence_score"])
+            except (TypeError, ValueError):
+                confidence = 5.0
+            ranked.append((-(confidence + affinity), position, product, rec))
+        ranked.sort(key=lambda item: item[:2])
+        return [
+            {"product": product, "explanation": rec["explanation"], "confidence_score": rec["confidence_score"]}
+            for _, _, product, rec in ranked
+        ]
+
+    async def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            await self._call(self.store.add_hits, pending)
+
+    def _due(self):
+        """
+        Claim the top segments that are missing or stale; runs on the store's thread
+        """
+        due = []
+        for segment, preferences, _ in self.store.top_segments(self.top_n, self.min_hits):
+            stored = self.store.latest(segment)
+            if stored is not None and self._usable(stored[0], stored[2]):
+                continue
+            # Other workers skip segments this one is working on
+            if self.store.claim(segment, lease=CLAIM_LEASE):
+                due.append({"id": segment, "preferences": preferences, "browsing_history": []})
+        return due
+
+    async def run_once(self):
+        """
+        Flush traffic counts and materialize the top segments that are missing or stale
+
+        Returns:
+        - dict: Segments considered, materialized and failed
+        """
+        await self._flush()
+        due = await self._call(self._due)
+        claimed = {profile["id"] for profile in due}
+
+        version = self.product_service.version
+        materialized = failed = 0
+        try:
+            async for segment_ids, result, error in self.llm_service.generate_batch_recommendations(
+                due, self.product_service.get_all_products(), concurrency=self.concurrency
+            ):
+                for segment in segment_ids:
+                    if error is None and result["recommendations"]:
+                        await self._call(self.store.put, segment, version, [
+                            {
+                                "id": rec["product"]["id"],
+                                "explanation": rec["explanation"],
+                                "confidence_score": rec["confidence_score"]
+                            }
+                            for rec in result["recommendations"]
+                        ])
+                        materialized += 1
+                    else:
+                        failed += 1
+                # Done either way; a failed segment is retried on the next run
+                await self._call(self.store.release, segment_ids)
+                claimed.difference_update(segment_ids)
+        finally:
+            if claimed:
+                # Cancelled or failed midway: hand the rest back now rather than after the lease.
+                # Submitted without waiting, since a cancelled task cannot await.
+                self.store.executor.submit(self.store.release, list(claimed))
+        await self._call(self.store.prune, self.ttl * 7)
+        self.materialized += materialized
+        return {"due": len(due), "materialized": materialized, "failed": failed}
+
+    async def stats(self):
+        """
+        Serving counters and the number of stored segment results
+        """
+        total = self.served + self.missed
+        return {
+            "served": self.served,
+            "missed": self.missed,
+            "hit_ratio": self.served / total if total else 0.0,
+            "materialized": self.materialized,
+            "stored": await self._call(self.store.count)
+        }
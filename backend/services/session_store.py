@@ -0,0 +1,254 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# SQLite sessions: prune least recently seen users once per this many accesses
+PRUNE_EVERY = 1000
+
+
+class UserProfile:
+    """
+    Preferences and bounded browsing history for one user
+
+    History is kept in an insertion-ordered dict used as an ordered set, so
+    membership checks, appends and dropping the oldest entry are all O(1).
+    """
+
+    def __init__(self, max_history=50):
+        self.preferences = {}
+        self.history = {}
+        self.max_history = max_history
+
+    @property
+    def browsing_history(self):
+        return list(self.history)
+
+    def add_to_history(self, product_id):
+        """
+        Append a product to the history unless already present
+
+        Returns:
+        - bool: True if the product was added
+        """
+        if product_id in self.history:
+            return False
+        self.history[product_id] = None
+        while len(self.history) > self.max_history:
+            del self.history[next(iter(self.history))]
+        return True
+
+    def clear_history(self):
+        self.history = {}
+
+
+class InMemorySessionStore:
+    """
+    Per-user profiles held in process memory
+
+    add_view(user_id, product_id) appends to the history like
+    add_to_browsing_history() and returns the history before it (None if
+    the product was already there) in one call, so concurrent views by the
+    same user each pair with the history they extend.
+
+    The least recently used profiles are evicted beyond max_users. State is
+    local to one worker process; use SQLiteSessionStore when running several.
+    """
+
+    # Calls are cheap dict operations, run directly on the event loop
+    executor = None
+
+    def __init__(self, max_users=100000, max_history=50):
+        self.max_users = max_users
+        self.max_history = max_history
+        self._profiles = OrderedDict()
+
+    def _profile(self, user_id):
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            profile = UserProfile(self.max_history)
+            self._profiles[user_id] = profile
+            while len(self._profiles) > self.max_users:
+                self._profiles.popitem(last=False)
+        else:
+            self._profiles.move_to_end(user_id)
+        return profile
+
+    def get_preferences(self, user_id):
+        return self._profile(user_id).preferences
+
+    def set_preferences(self, user_id, preferences):
+        self._profile(user_id).preferences = preferences
+
+    def get_browsing_history(self, user_id):
+        return self._profile(user_id).browsing_history
+
+    def add_to_browsing_history(self, user_id, product_id):
+        return self._profile(user_id).add_to_history(product_id)
+
+    def add_view(self, user_id, product_id):
+        profile = self._profile(user_id)
+        previous = profile.browsing_history
+        return previous if profile.add_to_history(product_id) else None
+
+    def clear_browsing_history(self, user_id):
+        self._profile(user_id).clear_history()
+
+
+class SQLiteSessionStore:
+    """
+    Per-user profiles in a SQLite file shared by all workers on a host
+
+    History rows are unique per (user, product), so membership checks use the
+    primary key index, and each user's history is trimmed to max_history.
+    Like InMemorySessionStore, users beyond max_users are evicted least
+    recently seen first: every access stamps the user's last_seen time, and
+    every PRUNE_EVERY accesses the oldest users' rows are deleted.
+
+    Calls block on disk I/O and locks held by other workers, so callers on
+    the event loop run them on `executor`, a single thread that also owns
+    the connection.
+    """
+
+    def __init__(self, path, max_users=100000, max_history=50):
+        self.path = path
+        self.max_users = max_users
+        self.max_history = max_history
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+        self._accesses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_preferences ("
+            "user_id TEXT PRIMARY KEY, preferences TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS browsing_history ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, product_id TEXT NOT NULL, "
+            "UNIQUE (user_id, product_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_sessions (user_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS user_sessions_last_seen ON user_sessions (last_seen)")
+        # Users stored before last_seen was tracked count as seen when they last saved preferences
+        self._conn.execute(
+            "INSERT OR IGNORE INTO user_sessions (user_id, last_seen) "
+            "SELECT user_id, updated_at FROM user_preferences"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO user_sessions (user_id, last_seen) "
+            "SELECT DISTINCT user_id, 0 FROM browsing_history"
+        )
+        self.prune()
+
+    def _touch(self, user_id):
+        self._conn.execute(
+            "INSERT INTO user_sessions (user_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET last_seen = excluded.last_seen",
+            (user_id, time.time())
+        )
+        self._accesses += 1
+        if self._accesses % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        Delete the least recently seen users beyond max_users
+
+        Returns:
+        - int: Number of users evicted
+        """
+        evicted = [row[0] for row in self._conn.execute(
+            "SELECT user_id FROM user_sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?", (self.max_users,)
+        ).fetchall()]
+        if not evicted:
+            return 0
+        rows = [(user_id,) for user_id in evicted]
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany("DELETE FROM user_preferences WHERE user_id = ?", rows)
+            self._conn.executemany("DELETE FROM browsing_history WHERE user_id = ?", rows)
+            self._conn.executemany("DELETE FROM user_sessions WHERE user_id = ?", rows)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return len(evicted)
+
+    def get_preferences(self, user_id):
+        self._touch(user_id)
+        row = self._conn.execute(
+            "SELECT preferences FROM user_preferences WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def set_preferences(self, user_id, preferences):
+        self._touch(user_id)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO user_preferences (user_id, preferences, updated_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(preferences), time.time())
+        )
+
+    def get_browsing_history(self, user_id):
+        self._touch(user_id)
+        rows = self._conn.execute(
+            "SELECT product_id FROM browsing_history WHERE user_id = ? ORDER BY seq", (user_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def add_to_browsing_history(self, user_id, product_id):
+        self._touch(user_id)
+        return self._insert_history(user_id, product_id)
+
+    def _insert_history(self, user_id, product_id):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO browsing_history (user_id, product_id) VALUES (?, ?)",
+            (user_id, product_id)
+        )
+        if cursor.rowcount == 0:
+            return False
+        self._conn.execute(
+            "DELETE FROM browsing_history WHERE user_id = ? AND seq NOT IN "
+            "(SELECT seq FROM browsing_history WHERE user_id = ? ORDER BY seq DESC LIMIT ?)",
+            (user_id, user_id, self.max_history)
+        )
+        return True
+
+    def add_view(self, user_id, product_id):
+        self._touch(user_id)
+        # One write transaction, so a concurrent view by the same user in another worker lands before or after
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous = [row[0] for row in self._conn.execute(
+                "SELECT product_id FROM browsing_history WHERE user_id = ? ORDER BY seq", (user_id,)
+            ).fetchall()]
+            added = self._insert_history(user_id, product_id)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return previous if added else None
+
+    def clear_browsing_history(self, user_id):
+        self._touch(user_id)
+        self._conn.execute("DELETE FROM browsing_history WHERE user_id = ?", (user_id,))
+
+
+def create_session_store(settings):
+    """
+    Build the session store described by the config
+
+    Parameters:
+    - settings (dict): Application config
+
+    Returns:
+    - InMemorySessionStore or SQLiteSessionStore
+    """
+    backend_name = settings['SESSION_BACKEND'].lower()
+    if backend_name == 'memory':
+        return InMemorySessionStore(settings['SESSION_MAX_USERS'], settings['SESSION_MAX_HISTORY'])
+    if backend_name == 'sqlite':
+        return SQLiteSessionStore(settings['SESSION_PATH'], settings['SESSION_MAX_USERS'], settings['SESSION_MAX_HISTORY'])
+    raise ValueError(f"Unknown SESSION_BACKEND: {settings['SESSION_BACKEND']}")
@@ -0,0 +1,70 @@
+import asyncio
+
+
+class _Flight:
+    """
+    One in-flight call and the number of callers awaiting it
+    """
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls that share a key
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight await the same task and receive the same result or exception.
+    The shared task is cancelled only when every caller awaiting it has been
+    cancelled, so one client disconnecting does not fail the others.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key, factory):
+        """
+        Run factory() once per key among concurrent callers
+
+        Parameters:
+        - key (str): Identity of the call, e.g. the recommendation cache key
+        - factory (callable): Returns the coroutine to run when no call is in flight
+
+        Returns:
+        - The coroutine's result
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            self.calls += 1
+        else:
+            self.collapsed += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self):
+        """
+        Counters for calls started and callers that joined an existing call
+        """
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._flights)
+        }
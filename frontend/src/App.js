@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './styles/App.css';
 import Catalog from './components/Catalog';
 import UserPreferences from './components/UserPreferences';
@@ -6,9 +6,16 @@ import Recommendations from './components/Recommendations';
 import BrowsingHistory from './components/BrowsingHistory';
 import * as api from './services/api';
 
+// Products fetched per catalog page
+const PAGE_SIZE = 100;
+
 function App() {
   // State for products and categories
   const [products, setProducts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const [categories, setCategories] = useState([]);
+  const [brands, setBrands] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
   
@@ -20,15 +27,22 @@ function App() {
   // State for recommendations
   const [recommendations, setRecommendations] = useState([]);
   const [isLoadingRecommendations, setIsLoadingRecommendations] = useState(false);
+  const recommendationStream = useRef(null);
   
   // Fetch all products on component mount
   useEffect(() => {
     const fetchInitialData = async () => {
       try {
         setIsLoading(true);
-        // Fetch products
-        const productsData = await api.fetchProducts();
+        // Fetch the first page of products
+        const productsData = await api.fetchProducts({ limit: PAGE_SIZE });
         setProducts(productsData.products);
+        setNextCursor(productsData.next_cursor);
+        
+        // Fetch the full category and brand lists (products are paged)
+        const [categoriesData, brandsData] = await Promise.all([api.fetchCategories(), api.fetchBrands()]);
+        setCategories(categoriesData.categories || []);
+        setBrands(brandsData.brands || []);
         
         // Fetch user preferences if any
         const preferencesData = await api.getPreferences();
@@ -50,6 +64,21 @@ function App() {
     fetchInitialData();
   }, []);
   
+  // Handler for loading the next page of products
+  const handleLoadMore = async () => {
+    if (!nextCursor || isLoadingMore) return;
+    try {
+      setIsLoadingMore(true);
+      const productsData = await api.fetchProducts({ limit: PAGE_SIZE, cursor: nextCursor });
+      setProducts((previous) => [...previous, ...productsData.products]);
+      setNextCursor(productsData.next_cursor);
+    } catch (err) {
+      console.error('Error loading more products:', err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+  
   // Handler for updating user preferences
   const handlePreferencesChange = async (newPreferences) => {
     try {
@@ -95,20 +124,31 @@ function App() {
     }
   };
   
-  // Fetch recommendations from API
-  const fetchRecommendations = async () => {
-    try {
-      setIsLoadingRecommendations(true);
-      const data = await api.getRecommendations();
-      setRecommendations(data.recommendations || []);
-      setIsLoadingRecommendations(false);
-    } catch (err) {
-      console.error('Error fetching recommendations:', err);
-      setIsLoadingRecommendations(false);
-      // Don't show error to user as recommendations might not be available yet
+  // Stream recommendations from API, showing each one as soon as it arrives
+  const fetchRecommendations = () => {
+    if (recommendationStream.current) {
+      recommendationStream.current.close();
     }
+    setRecommendations([]);
+    setIsLoadingRecommendations(true);
+    recommendationStream.current = api.streamRecommendations({
+      onRecommendation: (recommendation) => {
+        setRecommendations((previous) => [...previous, recommendation]);
+        setIsLoadingRecommendations(false);
+      },
+      onDone: () => setIsLoadingRecommendations(false),
+      // Don't show error to user as recommendations might not be available yet
+      onError: () => setIsLoadingRecommendations(false),
+    });
   };
   
+  // Close any open recommendation stream on unmount
+  useEffect(() => () => {
+    if (recommendationStream.current) {
+      recommendationStream.current.close();
+    }
+  }, []);
+  
   // Show loading screen while initial data loads
   if (isLoading) {
     return (
@@ -158,6 +198,8 @@ function App() {
             <UserPreferences 
               preferences={userPreferences} 
               products={products} 
+              categories={categories}
+              brands={brands}
               onPreferencesChange={handlePreferencesChange} 
             />
             
@@ -180,6 +222,9 @@ function App() {
                 products={products} 
                 onProductClick={handleProductClick} 
                 browsingHistory={browsingHistory} 
+                hasMore={Boolean(nextCursor)}
+                isLoadingMore={isLoadingMore}
+                onLoadMore={handleLoadMore}
               />
             </div>
           </div>
@@ -1,6 +1,6 @@
 import React, { useState } from 'react';
 
-const Catalog = ({ products, onProductClick, browsingHistory = [] }) => {
+const Catalog = ({ products, onProductClick, browsingHistory = [], hasMore = false, isLoadingMore = false, onLoadMore }) => {
   // Added import for useState above
   const [selectedCategory, setSelectedCategory] = useState('All');
   const [searchTerm, setSearchTerm] = useState('');
@@ -84,6 +84,18 @@ const Catalog = ({ products, onProductClick, browsingHistory = [] }) => {
           ))}
         </div>
       )}
+      
+      {hasMore && (
+        <div className="text-center mt-4">
+          <button 
+            onClick={onLoadMore}
+            disabled={isLoadingMore}
+            className="px-4 py-2 bg-blue-600 text-white rounded hover:bg-blue-700 disabled:opacity-50"
+          >
+            {isLoadingMore ? 'Loading...' : 'Load more products'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
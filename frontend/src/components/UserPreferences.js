@@ -1,11 +1,11 @@
 import React, { useState, useEffect } from 'react';
 
-const UserPreferences = ({ preferences, products, onPreferencesChange }) => {
+const UserPreferences = ({ preferences, products, categories: allCategories = [], brands: allBrands = [], onPreferencesChange }) => {
   // Added imports for useState and useEffect above
   
-  // Extract unique categories and brands from products
-  const categories = [...new Set(products.map(product => product.category))];
-  const brands = [...new Set(products.map(product => product.brand))];
+  // Use the full category and brand lists when loaded, else those of the products loaded so far
+  const categories = allCategories.length ? allCategories : [...new Set(products.map(product => product.category))];
+  const brands = allBrands.length ? allBrands : [...new Set(products.map(product => product.brand))];
   
   // Local state to manage form values
   const [formValues, setFormValues] = useState({
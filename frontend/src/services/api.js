@@ -1,11 +1,18 @@
 const API_BASE_URL = 'http://localhost:5000/api';
 
-// Fetch all products from the API, with optional category filter
-export const fetchProducts = async (category = null) => {
+// Fetch a page of products. Options map to query parameters, e.g.
+// { category, brand, tags, min_price, max_price, min_rating, in_stock, sort, limit, cursor, fields };
+// pass the previous response's next_cursor as cursor to get the following page.
+export const fetchProducts = async (options = {}) => {
   try {
-    const url = category 
-      ? `${API_BASE_URL}/products?category=${encodeURIComponent(category)}`
-      : `${API_BASE_URL}/products`;
+    const params = new URLSearchParams();
+    Object.entries(options).forEach(([key, value]) => {
+      if (value !== null && value !== undefined && value !== '') {
+        params.append(key, Array.isArray(value) ? value.join(',') : value);
+      }
+    });
+    const query = params.toString();
+    const url = query ? `${API_BASE_URL}/products?${query}` : `${API_BASE_URL}/products`;
       
     const response = await fetch(url);
     if (!response.ok) {
@@ -166,6 +173,31 @@ export const getRecommendations = async () => {
   }
 };
 
+// Stream recommendations as Server-Sent Events; each recommendation is delivered
+// as soon as the backend has parsed it. Returns the EventSource so callers can close it.
+export const streamRecommendations = ({ onRecommendation, onDone, onError }) => {
+  const source = new EventSource(`${API_BASE_URL}/recommendations/stream`);
+  
+  source.addEventListener('recommendation', (event) => {
+    onRecommendation(JSON.parse(event.data));
+  });
+  
+  source.addEventListener('done', (event) => {
+    source.close();
+    if (onDone) onDone(JSON.parse(event.data));
+  });
+  
+  // Fired both for server-sent "error" events and for connection failures
+  source.addEventListener('error', (event) => {
+    source.close();
+    const detail = event.data ? JSON.parse(event.data).detail : 'Recommendation stream failed';
+    console.error('Error streaming recommendations:', detail);
+    if (onError) onError(detail);
+  });
+  
+  return source;
+};
+
 // Test LLM connection
 export const testLLMConnection = async () => {
   try {
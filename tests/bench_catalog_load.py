@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Catalog Startup Benchmark
+
+Writes a synthetic catalog as JSON and converts it to the columnar format,
+then loads each in a fresh process the way a worker starts up (ProductService
+plus the scoring engine) and reports load time and resident memory. The
+columnar catalog is also checked to decode to exactly the JSON products.
+
+Usage:
+    python tests/bench_catalog_load.py [--sizes 10000,200000,1000000] [--workdir /tmp/catalog_bench]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_catalog import generate_catalog
+
+# Runs in a fresh interpreter so RSS reflects one worker's startup
+WORKER_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from services.product_service import ProductService
+from services.scoring_engine import ScoringEngine
+imported = time.perf_counter()
+service = ProductService()
+loaded = time.perf_counter()
+engine = ScoringEngine.for_products(service.get_all_products())
+engine.top_products(20, relevant_categories=['Electronics'], relevant_tags=['wireless'], min_price=50, max_price=150)
+service.get_product_by_id('prod0000001')
+ready = time.perf_counter()
+with open('/proc/self/status') as status:
+    memory = {line.split(':')[0]: int(line.split()[1]) for line in status if line.startswith(('VmRSS', 'VmHWM'))}
+print(json.dumps({
+    "load": loaded - imported,
+    "ready": ready - imported,
+    "rss_mb": memory['VmRSS'] / 1024,
+    "peak_mb": memory['VmHWM'] / 1024,
+    "count": len(service.get_all_products())
+}))
+"""
+
+
+def run_worker(catalog_format, data_path, catalog_path):
+    env = dict(os.environ, CATALOG_FORMAT=catalog_format, DATA_PATH=data_path,
+               CATALOG_COLUMNAR_PATH=catalog_path, OPENAI_API_KEY="bench")
+    output = subprocess.run([sys.executable, "-c", WORKER_SCRIPT], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def verify(products, catalog_path):
+    from services.columnar_catalog import ColumnarCatalog
+
+    catalog = ColumnarCatalog.open(catalog_path)
+    mismatches = sum(1 for expected, decoded in zip(products, catalog) if expected != decoded)
+    return mismatches + abs(len(products) - len(catalog))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,200000,1000000")
+    parser.add_argument("--workdir", default="/tmp/catalog_bench")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    from services.columnar_catalog import write_catalog
+
+    print(f"{'products':>9} {'format':>9} {'disk (MB)':>10} {'load (s)':>9} {'ready (s)':>10} {'RSS (MB)':>9} {'peak (MB)':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        products = generate_catalog(size)
+        data_path = os.path.join(args.workdir, f"products_{size}.json")
+        catalog_path = os.path.join(args.workdir, f"catalog_{size}")
+        with open(data_path, "w") as file:
+            json.dump(products, file)
+        shutil.rmtree(catalog_path, ignore_errors=True)
+        start = time.perf_counter()
+        version_path = write_catalog(products, catalog_path, f"bench{size}")
+        convert_time = time.perf_counter() - start
+
+        sizes = {
+            "json": os.path.getsize(data_path),
+            "columnar": sum(os.path.getsize(os.path.join(version_path, name)) for name in os.listdir(version_path)),
+        }
+        for catalog_format in ("json", "columnar"):
+            result = run_worker(catalog_format, data_path, catalog_path)
+            assert result["count"] == size
+            print(f"{size:>9} {catalog_format:>9} {sizes[catalog_format] / 2 ** 20:>10.1f} {result['load']:>9.3f} "
+                  f"{result['ready']:>10.3f} {result['rss_mb']:>9.1f} {result['peak_mb']:>10.1f}")
+        print(f"{'':>9} converted in {convert_time:.2f}s, decode mismatches={verify(products, catalog_path)}")
+
+
+if __name__ == "__main__":
+    main()
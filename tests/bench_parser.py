@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+Response Parser Benchmark
+
+Runs the recommendation parser and the original regex-based parser over a
+corpus of malformed model outputs (tests/parser_corpus.json), fuzzes both with
+randomly truncated and corrupted responses, and times them on long outputs.
+
+Usage:
+    python tests/bench_parser.py [--fuzz 2000] [--repeat 200] [--seed 42]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.response_parser import StreamingRecommendationParser, parse_recommendations
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "parser_corpus.json")
+
+# Text injected at random positions by the fuzzer
+INJECTIONS = ["```json\n", "\n```", "Sure!", ",", "}", "]", "[", "{", '"', "\\", "\n", "Note: [1]"]
+
+
+def legacy_parse(llm_response):
+    """The original regex parser, kept as the reference implementation; returns product IDs"""
+    try:
+        json_match = re.search(r'\[.*\]', llm_response, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(0)
+        else:
+            code_block_match = re.search(r'```(?:json)?(.*?)```', llm_response, re.DOTALL)
+            if not code_block_match:
+                return []
+            json_str = code_block_match.group(1).strip()
+        json_str = json_str.strip()
+        if not (json_str.startswith('[') and json_str.endswith(']')):
+            start_idx = json_str.find('[')
+            end_idx = json_str.rfind(']') + 1
+            if start_idx >= 0 and end_idx > 0:
+                json_str = json_str[start_idx:end_idx]
+        return [rec.get('product_id') for rec in json.loads(json_str) if isinstance(rec, dict)]
+    except Exception:
+        return []
+
+
+def new_parse(llm_response, known_ids):
+    recommendations, _ = parse_recommendations(llm_response, is_known=known_ids.__contains__)
+    return [rec["product_id"] for rec in recommendations]
+
+
+def score_ids(parsed, expected, known_ids):
+    """Expected IDs recovered, and whether the result contains nothing invalid"""
+    valid = [pid for pid in parsed if pid in known_ids]
+    clean = len(valid) == len(parsed) == len(set(parsed))
+    return len(set(valid) & set(expected)), clean
+
+
+def run_corpus(corpus, known_ids):
+    print(f"{'case':<38} {'expected':>8} {'legacy':>7} {'new':>5}")
+    totals = {"expected": 0, "legacy": 0, "new": 0}
+    for case in corpus:
+        expected = case["expected"]
+        legacy_found, legacy_clean = score_ids(legacy_parse(case["response"]), expected, known_ids)
+        new_found, new_clean = score_ids(new_parse(case["response"], known_ids), expected, known_ids)
+        totals["expected"] += len(expected)
+        totals["legacy"] += legacy_found
+        totals["new"] += new_found
+        flags = ("" if legacy_clean else " legacy kept invalid IDs") + ("" if new_clean else " new kept invalid IDs")
+        print(f"{case['name']:<38} {len(expected):>8} {legacy_found:>7} {new_found:>5}{flags}")
+    print(f"{'total':<38} {totals['expected']:>8} {totals['legacy']:>7} {totals['new']:>5}")
+
+
+def fuzz(corpus, known_ids, iterations, rng):
+    """Truncate and corrupt corpus responses; the new parser must never raise"""
+    sources = [case for case in corpus if case["expected"]]
+    recovered = {"legacy": 0, "new": 0}
+    streamed_mismatches = 0
+    for _ in range(iterations):
+        text = rng.choice(sources)["response"]
+        for _ in range(rng.randint(0, 2)):
+            position = rng.randrange(len(text) + 1)
+            text = text[:position] + rng.choice(INJECTIONS) + text[position:]
+        if rng.random() < 0.5:
+            text = text[:rng.randrange(len(text) + 1)]
+
+        whole = new_parse(text, known_ids)
+        recovered["new"] += len(whole)
+        recovered["legacy"] += len([pid for pid in legacy_parse(text) if pid in known_ids])
+
+        # Feeding the same text in random chunks must give the same result
+        parser = StreamingRecommendationParser(is_known=known_ids.__contains__)
+        streamed = []
+        position = 0
+        while position < len(text):
+            size = rng.randint(1, 16)
+            streamed.extend(rec["product_id"] for rec in parser.feed(text[position:position + size]))
+            position += size
+        streamed.extend(rec["product_id"] for rec in parser.finish())
+        if streamed != whole:
+            streamed_mismatches += 1
+    print(f"fuzz: {iterations} responses, IDs recovered legacy={recovered['legacy']} new={recovered['new']}, "
+          f"chunked/whole mismatches={streamed_mismatches}")
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def run_timing(repeat):
+    print(f"{'recommendations':>16} {'chars':>8} {'legacy (ms)':>12} {'new (ms)':>9} {'chunked (ms)':>13}")
+    for count in (5, 50, 500):
+        ids = [f"prod{i:05d}" for i in range(count)]
+        known_ids = set(ids)
+        text = "```json\n" + json.dumps([
+            {"product_id": pid, "explanation": "This product matches your preference for athletic gear " * 3, "score": 8}
+            for pid in ids
+        ], indent=2) + "\n```"
+        chunks = [text[i:i + 4] for i in range(0, len(text), 4)]
+
+        def chunked():
+            parser = StreamingRecommendationParser(is_known=known_ids.__contains__)
+            for chunk in chunks:
+                parser.feed(chunk)
+            parser.finish()
+
+        legacy_time = time_call(lambda: legacy_parse(text), repeat)
+        new_time = time_call(lambda: new_parse(text, known_ids), repeat)
+        chunked_time = time_call(chunked, max(1, repeat // 10))
+        print(f"{count:>16} {len(text):>8} {legacy_time * 1000:>12.3f} {new_time * 1000:>9.3f} {chunked_time * 1000:>13.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, "r") as f:
+        corpus = json.load(f)
+    known_ids = {pid for case in corpus for pid in case["expected"]}
+
+    run_corpus(corpus, known_ids)
+    print()
+    fuzz(corpus, known_ids, args.fuzz, random.Random(args.seed))
+    print()
+    run_timing(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Recommendation Hot-Path Benchmark
+
+Times the three CPU-bound steps of a recommendation request on synthetic
+catalogs: candidate selection (LLMService._filter_relevant_products, the
+local pipeline stages), prompt building and LLM response parsing. Each
+catalog size runs in a fresh process with its own data, embedding and
+search index paths, so indexes are built for that catalog. The first
+(cold) call, including the wait for those indexes, is reported separately
+from the warm median.
+
+Results are compared with the limits in tests/perf_thresholds.json; the
+script exits with status 1 when a warm median exceeds its limit. Limits are
+generous multiples of reference timings, meant to catch regressions rather
+than small noise. --update rewrites the file from this run's timings.
+
+Usage:
+    python tests/bench_recommendation.py [--sizes 50,1000,10000,100000,1000000] [--repeat 20]
+                                         [--workdir /tmp/recommendation_bench] [--thresholds tests/perf_thresholds.json]
+                                         [--update] [--headroom 3] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_catalog import generate_catalog
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf_thresholds.json")
+
+STEPS = ("filter", "prompt", "parse")
+
+# Runs in a fresh interpreter: config is read from the environment at import time
+WORKER_SCRIPT = """
+import json, random, statistics, sys, time
+from services.product_service import ProductService
+from services.search_service import SearchService
+from services.llm_service import LLMService
+
+repeat = int(sys.argv[1])
+product_service = ProductService()
+service = LLMService(product_service, SearchService(product_service))
+products = product_service.get_all_products()
+categories = sorted({p['category'] for p in products})
+brands = sorted({p['brand'] for p in products})
+rng = random.Random(42)
+profiles = []
+for _ in range(repeat):
+    preferences = {
+        'preferred_categories': rng.sample(categories, min(2, len(categories))),
+        'preferred_brands': rng.sample(brands, min(2, len(brands))),
+        'price_range': rng.choice(['0-50', '50-200', '100-1000'])
+    }
+    profiles.append((preferences, rng.sample(products, min(3, len(products)))))
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+# Indexes build in the background on a live server; here the first call waits for them
+warm_up, _ = timed(lambda: service.warm_indexes(wait=True))
+cold, _ = timed(lambda: service._filter_relevant_products(*profiles[0], products))
+cold += warm_up
+timings = {'filter': [], 'prompt': [], 'parse': []}
+for preferences, browsed in profiles:
+    seconds, shortlist = timed(lambda: service._filter_relevant_products(preferences, browsed, products))
+    timings['filter'].append(seconds)
+    seconds, _ = timed(lambda: service._build_prompt(preferences, browsed, shortlist))
+    timings['prompt'].append(seconds)
+    response = 'Here are my picks:\\n```json\\n' + json.dumps([
+        {'product_id': p['id'], 'explanation': f"Matches your interest in {p['category']} from {p['brand']}."}
+        for p in shortlist[:5]
+    ], indent=2) + '\\n```'
+    seconds, parsed = timed(lambda: service._parse_recommendation_response(response, products))
+    timings['parse'].append(seconds)
+    assert parsed.get('count') == min(5, len(shortlist)), parsed
+print(json.dumps({
+    'cold_filter': cold,
+    **{step: statistics.median(values) for step, values in timings.items()}
+}))
+"""
+
+
+def run_worker(size, workdir, repeat):
+    data_path = os.path.join(workdir, f"products_{size}.json")
+    if not os.path.exists(data_path):
+        with open(data_path, "w") as f:
+            json.dump(generate_catalog(size), f)
+    env = dict(
+        os.environ,
+        DATA_PATH=data_path,
+        CATALOG_FORMAT="json",
+        EMBEDDING_INDEX_PATH=os.path.join(workdir, f"embeddings_{size}"),
+        SEARCH_INDEX_PATH=os.path.join(workdir, f"search_{size}"),
+        CO_VIEW_LOG_PATH="",
+        CACHE_BACKEND="none",
+        METRICS_ENABLED="false",
+        OPENAI_API_KEY="bench"
+    )
+    completed = subprocess.run([sys.executable, "-c", WORKER_SCRIPT, str(repeat)], cwd=BACKEND_DIR, env=env,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark worker failed for {size} products:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def load_thresholds(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--workdir", default="/tmp/recommendation_bench")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--update", action="store_true", help="Rewrite the thresholds from this run")
+    parser.add_argument("--headroom", type=float, default=3.0, help="Multiple of this run's timings written by --update")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    thresholds = load_thresholds(args.thresholds)
+    results = {}
+    failures = []
+    print(f"{'products':>10} {'cold filter (ms)':>17} {'filter (ms)':>12} {'prompt (ms)':>12} {'parse (ms)':>11} {'status':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        timing = run_worker(size, args.workdir, args.repeat)
+        results[str(size)] = {key: value * 1000 for key, value in timing.items()}
+        limits = thresholds.get(str(size), {})
+        exceeded = [step for step in STEPS if step in limits and results[str(size)][step] > limits[step]]
+        failures += [f"{size} products: {step} {results[str(size)][step]:.2f} ms > {limits[step]:.2f} ms"
+                     for step in exceeded]
+        status = "FAIL" if exceeded else ("ok" if limits else "-")
+        print(f"{size:>10} {timing['cold_filter'] * 1000:>17.1f} {timing['filter'] * 1000:>12.2f} "
+              f"{timing['prompt'] * 1000:>12.2f} {timing['parse'] * 1000:>11.3f} {status:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update:
+        for size, timing in results.items():
+            thresholds[size] = {step: round(timing[step] * args.headroom, 3) for step in STEPS}
+        with open(args.thresholds, "w") as f:
+            json.dump(dict(sorted(thresholds.items(), key=lambda item: int(item[0]))), f, indent=2)
+            f.write("\n")
+        print(f"Wrote thresholds to {args.thresholds}")
+        return
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Candidate Scoring Benchmark
+
+Compares the vectorized ScoringEngine against the original per-product
+Python loop from LLMService._filter_relevant_products on synthetic catalogs,
+and checks that both pick the same top 20 products.
+
+Usage:
+    python tests/bench_scoring.py [--sizes 50,1000,100000,1000000] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from services.scoring_engine import ScoringEngine
+from synthetic_catalog import generate_catalog
+
+# The legacy loop is only timed up to this size; it takes seconds per call beyond it
+LEGACY_MAX_SIZE = 200000
+
+
+def legacy_top_products(all_products, criteria, k=20):
+    """The original scoring loop, kept as the reference implementation"""
+    product_scores = []
+    for product in all_products:
+        if product['id'] in criteria["exclude_ids"]:
+            continue
+        score = 0
+        if product['category'] in criteria["relevant_categories"]:
+            score += 3
+        if product['brand'] in criteria["relevant_brands"]:
+            score += 2
+        if criteria["min_price"] <= product['price'] <= criteria["max_price"]:
+            score += 2
+        if 'tags' in product:
+            score += len(set(product['tags']) & criteria["relevant_tags"])
+        if score > 0:
+            product_scores.append((product, score))
+    product_scores.sort(key=lambda x: x[1], reverse=True)
+    return [item[0] for item in product_scores[:k]]
+
+
+def time_call(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'products':>10} {'build (s)':>10} {'engine (ms)':>12} {'legacy (ms)':>12} {'speedup':>8} {'same top-20':>12}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        products = generate_catalog(size)
+        browsed = products[:2]
+        criteria = {
+            "relevant_categories": {"Electronics", browsed[0]["category"], browsed[1]["category"]},
+            "relevant_brands": {browsed[0]["brand"], browsed[1]["brand"]},
+            "relevant_tags": set(browsed[0]["tags"]) | set(browsed[1]["tags"]),
+            "min_price": 50,
+            "max_price": 150,
+            "exclude_ids": {p["id"] for p in browsed},
+        }
+
+        start = time.perf_counter()
+        engine = ScoringEngine(products)
+        build_time = time.perf_counter() - start
+
+        engine_time, engine_result = time_call(lambda: engine.top_products(20, **criteria), args.repeat)
+        engine_ids = [p["id"] for p, _ in engine_result]
+
+        if size <= LEGACY_MAX_SIZE:
+            legacy_time, legacy_result = time_call(lambda: legacy_top_products(products, criteria), max(1, args.repeat // 2))
+            same = engine_ids == [p["id"] for p in legacy_result]
+            print(f"{size:>10} {build_time:>10.3f} {engine_time * 1000:>12.2f} {legacy_time * 1000:>12.2f} "
+                  f"{legacy_time / engine_time:>7.1f}x {str(same):>12}")
+        else:
+            print(f"{size:>10} {build_time:>10.3f} {engine_time * 1000:>12.2f} {'-':>12} {'-':>8} {'-':>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Response Serialization Benchmark
+
+Times rendering a product listing the way FastAPI does for a response_model
+(validate every product with pydantic, jsonable_encoder, json.dumps) against
+the fast path (cached per-product JSON spliced together by
+services.json_encoding), cold and with a warm cache, and checks that both
+decode to the same document.
+
+Usage:
+    python tests/bench_serialization.py [--page-sizes 50,200,1000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from typing import Any, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+
+from services.json_encoding import ProductJSONCache, encode, orjson
+from synthetic_catalog import generate_catalog
+
+
+class ProductResponse(BaseModel):
+    products: List[Dict[str, Any]]
+    count: int
+    total: int
+    next_cursor: Optional[str] = None
+
+
+def render_response_model(field, products):
+    content = {"products": products, "count": len(products), "total": 100000, "next_cursor": None}
+    serialized = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(serialized).body
+
+
+def render_fast(cache, products):
+    return encode({"products": cache.products(products), "count": len(products), "total": 100000, "next_cursor": None})
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-sizes", default="50,200,1000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    field = create_response_field(name="response", type_=ProductResponse)
+    catalog = generate_catalog(max(int(s) for s in args.page_sizes.split(",")))
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}")
+    print(f"{'page':>6} {'response_model (ms)':>20} {'cold (ms)':>10} {'warm (ms)':>10} {'speedup':>8}")
+    for size in (int(s) for s in args.page_sizes.split(",")):
+        products = catalog[:size]
+        baseline = timed(lambda: render_response_model(field, products), args.repeat)
+        cold = timed(lambda: render_fast(ProductJSONCache(), products), args.repeat)
+        cache = ProductJSONCache()
+        render_fast(cache, products)
+        warm = timed(lambda: render_fast(cache, products), args.repeat)
+        assert json.loads(render_fast(cache, products)) == json.loads(render_response_model(field, products))
+        print(f"{size:>6} {baseline:>20.2f} {cold:>10.2f} {warm:>10.2f} {baseline / warm:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
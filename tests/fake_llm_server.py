@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Fake OpenAI-compatible LLM Server
+
+A local stand-in for the OpenAI chat completions API so the backend can be
+exercised without network access or API spend. It answers
+POST /v1/chat/completions by recommending the first products listed in the
+prompt, after an optional artificial delay.
+
+Errors and latency spikes can be injected to exercise retries, backoff and
+the circuit breaker: --error-rate answers that fraction of requests with
+--error-status (429 by default, with a Retry-After of --retry-after seconds),
+and --latency-jitter adds a random extra delay of up to that many seconds.
+--malformed-rate cuts that fraction of completions off mid-JSON to exercise
+the response parser.
+
+--tokens-per-second models generation speed: a completion of N tokens
+(about 4 characters each) takes N / rate seconds on top of --latency, spread
+over the chunks when streaming, like a real model's time to first token
+plus decoding time.
+
+Usage:
+    python tests/fake_llm_server.py --port 8001 --latency 1.5
+    python tests/fake_llm_server.py --latency 0.3 --tokens-per-second 50
+    python tests/fake_llm_server.py --error-rate 0.3 --retry-after 1
+
+Then start the backend with:
+    OPENAI_API_BASE=http://localhost:8001/v1 python app.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake LLM Server")
+settings = {
+    "latency": 0.0, "latency_jitter": 0.0, "token_delay": 0.0, "recommendations": 5,
+    "error_rate": 0.0, "error_status": 429, "retry_after": None, "tokens_per_second": 0.0, "malformed_rate": 0.0
+}
+stats = {"requests": 0, "errors": 0, "malformed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+# Characters per streamed chunk, roughly one token
+CHUNK_SIZE = 4
+
+PRODUCT_ID_PATTERN = re.compile(r'\(ID: ([^)]+)\)')
+
+def build_content(prompt):
+    """Build a JSON recommendation array from the product IDs found in the prompt"""
+    # Skip IDs from the browsing history section when possible
+    available = prompt.split("AVAILABLE PRODUCTS", 1)[-1].split("## RECOMMENDATION TASK", 1)[0]
+    product_ids = PRODUCT_ID_PATTERN.findall(available)
+    if not product_ids:
+        # Compact format: one "id|name|..." row per product after a column header
+        product_ids = [line.split("|", 1)[0] for line in available.splitlines()
+                       if "|" in line and "columns:" not in line]
+    product_ids = list(dict.fromkeys(product_ids))
+    recommendations = [
+        {
+            "product_id": product_id,
+            "explanation": f"Recommended because it matches your preferences ({product_id}).",
+            "score": 9 - i % 5
+        }
+        for i, product_id in enumerate(product_ids[:settings["recommendations"]])
+    ]
+    return json.dumps(recommendations, indent=2)
+
+async def stream_content(content, model):
+    """Yield the completion as OpenAI-style streaming chunks"""
+    token_delay = settings["token_delay"]
+    if not token_delay and settings["tokens_per_second"]:
+        token_delay = 1 / settings["tokens_per_second"]
+    for start in range(0, len(content), CHUNK_SIZE):
+        if token_delay:
+            await asyncio.sleep(token_delay)
+        chunk = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content[start:start + CHUNK_SIZE]}, "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    stats["requests"] += 1
+    delay = settings["latency"] + random.uniform(0, settings["latency_jitter"])
+    if delay:
+        await asyncio.sleep(delay)
+    if random.random() < settings["error_rate"]:
+        stats["errors"] += 1
+        headers = {}
+        if settings["retry_after"] is not None:
+            headers["Retry-After"] = str(settings["retry_after"])
+        return JSONResponse(
+            status_code=settings["error_status"],
+            content={"error": {"message": "Injected error", "type": "fake_error"}},
+            headers=headers
+        )
+    content = build_content(prompt)
+    if random.random() < settings["malformed_rate"]:
+        stats["malformed"] += 1
+        content = content[:random.randrange(len(content) // 2 + 1)]
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+    if body.get("stream"):
+        return StreamingResponse(stream_content(content, body.get("model", "fake")), media_type="text/event-stream")
+    if settings["tokens_per_second"]:
+        await asyncio.sleep(completion_tokens / settings["tokens_per_second"])
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+@app.get("/stats")
+async def get_stats():
+    """Requests received, errors and malformed completions injected, and tokens counted so far"""
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--recommendations", type=int, default=5)
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Maximum random extra latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of injected errors")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with injected errors")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Completion tokens generated per second (0 = instant)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fraction of completions cut off mid-JSON")
+    args = parser.parse_args()
+    settings["latency"] = args.latency
+    settings["latency_jitter"] = args.latency_jitter
+    settings["token_delay"] = args.token_delay
+    settings["recommendations"] = args.recommendations
+    settings["error_rate"] = args.error_rate
+    settings["error_status"] = args.error_status
+    settings["retry_after"] = args.retry_after
+    settings["tokens_per_second"] = args.tokens_per_second
+    settings["malformed_rate"] = args.malformed_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
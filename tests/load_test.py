@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+Async Load Generator
+
+Drives a running backend with concurrent simulated users and reports
+throughput, errors and p50/p95/p99 latency per endpoint. Each user stores a
+profile once, then repeats a weighted mix of requests (product pages,
+search, product details, browsing-history updates, recommendations) until
+--duration runs out. Preferences come from a small pool, so caches and
+segments see the repetition real traffic has.
+
+Run it against the fake LLM server for reproducible numbers:
+    python tests/fake_llm_server.py --port 8001 --latency 0.5 --tokens-per-second 80
+    cd backend && OPENAI_API_BASE=http://localhost:8001/v1 OPENAI_API_KEY=fake python app.py
+    python tests/load_test.py --users 50 --duration 30
+
+Thresholds turn a run into a regression check (exit status 1 when one fails):
+    python tests/load_test.py --max-p95 recommendations=2000,products=50 --max-error-rate 0.01 --min-rps 100
+
+Usage:
+    python tests/load_test.py [--base-url http://localhost:5000] [--users 20] [--duration 20]
+                              [--mix recommendations=1,products=3,search=2,product=3,view=2]
+                              [--think-time 0] [--profiles 20] [--seed 42] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+
+DEFAULT_MIX = "recommendations=1,products=3,search=2,product=3,view=2"
+
+SEARCH_TERMS = ["wireless", "premium", "running", "organic", "smart", "lamp", "shoes", "watch", "travel", "gift"]
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an ascending list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def parse_pairs(value, cast=float):
+    """
+    Parse "name=value,name=value" into a dict
+    """
+    pairs = {}
+    for item in (value or "").split(","):
+        if item.strip():
+            name, _, number = item.partition("=")
+            pairs[name.strip()] = cast(number)
+    return pairs
+
+
+class Recorder:
+    """
+    Latencies and error counts per endpoint
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        results = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            results[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": len(values) / elapsed,
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000
+            }
+        return results
+
+
+class SimulatedUser:
+    """
+    One user issuing requests back to back (closed loop)
+    """
+
+    def __init__(self, user_id, client, recorder, catalog, profile, mix, think_time, rng):
+        self.user_id = user_id
+        self.client = client
+        self.recorder = recorder
+        self.catalog = catalog
+        self.profile = profile
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.think_time = think_time
+        self.rng = rng
+        self.headers = {"X-User-Id": user_id}
+
+    async def _timed(self, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+            await response.aread()
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+
+    async def setup(self):
+        await self._timed("preferences", "POST", "/api/preferences", json=self.profile)
+
+    async def step(self):
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        product_id = self.rng.choice(self.catalog["ids"])
+        if endpoint == "recommendations":
+            await self._timed(endpoint, "GET", "/api/recommendations")
+        elif endpoint == "products":
+            params = {"limit": 20}
+            if self.rng.random() < 0.5:
+                params["category"] = self.rng.choice(self.catalog["categories"])
+            await self._timed(endpoint, "GET", "/api/products", params=params)
+        elif endpoint == "search":
+            await self._timed(endpoint, "GET", "/api/search", params={"q": self.rng.choice(SEARCH_TERMS), "limit": 20})
+        elif endpoint == "product":
+            await self._timed(endpoint, "GET", f"/api/products/{product_id}")
+        elif endpoint == "view":
+            await self._timed(endpoint, "POST", "/api/browsing-history", json={"product_id": product_id})
+        else:
+            raise ValueError(f"Unknown endpoint in mix: {endpoint}")
+
+    async def run(self, deadline):
+        await self.setup()
+        while time.perf_counter() < deadline:
+            await self.step()
+            if self.think_time:
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.think_time))
+
+
+async def load_catalog(client):
+    """
+    Product IDs, categories and brands to build requests from
+    """
+    products = (await client.get("/api/products", params={"limit": 200})).json()["products"]
+    categories = (await client.get("/api/categories")).json()["categories"]
+    brands = (await client.get("/api/brands")).json()["brands"]
+    return {"ids": [p["id"] for p in products], "categories": categories, "brands": brands}
+
+
+def make_profiles(catalog, count, rng):
+    """
+    A pool of preference profiles shared by the simulated users
+    """
+    profiles = []
+    for _ in range(count):
+        low = rng.choice([0, 25, 50, 100])
+        profiles.append({
+            "preferred_categories": rng.sample(catalog["categories"], min(len(catalog["categories"]), rng.randint(1, 2))),
+            "preferred_brands": rng.sample(catalog["brands"], min(len(catalog["brands"]), rng.randint(0, 2))),
+            "price_range": {"min": low, "max": low + rng.choice([50, 100, 500])}
+        })
+    return profiles
+
+
+async def run_load(args):
+    rng = random.Random(args.seed)
+    mix = parse_pairs(args.mix)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        catalog = await load_catalog(client)
+        profiles = make_profiles(catalog, args.profiles, rng)
+        users = [
+            SimulatedUser(f"load-{i}", client, recorder, catalog, rng.choice(profiles), mix, args.think_time,
+                          random.Random(args.seed + i))
+            for i in range(args.users)
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*(user.run(start + args.duration) for user in users))
+        elapsed = time.perf_counter() - start
+    return recorder.summary(elapsed), elapsed
+
+
+def check_thresholds(results, elapsed, args):
+    """
+    Threshold violations as messages
+    """
+    failures = []
+    for endpoint, limit in parse_pairs(args.max_p95).items():
+        if endpoint in results and results[endpoint]["p95_ms"] > limit:
+            failures.append(f"{endpoint} p95 {results[endpoint]['p95_ms']:.1f} ms > {limit:.1f} ms")
+    total = sum(r["requests"] for r in results.values())
+    errors = sum(r["errors"] for r in results.values())
+    if args.max_error_rate is not None and total and errors / total > args.max_error_rate:
+        failures.append(f"error rate {errors / total:.2%} > {args.max_error_rate:.2%}")
+    if args.min_rps is not None and total / elapsed < args.min_rps:
+        failures.append(f"throughput {total / elapsed:.1f} req/s < {args.min_rps:.1f} req/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Relative weight per endpoint")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a user's requests")
+    parser.add_argument("--profiles", type=int, default=20, help="Distinct preference profiles")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--max-p95", help="p95 limits in ms per endpoint, e.g. recommendations=2000,products=50")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="Largest acceptable error fraction")
+    parser.add_argument("--min-rps", type=float, default=None, help="Smallest acceptable total throughput")
+    args = parser.parse_args()
+
+    results, elapsed = asyncio.run(run_load(args))
+
+    print(f"{args.users} users, {elapsed:.1f} s")
+    print(f"{'endpoint':>16} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:>16} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+    total = sum(r["requests"] for r in results.values())
+    print(f"{'total':>16} {total:>9} {sum(r['errors'] for r in results.values()):>7} {total / elapsed:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"users": args.users, "elapsed": elapsed, "endpoints": results}, f, indent=2)
+
+    failures = check_thresholds(results, elapsed, args)
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
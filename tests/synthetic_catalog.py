@@ -0,0 +1,77 @@
+"""
+Synthetic Product Catalog Generator
+
+Builds deterministic catalogs with the same shape as backend/data/products.json
+so benchmarks can run at sizes from a few dozen to millions of products.
+
+Usage:
+    python tests/synthetic_catalog.py 200000 /tmp/products_200k.json
+"""
+
+import json
+import random
+import sys
+
+CATEGORIES = {
+    "Electronics": ["Audio", "Wearables", "Computers", "Phones", "Cameras"],
+    "Clothing": ["Tops", "Bottoms", "Outerwear", "Dresses"],
+    "Footwear": ["Running", "Casual", "Boots", "Sandals"],
+    "Home": ["Kitchen", "Decor", "Furniture", "Bedding"],
+    "Beauty": ["Skincare", "Makeup", "Fragrance"],
+    "Sports": ["Fitness", "Outdoor", "Cycling", "Yoga"],
+    "Books": ["Fiction", "Non-fiction", "Children"],
+    "Toys": ["Puzzles", "Building", "Outdoor"],
+    "Office": ["Supplies", "Furniture", "Organization"],
+    "Pets": ["Dogs", "Cats", "Aquarium"],
+    "Health": ["Supplements", "Personal Care"],
+    "Accessories": ["Bags", "Jewelry", "Watches"],
+}
+ADJECTIVES = ["Ultra", "Premium", "Classic", "Eco", "Smart", "Compact", "Deluxe", "Pro", "Lite", "Organic"]
+NOUNS = ["Headphones", "Shirt", "Shoes", "Blender", "Serum", "Mat", "Novel", "Puzzle", "Lamp", "Backpack", "Watch", "Leash"]
+FEATURES = ["Durable build", "Lightweight", "Water resistant", "Eco-friendly materials", "Long battery life",
+            "Machine washable", "Ergonomic design", "Award winning", "Handmade", "Two-year warranty"]
+TAGS = ["wireless", "premium", "organic", "sustainable", "lightweight", "running", "casual", "gift", "travel",
+        "fitness", "outdoor", "kitchen", "minimalist", "kids", "vintage", "smart", "comfortable", "budget",
+        "luxury", "portable", "waterproof", "handmade", "vegan", "ergonomic", "bestseller"]
+
+
+def generate_catalog(size, seed=42):
+    """
+    Generate a list of synthetic products
+
+    Parameters:
+    - size (int): Number of products
+    - seed (int): Random seed, so the same size always yields the same catalog
+
+    Returns:
+    - list: Product dicts
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    brand_count = max(10, size // 50)
+    products = []
+    for i in range(size):
+        category = rng.choice(categories)
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}"
+        products.append({
+            "id": f"prod{i + 1:07d}",
+            "name": name,
+            "category": category,
+            "subcategory": rng.choice(CATEGORIES[category]),
+            "price": round(rng.uniform(5, 500), 2),
+            "brand": f"Brand{rng.randrange(brand_count)}",
+            "description": f"{name} for everyday {category.lower()} needs with {rng.choice(FEATURES).lower()}.",
+            "features": rng.sample(FEATURES, 3),
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "inventory": rng.randrange(0, 200),
+            "tags": rng.sample(TAGS, rng.randint(2, 5)),
+        })
+    return products
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[2], "w") as file:
+        json.dump(generate_catalog(int(sys.argv[1])), file)
@@ -0,0 +1,129 @@
+"""
+Co-view model: neighbours, pair cap, decay at compaction and convergence across workers
+
+Usage:
+    python -m pytest tests/test_co_view_model.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.co_view_model import CoViewModel, ViewEventLog
+
+
+def pair_counts(model):
+    """Pair counts keyed by product ID pairs, comparable across models with different codes"""
+    ids = model._ids
+    return {
+        tuple(sorted((ids[key >> 32], ids[key & 0xFFFFFFFF]))): count
+        for key, count in model._pairs.items()
+    }
+
+
+def browse(model, user_history):
+    for i, product_id in enumerate(user_history):
+        model.record_view(product_id, user_history[:i])
+
+
+@pytest.fixture
+def models():
+    created = []
+
+    def make(*args, **kwargs):
+        model = CoViewModel(*args, **kwargs)
+        created.append(model)
+        return model
+
+    yield make
+    for model in created:
+        model.executor.shutdown()
+
+
+def test_neighbours_rank_by_cosine_similarity(models):
+    model = models(window=10)
+    browse(model, ["a", "b", "c"])
+    browse(model, ["a", "b"])
+    assert model.refresh()
+    assert not model.refresh()
+    neighbours = dict(model.also_viewed("a"))
+    assert list(neighbours) == ["b", "c"]
+    # a and b: 2 co-views, 2 views each; a and c: 1 co-view over sqrt(2 * 1) views
+    assert neighbours["b"] == pytest.approx(1.0)
+    assert neighbours["c"] == pytest.approx(1 / 2 ** 0.5)
+    assert [pid for pid, _ in model.also_viewed("c")] == ["a", "b"]
+    assert model.co_viewed(["c"]) == {"a": 1.0, "b": 1.0}
+
+
+def test_window_limits_the_pairs(models):
+    model = models(window=1)
+    browse(model, ["a", "b", "c"])
+    assert pair_counts(model) == {("a", "b"): 1, ("b", "c"): 1}
+
+
+def test_pairs_are_capped_without_a_log(models):
+    model = models(window=10, max_pairs=1)
+    browse(model, ["a", "b"])
+    browse(model, ["a", "b"])
+    browse(model, ["c", "d", "e"])
+    model.refresh()
+    # Three pairs exceed twice the cap, so only the largest count is kept
+    assert pair_counts(model) == {("a", "b"): 2}
+    assert model.also_viewed("c") == []
+    assert [pid for pid, _ in model.also_viewed("a")] == ["b"]
+
+
+def test_compaction_decays_and_drops_faded_counts(models, tmp_path):
+    log = ViewEventLog(str(tmp_path / "views.log"), max_bytes=1)
+    model = models(window=10, event_log=log, decay=0.5)
+    browse(model, ["a", "b"])
+    browse(model, ["a", "b"])
+    model.refresh()
+    assert model.compactions == 1
+    assert pair_counts(model) == {("a", "b"): 1.0}
+    assert model.view_counts == {"a": 1.0, "b": 1.0}
+    assert os.path.getsize(log.path) == 0
+
+    # Counts keep fading with every compaction until they drop below MIN_COUNT
+    model.record_view("c", [])
+    model.refresh()
+    assert pair_counts(model) == {("a", "b"): 0.5}
+    model.record_view("c", [])
+    model.refresh()
+    assert pair_counts(model) == {}
+    assert model.also_viewed("a") == []
+
+
+def test_workers_sharing_a_log_converge(models, tmp_path):
+    path = str(tmp_path / "views.log")
+    first = models(window=10, event_log=ViewEventLog(path))
+    second = models(window=10, event_log=ViewEventLog(path))
+    browse(first, ["a", "b", "c"])
+    browse(second, ["b", "c", "d"])
+    first.refresh()
+    second.refresh()
+    assert pair_counts(first) == pair_counts(second)
+    assert pair_counts(first)[("b", "c")] == 2
+    assert first.also_viewed("b") == second.also_viewed("b")
+
+
+def test_workers_converge_after_another_compacts(models, tmp_path):
+    path = str(tmp_path / "views.log")
+    compacting = models(window=10, event_log=ViewEventLog(path, max_bytes=1), decay=0.5)
+    other = models(window=10, event_log=ViewEventLog(path))
+    browse(other, ["a", "b"])
+    browse(compacting, ["a", "b"])
+    other.refresh()
+    compacting.refresh()
+    assert compacting.compactions == 1
+
+    # The other worker reloads each new snapshot, replaying what it wrote after it
+    other.refresh()
+    assert pair_counts(other) == pair_counts(compacting) == {("a", "b"): 1.0}
+    other.record_view("c", ["a"])
+    compacting.refresh()
+    other.refresh()
+    assert pair_counts(other) == pair_counts(compacting) == {("a", "b"): 0.5, ("a", "c"): 0.5}
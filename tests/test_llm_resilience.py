@@ -0,0 +1,236 @@
+"""
+Client-side LLM resilience: rate limiting, the priority gate and circuit breaker transitions
+
+Usage:
+    python -m pytest tests/test_llm_resilience.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.llm_backends import OpenAICompatibleBackend
+from services.llm_resilience import (
+    BATCH, INTERACTIVE, CircuitBreaker, CircuitOpenError, LLMProviderError, PriorityGate, QueueFullError,
+    QueueTimeoutError, TokenBucket
+)
+
+COMPLETION = {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 3}}
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_disabled_bucket_never_waits():
+    async def scenario():
+        bucket = TokenBucket(0)
+        for _ in range(100):
+            await asyncio.wait_for(bucket.acquire(10), 0.1)
+
+    asyncio.run(scenario())
+
+
+def test_bucket_serves_interactive_waiters_first():
+    async def scenario():
+        # 1 token per 10ms, starting full with one token
+        bucket = TokenBucket(6000, capacity=1)
+        await bucket.acquire()
+        served = []
+
+        async def take(name, priority):
+            await bucket.acquire(1, priority)
+            served.append(name)
+
+        tasks = [asyncio.ensure_future(take("batch", BATCH))]
+        await settle()
+        tasks.append(asyncio.ensure_future(take("interactive", INTERACTIVE)))
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        return served
+
+    assert asyncio.run(scenario()) == ["interactive", "batch"]
+
+
+def test_full_bucket_queue_displaces_lower_priority():
+    async def scenario():
+        bucket = TokenBucket(60, capacity=1, max_queue=1)
+        await bucket.acquire()
+        batch = asyncio.ensure_future(bucket.acquire(1, BATCH))
+        await settle()
+        interactive = asyncio.ensure_future(bucket.acquire(1, INTERACTIVE))
+        await settle()
+        with pytest.raises(QueueFullError):
+            await batch
+        # Nothing of lower priority is left to displace
+        with pytest.raises(QueueFullError):
+            await bucket.acquire(1, INTERACTIVE)
+        interactive.cancel()
+        return bucket
+
+    bucket = asyncio.run(scenario())
+    assert bucket.rejected == 2
+    assert bucket.queued == 0
+
+
+def test_refund_wakes_the_first_waiter():
+    async def scenario():
+        bucket = TokenBucket(60, capacity=10)
+        await bucket.acquire(10)
+        waiter = asyncio.ensure_future(bucket.acquire(5))
+        await settle()
+        bucket.refund(5)
+        await asyncio.wait_for(waiter, 0.5)
+
+    asyncio.run(scenario())
+
+
+def test_gate_hands_slots_over_by_priority():
+    async def scenario():
+        gate = PriorityGate(1)
+        await gate.acquire()
+        served = []
+
+        async def hold(name, priority):
+            async with gate.slot(priority):
+                served.append(name)
+
+        tasks = [asyncio.ensure_future(hold("batch", BATCH))]
+        await settle()
+        tasks.append(asyncio.ensure_future(hold("interactive", INTERACTIVE)))
+        await settle()
+        assert gate.queued == 2
+        gate.release()
+        await asyncio.gather(*tasks)
+        return gate, served
+
+    gate, served = asyncio.run(scenario())
+    assert served == ["interactive", "batch"]
+    assert (gate.active, gate.queued) == (0, 0)
+
+
+def test_cancelled_gate_waiter_does_not_leak_a_slot():
+    async def scenario():
+        gate = PriorityGate(1)
+        await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await settle()
+        waiter.cancel()
+        await settle()
+        gate.release()
+        return gate
+
+    gate = asyncio.run(scenario())
+    assert (gate.active, gate.queued) == (0, 0)
+
+
+def test_full_gate_queue_rejects_equal_priority():
+    async def scenario():
+        gate = PriorityGate(1, max_queue=1)
+        await gate.acquire()
+        queued = asyncio.ensure_future(gate.acquire())
+        await settle()
+        with pytest.raises(QueueFullError):
+            await gate.acquire()
+        queued.cancel()
+        return gate
+
+    assert asyncio.run(scenario()).rejected == 1
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.rejected == 2
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.before_call()
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def make_backend(handler, **kwargs):
+    backend = OpenAICompatibleBackend("mock", "http://llm.test/v1", "model", **kwargs)
+    backend._client = httpx.AsyncClient(base_url=backend.api_base, transport=httpx.MockTransport(handler))
+    return backend
+
+
+def test_server_errors_trip_the_breaker():
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        return httpx.Response(500, json={"error": "down"})
+
+    async def scenario():
+        backend = make_backend(handler, max_retries=0, breaker_failures=2)
+        for _ in range(2):
+            with pytest.raises(LLMProviderError):
+                await backend.chat_completion({"messages": []})
+        with pytest.raises(CircuitOpenError):
+            await backend.chat_completion({"messages": []})
+        return backend
+
+    backend = asyncio.run(scenario())
+    assert backend.breaker.state == CircuitBreaker.OPEN
+    assert len(requests) == 2
+
+
+def test_rate_limited_calls_do_not_trip_the_breaker():
+    async def handler(request):
+        return httpx.Response(429, json={"error": "slow down"})
+
+    async def scenario():
+        backend = make_backend(handler, max_retries=0, breaker_failures=1)
+        for _ in range(3):
+            with pytest.raises(LLMProviderError):
+                await backend.chat_completion({"messages": []})
+        return backend
+
+    assert asyncio.run(scenario()).breaker.state == CircuitBreaker.CLOSED
+
+
+def test_queue_timeouts_are_not_provider_failures():
+    async def handler(request):
+        await asyncio.sleep(0.15)
+        return httpx.Response(200, json=COMPLETION)
+
+    async def scenario():
+        backend = make_backend(handler, timeout=0.2, max_concurrency=1, max_retries=3, breaker_failures=1)
+        calls = [asyncio.ensure_future(backend.chat_completion({"messages": []})) for _ in range(3)]
+        # Each call gets the full timeout for the provider once it has its slot, but the
+        # third waits 0.3s for one: local throttling, raised at once without retries
+        return backend, await asyncio.gather(*calls, return_exceptions=True)
+
+    backend, results = asyncio.run(scenario())
+    assert results[:2] == ["ok", "ok"]
+    assert isinstance(results[2], QueueTimeoutError)
+    assert backend.breaker.state == CircuitBreaker.CLOSED
+    assert backend.retries == 0
@@ -0,0 +1,82 @@
+"""
+Cursor pagination over GET /api/products sort orders
+
+Usage:
+    python -m pytest tests/test_product_query.py
+"""
+
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.catalog_index import CatalogIndex
+from services.product_query import ProductQuery
+
+
+def make_query(products):
+    return ProductQuery(CatalogIndex(products))
+
+
+def collect_pages(query, **kwargs):
+    ids = []
+    cursor = None
+    while True:
+        page = query.page(cursor=cursor, **kwargs)
+        ids += [query.products[row]['id'] for row in page.rows]
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_duplicate_names_are_paged_by_id(descending, limit):
+    products = [
+        {"id": "p3", "name": "A", "price": 10},
+        {"id": "p1", "name": "A", "price": 10},
+        {"id": "p0", "name": "B", "price": 5},
+        {"id": "p2", "name": "A", "price": 10},
+    ]
+    expected = ["p1", "p2", "p3", "p0"]
+    ids = collect_pages(make_query(products), sort="name", descending=descending, limit=limit)
+    assert ids == (expected[::-1] if descending else expected)
+
+
+@pytest.mark.parametrize("sort", ["id", "name", "price"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_cover_every_product_once(sort, descending):
+    products = [
+        {"id": f"p{i:03d}", "name": f"Product {i % 7}", "price": float(i % 5), "category": "Home" if i % 2 else "Toys"}
+        for i in range(60)
+    ]
+    query = make_query(products)
+    assert sorted(collect_pages(query, sort=sort, descending=descending, limit=7)) == [p["id"] for p in products]
+    home = sorted(p["id"] for p in products if p["category"] == "Home")
+    assert sorted(collect_pages(query, sort=sort, descending=descending, limit=4, categories=["Home"])) == home
+
+
+@pytest.mark.parametrize("native_popcount", [True, False])
+def test_facet_counts_match_selected_rows(monkeypatch, native_popcount):
+    if not native_popcount:
+        monkeypatch.delattr(np, "bitwise_count", raising=False)
+    products = [
+        {"id": f"p{i:03d}", "name": f"Product {i}", "price": float(i), "category": f"C{i % 3}",
+         "brand": f"B{i % 5}", "tags": [f"t{i % 4}", f"t{i % 6}"]}
+        for i in range(150)
+    ]
+    query = make_query(products)
+    mask = np.array([i % 2 == 0 for i in range(150)])
+    for field in ("category", "brand", "tags"):
+        for selected in (None, mask):
+            expected = Counter()
+            for i, product in enumerate(products):
+                if selected is None or selected[i]:
+                    values = set(product[field]) if field == "tags" else [product[field]]
+                    expected.update(values)
+            counts = {facet["value"]: facet["count"] for facet in query.facet_counts(field, selected, limit=50)}
+            assert counts == dict(expected)
@@ -0,0 +1,244 @@
+"""
+Recommendation pipeline: stage order, budgets, skip reasons and LLM stage fallbacks
+
+Usage:
+    python -m pytest tests/test_recommendation_pipeline.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.recommendation_pipeline import LLM_AUTO, LLM_ALWAYS, LLMRerank, RecommendationPipeline, Stage
+from services.response_parser import ParseStats
+
+
+class Record(Stage):
+    """Local stage appending its name to context.signals['ran'], optionally slow"""
+
+    def __init__(self, name, optional=False, delay=0, enabled=True):
+        self.name = name
+        self.optional = optional
+        self.delay = delay
+        self.is_enabled = enabled
+
+    def enabled(self, context):
+        return self.is_enabled
+
+    def run(self, context):
+        time.sleep(self.delay)
+        context.signals.setdefault('ran', []).append(self.name)
+
+
+class Answer(Stage):
+    """Local stage setting the result, standing in for the local explainer"""
+
+    name = 'explain'
+
+    def run(self, context):
+        context.result = {"recommendations": [{"product_id": "local"}], "source": "local"}
+
+
+class Slow(Stage):
+    """Async stage that answers after `delay` seconds"""
+
+    name = 'llm'
+
+    def __init__(self, delay, budget, optional):
+        self.delay = delay
+        self.budget = budget
+        self.optional = optional
+
+    async def run(self, context):
+        await asyncio.sleep(self.delay)
+        context.result = {"recommendations": [{"product_id": "llm"}], "source": "llm"}
+
+
+def run(pipeline, context=None):
+    context = context or pipeline.context({}, [], [])
+    return asyncio.run(pipeline.run(context))
+
+
+def test_stages_run_in_order_until_a_result():
+    pipeline = RecommendationPipeline([Record('a'), Record('off', enabled=False), Record('b'), Answer(), Record('c')])
+    context = run(pipeline)
+    assert context.signals['ran'] == ['a', 'b']
+    assert context.result["source"] == "local"
+    assert set(context.timings) == {'a', 'b', 'explain'}
+    assert context.skipped == {}
+
+
+def test_optional_local_stages_are_skipped_once_the_budget_is_spent():
+    pipeline = RecommendationPipeline(
+        [Record('slow', delay=0.02), Record('optional', optional=True), Record('required'), Answer()],
+        budget=0.01
+    )
+    context = run(pipeline)
+    assert context.signals['ran'] == ['slow', 'required']
+    assert context.skipped == {'optional': 'budget'}
+    stats = pipeline.stats.to_dict()
+    assert stats['optional']['skipped'] == {'budget': 1}
+    assert stats['slow']['runs'] == 1
+
+
+def test_optional_async_stage_over_budget_falls_back():
+    pipeline = RecommendationPipeline([Record('rank'), Slow(delay=1, budget=0.02, optional=True), Answer()])
+    context = run(pipeline)
+    assert context.result["source"] == "local"
+    assert context.skipped == {'llm': 'timeout'}
+    assert not context.cacheable
+
+
+def test_required_async_stage_over_budget_fails():
+    pipeline = RecommendationPipeline([Slow(delay=1, budget=0.02, optional=False), Answer()])
+    with pytest.raises(Exception, match="exceeded its 0.02s budget"):
+        run(pipeline)
+
+
+def test_async_stage_within_budget_answers():
+    pipeline = RecommendationPipeline([Slow(delay=0, budget=1, optional=True), Answer()])
+    context = run(pipeline)
+    assert context.result["source"] == "llm"
+    assert context.cacheable
+    assert 'explain' not in context.timings
+
+
+class FakeService:
+    """Just enough of LLMService for LLMRerank"""
+
+    def __init__(self, response=None, error=None, chunks=None, delay=0):
+        self.response = response
+        self.error = error
+        self.chunks = chunks or []
+        self.delay = delay
+        self.parse_stats = ParseStats()
+        self.calls = 0
+
+    def _build_prompt(self, user_preferences, browsed_products, relevant_products):
+        return "prompt"
+
+    def _build_messages(self, prompt):
+        return [{"role": "user", "content": prompt}]
+
+    async def _chat_completion(self, messages, priority=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.response
+
+    async def _chat_completion_stream(self, messages, priority=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        for chunk in self.chunks:
+            yield chunk
+        if self.error:
+            raise self.error
+
+    def _product_getter(self, all_products):
+        return {p['id']: p for p in all_products}.get
+
+    def _enrich_recommendation(self, rec, get_product):
+        return {"product": get_product(rec["product_id"]), "explanation": rec["explanation"]}
+
+    def _parse_recommendation_response(self, content, all_products):
+        return {"recommendations": [{"product_id": pid} for pid in content.split()], "count": len(content.split())}
+
+
+class Shortlist(Stage):
+    """Sets the ranked shortlist from (id, score) pairs"""
+
+    name = 'rank'
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def run(self, context):
+        context.ranked = [({"id": product_id}, score) for product_id, score in self.scores]
+
+
+PRODUCTS = [{"id": f"p{i}"} for i in range(4)]
+
+
+def rerank_pipeline(service, scores, mode=LLM_AUTO, margin=0, budget=0):
+    return RecommendationPipeline([
+        Shortlist(scores),
+        LLMRerank(service, mode=mode, count=2, margin=margin, budget=budget),
+        Answer()
+    ])
+
+
+def run_rerank(pipeline):
+    return run(pipeline, pipeline.context({}, [], PRODUCTS))
+
+
+@pytest.mark.parametrize("scores, margin, reason", [
+    ([("p0", 3), ("p1", 2)], 0, 'no_choice'),
+    ([("p0", 9), ("p1", 8), ("p2", 1)], 5, 'decisive'),
+])
+def test_auto_mode_skips_the_llm_when_it_cannot_help(scores, margin, reason):
+    service = FakeService(response="p2")
+    context = run_rerank(rerank_pipeline(service, scores, margin=margin))
+    assert context.skipped == {'llm': reason}
+    assert context.result["source"] == "local"
+    assert service.calls == 0
+
+
+def test_auto_mode_asks_the_llm_when_the_ranking_is_close():
+    service = FakeService(response="p2 p0")
+    context = run_rerank(rerank_pipeline(service, [("p0", 9), ("p1", 8), ("p2", 7)], margin=5))
+    assert [rec["product_id"] for rec in context.result["recommendations"]] == ["p2", "p0"]
+
+
+@pytest.mark.parametrize("service", [FakeService(error=RuntimeError("down")), FakeService(response="")])
+def test_auto_mode_falls_back_on_failed_or_empty_answers(service):
+    context = run_rerank(rerank_pipeline(service, [("p0", 3), ("p1", 2), ("p2", 1)]))
+    assert context.result["source"] == "local"
+    assert not context.cacheable
+
+
+def test_always_mode_raises_llm_failures():
+    pipeline = rerank_pipeline(FakeService(error=RuntimeError("down")), [("p0", 3)], mode=LLM_ALWAYS)
+    with pytest.raises(RuntimeError):
+        run_rerank(pipeline)
+
+
+def stream_rerank(pipeline, deadline=0):
+    async def scenario():
+        context = pipeline.context({}, [], PRODUCTS)
+        stage = await pipeline.advance(context)
+        streamed = [rec async for rec in pipeline.stream(stage, context, deadline)]
+        if context.result is None:
+            await pipeline.run(context)
+        return streamed, context
+
+    return asyncio.run(scenario())
+
+
+CHUNKS = ['[{"product_id": "p2", "explanation": "x"}', ', {"product_id": "p0", "expla', 'nation": "y"}]']
+
+
+def test_stream_yields_recommendations_and_sets_the_result():
+    service = FakeService(chunks=CHUNKS)
+    streamed, context = stream_rerank(rerank_pipeline(service, [("p0", 3), ("p1", 2), ("p2", 1)]))
+    assert [rec["product"]["id"] for rec in streamed] == ["p2", "p0"]
+    assert context.result["recommendations"] == streamed
+    assert service.parse_stats.recommendations == 2
+
+
+def test_stream_deadline_before_the_first_recommendation_falls_back():
+    service = FakeService(chunks=CHUNKS, delay=1)
+    streamed, context = stream_rerank(rerank_pipeline(service, [("p0", 3), ("p1", 2), ("p2", 1)]), deadline=0.02)
+    assert streamed == []
+    assert context.skipped == {'llm': 'timeout'}
+    assert context.result["source"] == "local"
+
+
+def test_stream_failure_after_a_recommendation_is_raised():
+    service = FakeService(chunks=CHUNKS[:1] + ['}'], error=RuntimeError("cut"))
+    with pytest.raises(RuntimeError):
+        stream_rerank(rerank_pipeline(service, [("p0", 3), ("p1", 2), ("p2", 1)]))
@@ -0,0 +1,82 @@
+"""
+Parsing LLM recommendation output: fences, trailing commas, wrappers and truncation
+
+Usage:
+    python -m pytest tests/test_response_parser.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.response_parser import StreamingRecommendationParser, parse_recommendations
+
+RESPONSE = """Here are my picks:
+```json
+[
+  {"product_id": "p1", "explanation": "Matches {your} \\"taste\\", [really]", "score": 9},
+  {"product_id": "p2", "explanation": "Good value", "score": 7,},
+]
+```
+Enjoy!"""
+
+
+def ids(parsed):
+    return [rec["product_id"] for rec in parsed]
+
+
+def test_prose_fences_and_trailing_commas():
+    parsed, stats = parse_recommendations(RESPONSE)
+    assert ids(parsed) == ["p1", "p2"]
+    assert parsed[0]["explanation"] == 'Matches {your} "taste", [really]'
+    assert parsed[0]["score"] == 9
+    assert stats.trailing_commas == 1
+    assert stats.truncated == 0
+
+
+def test_wrapper_object_and_alternative_keys():
+    parsed, _ = parse_recommendations('{"recommendations": [{"productId": "p1", "reason": "Fits", "confidence": 8}]}')
+    assert parsed == [{"product_id": "p1", "explanation": "Fits", "score": 8}]
+
+
+def test_unknown_and_duplicate_ids_are_dropped():
+    text = '[{"product_id": "p1"}, {"product_id": "nope"}, {"product_id": "p1"}, {"explanation": "no id"}]'
+    parsed, stats = parse_recommendations(text, is_known=lambda product_id: product_id.startswith("p"))
+    assert ids(parsed) == ["p1"]
+    assert stats.unknown_ids == 1
+    assert stats.duplicates == 1
+    assert stats.missing_id == 1
+
+
+def test_truncated_final_object_is_salvaged():
+    text = '[{"product_id": "p1", "explanation": "Complete", "score": 9}, {"product_id": "p2", "explanation": "Cut off mid'
+    parsed, stats = parse_recommendations(text)
+    assert ids(parsed) == ["p1", "p2"]
+    assert parsed[1]["explanation"].startswith("Cut off")
+    assert stats.salvaged == 1
+
+
+def test_truncation_before_the_id_salvages_nothing():
+    parsed, _ = parse_recommendations('[{"product_id": "p1", "score": 9}, {"expla')
+    assert ids(parsed) == ["p1"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 17])
+def test_streamed_chunks_parse_like_the_whole_response(chunk_size):
+    parser = StreamingRecommendationParser()
+    streamed = []
+    for start in range(0, len(RESPONSE), chunk_size):
+        streamed += parser.feed(RESPONSE[start:start + chunk_size])
+    streamed += parser.finish()
+    assert streamed == parse_recommendations(RESPONSE)[0]
+
+
+def test_stream_yields_each_object_once_it_closes():
+    parser = StreamingRecommendationParser()
+    assert parser.feed('[{"product_id": "p1", "score": 9}') == [{"product_id": "p1", "explanation": "", "score": 9}]
+    assert parser.feed(', {"product_id": "p2"') == []
+    assert ids(parser.feed('}]')) == ["p2"]
+    assert parser.finish() == []
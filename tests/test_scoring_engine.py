@@ -0,0 +1,103 @@
+"""
+ScoringEngine parity with the original per-product scoring loop
+
+Usage:
+    python -m pytest tests/test_scoring_engine.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_scoring import legacy_top_products
+from services.scoring_engine import ScoringEngine
+from synthetic_catalog import generate_catalog
+
+
+def legacy_score(product, criteria):
+    """Score of one product under the original loop, 0 for excluded products"""
+    if product['id'] in criteria["exclude_ids"]:
+        return 0
+    score = 0
+    if product['category'] in criteria["relevant_categories"]:
+        score += 3
+    if product['brand'] in criteria["relevant_brands"]:
+        score += 2
+    if criteria["min_price"] <= product['price'] <= criteria["max_price"]:
+        score += 2
+    if 'tags' in product:
+        score += len(set(product['tags']) & criteria["relevant_tags"])
+    return score
+
+
+def make_criteria(products, seed):
+    rng = np.random.default_rng(seed)
+    browsed = [products[row] for row in rng.choice(len(products), 3, replace=False)]
+    return {
+        "relevant_categories": {p["category"] for p in browsed[:2]},
+        "relevant_brands": {browsed[2]["brand"], "Unknown Brand"},
+        "relevant_tags": {tag for p in browsed for tag in p["tags"]},
+        "min_price": float(rng.integers(0, 100)),
+        "max_price": float(rng.integers(100, 400)),
+        "exclude_ids": {p["id"] for p in browsed},
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_scores_match_the_legacy_loop(seed):
+    products = generate_catalog(500, seed=seed)
+    criteria = make_criteria(products, seed)
+    scores = ScoringEngine(products).score(**criteria)
+    assert scores.tolist() == [legacy_score(p, criteria) for p in products]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("k", [1, 20, 1000])
+def test_top_products_match_the_legacy_sort(seed, k):
+    products = generate_catalog(500, seed=seed)
+    criteria = make_criteria(products, seed)
+    engine_ids = [p["id"] for p, _ in ScoringEngine(products).top_products(k, **criteria)]
+    assert engine_ids == [p["id"] for p in legacy_top_products(products, criteria, k)]
+
+
+def test_empty_criteria_score_only_the_price_range():
+    products = generate_catalog(50)
+    scores = ScoringEngine(products).score(min_price=0, max_price=100)
+    assert scores.tolist() == [2.0 if p["price"] <= 100 else 0.0 for p in products]
+
+
+def test_duplicate_tags_count_once():
+    products = [{"id": "p1", "category": "Home", "brand": "A", "price": 10, "tags": ["eco", "eco", "gift"]}]
+    scores = ScoringEngine(products).score(relevant_tags={"eco"}, min_price=100, max_price=200)
+    assert scores.tolist() == [1.0]
+
+
+def test_incremental_update_matches_a_rebuild():
+    products = generate_catalog(200)
+    engine = ScoringEngine(products)
+    changed = [
+        dict(products[3], category="Garden", brand="New Brand", tags=["new-tag", "gift"], price=5.0),
+        dict(products[7], brand=None, tags=[]),
+    ]
+    added = [dict(products[0], id="added-1", category="Garden", brand="Other Brand", tags=["new-tag"])]
+    updated_products = list(products)
+    updated_products[3], updated_products[7] = changed
+    updated_products += added
+
+    updated = engine.updated(updated_products, [p["id"] for p in changed + added])
+    rebuilt = ScoringEngine(updated_products)
+    criteria = {
+        "relevant_categories": {"Garden", "Electronics"},
+        "relevant_brands": {"New Brand", "Other Brand", products[10]["brand"]},
+        "relevant_tags": {"new-tag", "gift", "wireless"},
+        "min_price": 0,
+        "max_price": 50,
+        "exclude_ids": {products[1]["id"]},
+    }
+    assert updated.score(**criteria).tolist() == rebuilt.score(**criteria).tolist()
+    assert updated.row_by_id["added-1"] == len(products)
@@ -0,0 +1,111 @@
+"""
+Session stores: bounded history, add_view, least recently used eviction and pruning
+
+Usage:
+    python -m pytest tests/test_session_store.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services import session_store
+from services.session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    stores = []
+
+    def make(max_users=100, max_history=50):
+        if request.param == "memory":
+            store = InMemorySessionStore(max_users, max_history)
+        else:
+            store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), max_users, max_history)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        if store.executor is not None:
+            store.executor.shutdown()
+
+
+def test_history_is_bounded_and_deduplicated(make_store):
+    store = make_store(max_history=3)
+    for product_id in ["a", "b", "a", "c", "d"]:
+        store.add_to_browsing_history("u1", product_id)
+    assert store.get_browsing_history("u1") == ["b", "c", "d"]
+    store.clear_browsing_history("u1")
+    assert store.get_browsing_history("u1") == []
+
+
+def test_add_view_returns_the_history_it_extends(make_store):
+    store = make_store(max_history=2)
+    assert store.add_view("u1", "a") == []
+    assert store.add_view("u1", "b") == ["a"]
+    assert store.add_view("u1", "b") is None
+    assert store.add_view("u1", "c") == ["a", "b"]
+    assert store.get_browsing_history("u1") == ["b", "c"]
+
+
+def test_preferences_round_trip(make_store):
+    store = make_store()
+    assert store.get_preferences("u1") == {}
+    store.set_preferences("u1", {"categories": ["Home"], "priceRange": "0-50"})
+    assert store.get_preferences("u1") == {"categories": ["Home"], "priceRange": "0-50"}
+
+
+def test_in_memory_store_evicts_least_recently_used():
+    store = InMemorySessionStore(max_users=2)
+    store.set_preferences("u1", {"a": 1})
+    store.set_preferences("u2", {"b": 2})
+    # Touching u1 makes u2 the least recently used
+    store.get_preferences("u1")
+    store.set_preferences("u3", {"c": 3})
+    assert store.get_preferences("u1") == {"a": 1}
+    assert store.get_preferences("u2") == {}
+
+
+def test_sqlite_store_prunes_least_recently_seen(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store, "PRUNE_EVERY", 1000000)
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr(session_store.time, "time", lambda: next(clock))
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), max_users=2)
+    for user_id in ["u1", "u2", "u3"]:
+        store.set_preferences(user_id, {"user": user_id})
+        store.add_to_browsing_history(user_id, "p1")
+    store.get_browsing_history("u1")
+
+    assert store.prune() == 1
+    assert store.prune() == 0
+    assert store.get_preferences("u2") == {}
+    assert store.get_browsing_history("u2") == []
+    assert store.get_preferences("u1") == {"user": "u1"}
+    assert store.get_browsing_history("u3") == ["p1"]
+    store.executor.shutdown()
+
+
+def test_sqlite_store_prunes_every_few_accesses(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store, "PRUNE_EVERY", 4)
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), max_users=1)
+    for user_id in ["u1", "u2", "u3", "u4"]:
+        store.add_to_browsing_history(user_id, "p1")
+    count = store._conn.execute("SELECT COUNT(*) FROM user_sessions").fetchone()[0]
+    assert count == 1
+    store.executor.shutdown()
+
+
+def test_sqlite_store_persists_across_instances(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    first = SQLiteSessionStore(path)
+    first.set_preferences("u1", {"brands": ["Acme"]})
+    first.add_view("u1", "p1")
+    second = SQLiteSessionStore(path)
+    assert second.get_preferences("u1") == {"brands": ["Acme"]}
+    assert second.add_view("u1", "p2") == ["p1"]
+    first.executor.shutdown()
+    second.executor.shutdown()
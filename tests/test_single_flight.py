@@ -0,0 +1,152 @@
+"""
+Coalescing concurrent calls with SingleFlight: sharing, waiter counting and cancellation
+
+Usage:
+    python -m pytest tests/test_single_flight.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.single_flight import SingleFlight
+
+
+class Call:
+    """
+    Factory for a call that blocks until released, counting how often it starts
+    """
+
+    def __init__(self, result="result"):
+        self.result = result
+        self.started = 0
+        self.cancelled = False
+        self.release = None
+
+    async def run(self):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def __call__(self):
+        if self.release is None:
+            self.release = asyncio.Event()
+        return self.run()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call()
+        callers = [asyncio.ensure_future(flights.do("k", call)) for _ in range(3)]
+        await settle()
+        call.release.set()
+        results = await asyncio.gather(*callers)
+        return flights, call, results
+
+    flights, call, results = asyncio.run(scenario())
+    assert results == ["result"] * 3
+    assert call.started == 1
+    assert flights.stats() == {"calls": 1, "collapsed": 2, "in_flight": 0}
+
+
+def test_exception_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call(ValueError("boom"))
+        callers = [asyncio.ensure_future(flights.do("k", call)) for _ in range(2)]
+        await settle()
+        call.release.set()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["boom", "boom"]
+
+
+def test_finished_call_is_not_reused():
+    async def scenario():
+        flights = SingleFlight()
+        first, second = Call("first"), Call("second")
+        task = asyncio.ensure_future(flights.do("k", first))
+        await settle()
+        first.release.set()
+        await task
+        task = asyncio.ensure_future(flights.do("k", second))
+        await settle()
+        second.release.set()
+        return await task, flights.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == "second"
+    assert stats["calls"] == 2
+
+
+def test_one_cancelled_caller_does_not_cancel_the_call():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call()
+        leaving = asyncio.ensure_future(flights.do("k", call))
+        staying = asyncio.ensure_future(flights.do("k", call))
+        await settle()
+        leaving.cancel()
+        await settle()
+        call.release.set()
+        return call, leaving, await staying
+
+    call, leaving, result = asyncio.run(scenario())
+    assert leaving.cancelled()
+    assert not call.cancelled
+    assert result == "result"
+
+
+def test_call_is_cancelled_with_its_last_caller():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call()
+        callers = [asyncio.ensure_future(flights.do("k", call)) for _ in range(2)]
+        await settle()
+        for caller in callers:
+            caller.cancel()
+        await settle()
+        # A new caller starts a fresh call instead of joining the cancelled one
+        replacement = Call("again")
+        task = asyncio.ensure_future(flights.do("k", replacement))
+        await settle()
+        replacement.release.set()
+        return call, flights, await task
+
+    call, flights, result = asyncio.run(scenario())
+    assert call.cancelled
+    assert result == "again"
+    assert flights.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("keys", [["a", "b"], ["a", "a"]])
+def test_keys_are_coalesced_independently(keys):
+    async def scenario():
+        flights = SingleFlight()
+        calls = {key: Call(key) for key in keys}
+        callers = [asyncio.ensure_future(flights.do(key, calls[key])) for key in keys]
+        await settle()
+        for call in calls.values():
+            call.release.set()
+        return await asyncio.gather(*callers), flights.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == keys
+    assert stats["calls"] == len(set(keys))